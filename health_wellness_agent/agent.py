@@ -1,43 +1,448 @@
-from agents import Agent, handoff
+import asyncio
+import functools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, Optional
 
 # local modules
 from context import UserSessionContext
-from tools.goal_analyzer import analyze_goal
-from tools.meal_planner import plan_meals
-from tools.workout_recommender import recommend_workout
-from tools.scheduler import schedule_checkins
-from tools.tracker import track_progress
-from guardrails import validate_goal_input
+from routing.intent_router import GENERAL, get_router
+from utils import metrics, token_usage
+from utils.cassette import get_cassette, recorded_stream, recorded_turn, replay_stream, replay_turn
+from utils.deadline import PLANNER_DEADLINE_SECONDS, Deadline, DeadlineExceeded, deadline, within
+from utils.degradation import BUDGET_NOTE, degraded_answer, get_load_shedder, partial_answer, plan_state
+from utils.output_scanner import HALTED_MESSAGE, StreamingOutputScanner
+from utils.plan_prefetch import get_prefetcher
+from utils.red_flags import detect_red_flag, escalate_red_flag
 
+if TYPE_CHECKING:
+    from agents import Agent
+
+# ──────────────────────────────────────────────────────────────
+# Lazy agent registry
+#
+# Agents are built on first use through ``get_agent(name)``, so importing
+# this module costs neither the agents SDK (and the OpenAI client behind
+# it) nor the tool and guardrail modules; a direct specialist route builds
+# only that specialist.  ``agent``, ``plan_writer_agent`` and the
+# specialist names still resolve as module attributes (built on access).
+# ──────────────────────────────────────────────────────────────
+_BUILDERS: Dict[str, Callable[[], "Agent"]] = {}
+_agents: Dict[str, "Agent"] = {}
+_agents_lock = threading.RLock()  # builders fetch their handoff targets
+
+
+def register(name: str):
+    """Register a zero-argument builder for the agent called ``name``."""
+    def _register(builder: Callable[[], "Agent"]) -> Callable[[], "Agent"]:
+        _BUILDERS[name] = builder
+        return builder
+    return _register
+
+
+def get_agent(name: str) -> "Agent":
+    """The agent registered as ``name``, built on the first call."""
+    with _agents_lock:
+        built = _agents.get(name)
+        if built is None:
+            start = time.perf_counter()
+            built = _agents[name] = _BUILDERS[name]()
+            metrics.observe("agent_build_seconds", time.perf_counter() - start, agent=name)
+        return built
 
-# specialised handoff agents
-from special_agents.escalation_agent import escalation_agent
-from special_agents.nutrition_expert_agent import nutrition_expert_agent
-from special_agents.injury_support_agent import injury_support_agent
 
 # ──────────────────────────────────────────────────────────────
 # Main health & wellness planner agent
 # ──────────────────────────────────────────────────────────────
-agent = Agent(
-    name="Health Wellness Planner",
-    instructions=(
-        "You are a helpful wellness planner. Collect the user's fitness and "
-        "dietary goals, generate personalised meal & workout plans, track "
-        "progress, and schedule reminders. Delegate to specialist agents when "
-        "necessary (nutrition, injury, escalation)."
-    ),
-    tools=[
-        analyze_goal,
-        plan_meals,
-        recommend_workout,
-        schedule_checkins,
-        track_progress,
-    ],
-    input_guardrails=[validate_goal_input],
-    handoffs=[
-        handoff(escalation_agent),
-        handoff(nutrition_expert_agent),
-        handoff(injury_support_agent),
-    ],
-    # ❌ run_hooks=CustomRunHooks(),  ← is line ko hata dein
-)
\ No newline at end of file
+@register("planner")
+def _build_planner() -> "Agent":
+    from agents import Agent, ModelSettings, handoff
+
+    from guardrails import validate_goal_input, validate_health_output
+    from tools.full_plan import build_full_plan
+    from tools.goal_analyzer import analyze_goal
+    from tools.meal_planner import plan_meals
+    from tools.scheduler import schedule_checkins
+    from tools.tracker import track_progress
+    from tools.workout_recommender import recommend_workout
+
+    return Agent(
+        name="Health Wellness Planner",
+        instructions=(
+            "You are a helpful wellness planner. Collect the user's fitness and "
+            "dietary goals, generate personalised meal & workout plans, track "
+            "progress, and schedule reminders. Delegate to specialist agents when "
+            "necessary (nutrition, injury, escalation). When the user wants a "
+            "complete plan, call build_full_plan once instead of the individual "
+            "tools; otherwise call independent tools together in the same turn."
+        ),
+        tools=[
+            analyze_goal,
+            plan_meals,
+            recommend_workout,
+            schedule_checkins,
+            track_progress,
+            build_full_plan,
+        ],
+        # independent tool calls of one turn are executed concurrently by the runner
+        model_settings=ModelSettings(parallel_tool_calls=True),
+        input_guardrails=[validate_goal_input],
+        output_guardrails=[validate_health_output],
+        handoffs=[
+            handoff(get_agent("escalation")),
+            handoff(get_agent("nutrition")),
+            handoff(get_agent("injury")),
+        ],
+        # ❌ run_hooks=CustomRunHooks(),  ← is line ko hata dein
+    )
+
+
+# specialised handoff agents (defined in special_agents/)
+@register("escalation")
+def _build_escalation() -> "Agent":
+    from special_agents.escalation_agent import escalation_agent
+    return escalation_agent
+
+
+@register("nutrition")
+def _build_nutrition() -> "Agent":
+    from special_agents.nutrition_expert_agent import nutrition_expert_agent
+    return nutrition_expert_agent
+
+
+@register("injury")
+def _build_injury() -> "Agent":
+    from special_agents.injury_support_agent import injury_support_agent
+    return injury_support_agent
+
+
+# ──────────────────────────────────────────────────────────────
+# Plan narrative written ahead of time by the prefetcher (HEALTH_PREFETCH=1)
+# ──────────────────────────────────────────────────────────────
+@register("plan_writer")
+def _build_plan_writer() -> "Agent":
+    from agents import Agent
+
+    return Agent(
+        name="Plan Writer",
+        instructions=(
+            "Write a short, encouraging overview (under 150 words) of the user's "
+            "goal, weekly meal plan and workout plan given in the input."
+        ),
+    )
+
+
+async def _write_plan_narrative(context: UserSessionContext) -> str:
+    from agents import Runner
+
+    summary = (
+        f"Goal: {context.goal}\nDiet: {context.diet_preferences or 'balanced'}\n"
+        f"Meals: {context.meal_plan}\nWorkouts: {(context.workout_plan or {}).get('schedule')}"
+    )
+    # charged to the scope of the turn that scheduled it (its caller's session and user)
+    result = await Runner.run(get_agent("plan_writer"), summary, context=context)
+    token_usage.record_run(result, kind="agent:plan_writer")
+    return str(result.final_output)
+
+
+get_prefetcher().narrative_writer = _write_plan_narrative
+
+
+_ATTRIBUTES = {
+    "agent": "planner",
+    "plan_writer_agent": "plan_writer",
+    "escalation_agent": "escalation",
+    "nutrition_expert_agent": "nutrition",
+    "injury_support_agent": "injury",
+}
+
+
+def __getattr__(name: str):
+    if name in _ATTRIBUTES:
+        return get_agent(_ATTRIBUTES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ──────────────────────────────────────────────────────────────
+# Entry point: local intent routing in front of the planner agent
+# ──────────────────────────────────────────────────────────────
+# intent -> registered agent
+SPECIALISTS = {
+    "injury": "injury",
+    "nutrition": "nutrition",
+    "escalation": "escalation",
+}
+
+
+def _intent_of(agent_name: str) -> str:
+    for intent, registered in SPECIALISTS.items():
+        if get_agent(registered).name == agent_name:
+            return intent
+    return GENERAL
+
+
+@functools.lru_cache(maxsize=None)
+def _turn_hooks_class():
+    from agents import RunHooks
+
+    class _TurnHooks(RunHooks):
+        """Times the planner's handoff decision and marks the turn's deadline stages.
+
+        Each agent, model call and tool call of the run is a stage
+        (``agent:<name>``, ``llm:<name>``, ``tool:<name>``), so a blown
+        deadline is blamed on the step that was running.  Each model call's
+        tokens are charged as ``agent:<name>`` (utils/token_usage.py).
+        """
+
+        def __init__(self, turn: Optional[Deadline] = None):
+            self.started = time.perf_counter()
+            self.handoff_seconds = None
+            self.turn = turn
+            self.agent = None  # the agent currently running
+
+        def _enter(self, stage: str) -> None:
+            if self.turn is not None:
+                self.turn.enter(stage)
+
+        def _leave(self, stage: str) -> None:
+            if self.turn is not None:
+                self.turn.leave(stage)
+
+        async def on_agent_start(self, context, agent):
+            if self.agent is not None:
+                self._leave(f"agent:{self.agent.name}")
+            self.agent = agent
+            self._enter(f"agent:{agent.name}")
+
+        async def on_agent_end(self, context, agent, output):
+            self._leave(f"agent:{agent.name}")
+            self.agent = None
+
+        async def on_handoff(self, context, from_agent, to_agent):
+            if self.handoff_seconds is None:
+                self.handoff_seconds = time.perf_counter() - self.started
+
+        async def on_llm_start(self, context, agent, system_prompt, input_items):
+            self._enter(f"llm:{agent.name}")
+
+        async def on_llm_end(self, context, agent, response):
+            self._leave(f"llm:{agent.name}")
+            tokens = token_usage.usage_of(response)
+            if tokens is not None:
+                token_usage.record(tokens, model=str(agent.model or "agents"), kind=f"agent:{agent.name}")
+
+        async def on_tool_start(self, context, agent, tool):
+            self._enter(f"tool:{tool.name}")
+
+        async def on_tool_end(self, context, agent, tool, result):
+            self._leave(f"tool:{tool.name}")
+
+    return _TurnHooks
+
+
+@dataclass
+class EmergencyResult:
+    """Stands in for a RunResult when a red flag short-circuits the turn."""
+    final_output: str
+    last_agent: "Agent" = field(default_factory=lambda: get_agent("escalation"))
+
+
+@dataclass
+class PartialResult:
+    """Stands in for a RunResult when the turn deadline ran out; ``stage`` blew the budget."""
+    final_output: str
+    last_agent: "Agent"
+    stage: str
+    degraded: bool = True
+
+
+@dataclass
+class HaltedResult:
+    """Stands in for a RunResult when the output scan stopped a streamed answer."""
+    last_agent: "Agent"
+    final_output: str = HALTED_MESSAGE
+    halted: bool = True
+
+
+@dataclass
+class DegradedResult:
+    """Stands in for a RunResult when overload sends the turn to the local plan builders."""
+    final_output: str
+    last_agent: "Agent" = field(default_factory=lambda: get_agent("planner"))
+    degraded: bool = True
+
+
+def _start_turn(message: str, context: UserSessionContext, degrade: bool = True):
+    """Red-flag check, load shedding, token budget and local routing shared by both entry points.
+
+    Returns ``(local, target_agent, decision)``; ``local`` is set when the
+    turn is answered without any agent run.
+    """
+    red_flag = detect_red_flag(message)
+    if red_flag:
+        ticket = escalate_red_flag(
+            red_flag,
+            session_id=context.session_id,
+            user_name=context.name,
+            snapshot=context.model_dump(),
+        )
+        context.handoff_logs.append(f"red flag ({red_flag.category}) -> {get_agent('escalation').name}, ticket {ticket.id}")
+        return EmergencyResult(final_output=red_flag.response), None, None
+
+    if degrade and get_load_shedder().should_degrade():
+        context.handoff_logs.append("degraded mode -> local plan builders")
+        return DegradedResult(degraded_answer(message, user=None, context=context, name=context.name)), None, None
+
+    if token_usage.budget_action() == token_usage.REFUSE:
+        context.handoff_logs.append("token budget spent -> local plan builders")
+        return DegradedResult(degraded_answer(message, user=None, context=context, name=context.name,
+                                              note=BUDGET_NOTE)), None, None
+
+    decision = get_router().classify(message)
+
+    if decision.is_direct:
+        specialist = get_agent(SPECIALISTS[decision.intent])
+        context.handoff_logs.append(f"router -> {specialist.name} ({decision.confidence:.2f})")
+        metrics.inc("router_direct_total", intent=decision.intent)
+        # credit the typical planner round trip that was not needed
+        metrics.inc("router_latency_saved_seconds_total", metrics.percentile("planner_handoff_seconds", 50))
+        return None, specialist, decision
+
+    metrics.inc("router_fallback_total")
+    return None, get_agent("planner"), decision
+
+
+def _finish_turn(decision, hooks, result) -> None:
+    if hooks.handoff_seconds is not None:
+        metrics.observe("planner_handoff_seconds", hooks.handoff_seconds)
+
+    # routing accuracy: compare the local guess with where the LLM ended up
+    actual = _intent_of(result.last_agent.name)
+    metrics.inc("router_accuracy_total", outcome="agree" if actual == decision.intent else "disagree")
+
+
+def _partial(message: str, context: UserSessionContext, before: dict, hooks, target, error: DeadlineExceeded):
+    context.handoff_logs.append(f"deadline of {error.budget:g}s exceeded in {error.stage} -> partial answer")
+    return PartialResult(
+        final_output=partial_answer(message, context=context, before=before),
+        last_agent=hooks.agent or target,
+        stage=error.stage,
+    )
+
+
+async def run_planner(message: str, context: UserSessionContext, *, degrade: bool = True,
+                      budget: float = PLANNER_DEADLINE_SECONDS):
+    """Run one user turn, skipping the planner hop for obvious specialist intents.
+
+    With ``degrade`` (interactive callers) the turn is answered locally while
+    the service is overloaded; batch callers pass False and wait instead.
+    Guardrails, agents and tools share a deadline of ``budget`` seconds; a
+    turn that runs out of it is cancelled and answered with a PartialResult.
+    """
+    local, target, decision = _start_turn(message, context, degrade)
+    if local:
+        return local
+    cassette = get_cassette()
+    if cassette is not None:
+        if cassette.replaying:
+            return await replay_turn(message)
+        return await recorded_turn(message, _run_agents(message, context, target, decision, budget))
+    return await _run_agents(message, context, target, decision, budget)
+
+
+def _run_config(decision):
+    """A direct specialist route keeps the planner's input guardrail."""
+    if not decision.is_direct:
+        return None
+    from agents import RunConfig
+
+    from guardrails import validate_goal_input
+    return RunConfig(input_guardrails=[validate_goal_input])
+
+
+async def _run_agents(message: str, context: UserSessionContext, target, decision, budget: float):
+    from agents import Runner
+
+    before = plan_state(context)
+    with deadline(budget) as turn:
+        hooks = _turn_hooks_class()(turn)
+        try:
+            result = await within(
+                Runner.run(target, message, context=context, hooks=hooks, run_config=_run_config(decision))
+            )
+        except DeadlineExceeded as e:
+            return _partial(message, context, before, hooks, target, e)
+    if not decision.is_direct:
+        _finish_turn(decision, hooks, result)
+    return result
+
+
+async def stream_planner(message: str, context: UserSessionContext, *, budget: float = PLANNER_DEADLINE_SECONDS):
+    """Like ``run_planner`` but yields output text deltas as they arrive.
+
+    The last item yielded is the result object (``final_output``/``last_agent``).
+    When the deadline runs out the run is cancelled and the partial answer
+    follows the text streamed so far.  Deltas pass the incremental output
+    scan first, like the chat stream: at the first blocked span the run is
+    cancelled and a ``HaltedResult`` follows instead of the rest.
+    """
+    local, target, decision = _start_turn(message, context)
+    if local:
+        yield local.final_output
+        yield local
+        return
+    cassette = get_cassette()
+    if cassette is None:
+        items = _stream_agents(message, context, target, decision, budget)
+    elif cassette.replaying:
+        items = replay_stream(message)
+    else:
+        items = recorded_stream(message, _stream_agents(message, context, target, decision, budget))
+    scanner = StreamingOutputScanner()
+    try:
+        async for item in items:
+            if not isinstance(item, str):
+                yield HaltedResult(item.last_agent) if scanner.close().halted else item
+                return
+            if scanner.feed(item).halted:
+                break
+            yield item
+    finally:
+        await items.aclose()
+    yield HaltedResult(target)
+
+
+async def _stream_agents(message: str, context: UserSessionContext, target, decision, budget: float):
+    from agents import Runner
+    from openai.types.responses import ResponseTextDeltaEvent
+
+    before = plan_state(context)
+    # the run's task copies the context when it is created, deadline and usage
+    # scope included; the variables are not held across yields of this generator
+    with deadline(budget) as turn:
+        hooks = _turn_hooks_class()(turn)
+        result = Runner.run_streamed(target, message, context=context, hooks=hooks, run_config=_run_config(decision))
+    events = result.stream_events()
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(events.__anext__(), turn.remaining())
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                result.cancel()
+                partial = _partial(message, context, before, hooks, target,
+                                   DeadlineExceeded(turn.expire(), turn.budget))
+                yield "\n\n" + partial.final_output
+                yield partial
+                return
+            if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                yield event.data.delta
+    finally:
+        if not result.is_complete:
+            result.cancel()  # abandoned: halted by the output scan or the client went away
+        await events.aclose()
+    if not decision.is_direct:
+        _finish_turn(decision, hooks, result)
+    yield result
@@ -0,0 +1,427 @@
+import asyncio
+import hashlib
+import hmac
+import io
+import itertools
+import json
+import os
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from context import UserSessionContext
+from knowledge.bm25_index import index_version, open_index
+from utils import metrics, token_usage
+from utils.chat_service import TURN_REPLAY_SECONDS, ChatReply, chat_reply, remember, stream_chat_reply, turn_key
+from utils.degradation import plan_state
+from utils.health import get_health_monitor
+from utils.model_router import get_router
+from utils.single_flight import KeyReused, get_single_flight
+
+load_dotenv()
+
+# ──────────────────────────────────────────────────────────────
+# Headless JSON / Server-Sent Events API
+#
+#   POST /v1/chat            {"user", "message", "session_id"?} -> JSON reply
+#   POST /v1/chat/stream     same body, SSE: "chunk" events then "done"
+#   POST /v1/planner         planner agent turn (tools, handoffs, guardrails)
+#   POST /v1/planner/stream  same, streamed as SSE
+#   GET  /healthz            liveness, with model health and router stats
+#   GET  /readyz             200 once a model provider passed its health
+#                            check, 503 while warming up or down
+#   GET  /metrics
+#   GET  /v1/usage           token usage totals (utils/token_usage.py),
+#                            ?by=day,user (any of day, user, session,
+#                            kind, model) &format=json|csv; admins only
+#
+# Every /v1 request needs ``Authorization: Bearer <key>``.  Keys are
+# configured as HEALTH_API_KEYS="caller:key,..." and callers listed in
+# HEALTH_API_ADMINS may read /v1/usage; with no keys configured every /v1
+# request is refused.  A session belongs to the caller that created it and
+# is refused to anyone else.  ``user`` is the caller's name for its end
+# user: it is shown to the model, and memories and cached answers are kept
+# per caller and user.
+#
+# Identical concurrent JSON requests of a session share one model run; with
+# an ``Idempotency-Key`` header the result is also replayed for retries of
+# the same body; reusing a key for a different body is a 422.
+#
+# Same chat service, agents, tools and UserSessionContext as the Streamlit
+# app, but one event loop serves every client and nothing is re-executed per
+# interaction.  Run with:  python api.py  (HEALTH_API_HOST / HEALTH_API_PORT)
+# ──────────────────────────────────────────────────────────────
+
+HOST = os.getenv("HEALTH_API_HOST", "127.0.0.1")
+PORT = int(os.getenv("HEALTH_API_PORT", "8080"))
+MAX_SESSIONS = int(os.getenv("HEALTH_API_MAX_SESSIONS", "10000"))
+MAX_MESSAGE_CHARS = 4000
+HISTORY_TURNS = 10
+STREAM_ERROR = "temporarily unavailable, please retry"
+
+
+def _api_keys(spec: str) -> dict:
+    """``{key: caller}`` from ``"caller:key,caller:key"``."""
+    keys = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        caller, _, key = item.partition(":")
+        if caller and key:
+            keys[key] = caller
+    return keys
+
+
+@dataclass
+class ApiSession:
+    id: str
+    owner: str                       # the authenticated caller
+    context: UserSessionContext
+    history: list = field(default_factory=list)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class SessionStore:
+    """In-memory sessions, least recently used evicted beyond ``max_sessions``."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ApiSession]" = OrderedDict()
+        self._uids = itertools.count(1)
+
+    def get(self, session_id: Optional[str], user: str, owner: str) -> ApiSession:
+        session = self._sessions.get(session_id) if session_id else None
+        if session is not None and session.owner != owner:
+            raise Forbidden("session_id belongs to another caller")
+        if session is None:
+            session_id = session_id or uuid.uuid4().hex
+            session = ApiSession(session_id, owner, UserSessionContext(
+                name=user, uid=next(self._uids), session_id=session_id, user_id=f"{owner}:{user}"
+            ))
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        metrics.set_gauge("api_sessions", len(self._sessions))
+        return session
+
+
+class BadRequest(web.HTTPBadRequest):
+    def __init__(self, reason: str):
+        super().__init__(text=json.dumps({"error": reason}), content_type="application/json")
+
+
+class Unauthorized(web.HTTPUnauthorized):
+    def __init__(self, reason: str):
+        super().__init__(text=json.dumps({"error": reason}), content_type="application/json",
+                         headers={"WWW-Authenticate": "Bearer"})
+
+
+class Forbidden(web.HTTPForbidden):
+    def __init__(self, reason: str):
+        super().__init__(text=json.dumps({"error": reason}), content_type="application/json")
+
+
+class Unprocessable(web.HTTPUnprocessableEntity):
+    def __init__(self, reason: str):
+        super().__init__(text=json.dumps({"error": reason}), content_type="application/json")
+
+
+def _caller(request: web.Request) -> Optional[str]:
+    scheme, _, key = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not key:
+        return None
+    caller = None
+    for known, name in request.app["api_keys"].items():
+        if hmac.compare_digest(known.encode("utf-8"), key.strip().encode("utf-8")):
+            caller = name
+    return caller
+
+
+@web.middleware
+async def _auth(request: web.Request, handler):
+    if request.path.startswith("/v1/"):
+        caller = _caller(request)
+        if caller is None:
+            metrics.inc("api_unauthorized_total", route=request.path)
+            raise Unauthorized("a valid API key is required")
+        if request.path == "/v1/usage" and caller not in request.app["api_admins"]:
+            raise Forbidden("admin only")
+        request["caller"] = caller
+    return await handler(request)
+
+
+async def _read_turn(request: web.Request):
+    try:
+        body = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequest("body must be JSON")
+    if not isinstance(body, dict):
+        raise BadRequest("body must be a JSON object")
+    message = str(body.get("message") or "").strip()
+    user = str(body.get("user") or "").strip()
+    if not message:
+        raise BadRequest("'message' is required")
+    if len(message) > MAX_MESSAGE_CHARS:
+        raise BadRequest(f"'message' is longer than {MAX_MESSAGE_CHARS} characters")
+    if not user:
+        raise BadRequest("'user' is required")
+    session = request.app["sessions"].get(body.get("session_id"), user, request["caller"])
+    return session, message
+
+
+def _reply_json(session: ApiSession, reply: ChatReply) -> dict:
+    return {
+        "session_id": session.id,
+        "reply": reply.text,
+        "emergency": reply.emergency,
+        "halted": reply.halted,
+        "degraded": reply.degraded,
+    }
+
+
+def _turn_kwargs(request: web.Request, session: ApiSession) -> dict:
+    return {
+        "name": session.context.name,
+        "session_id": session.id,
+        "user_id": _user_id(session),
+        "kb": request.app["kb"].get(),
+        "snapshot": {"chat": session.history[-HISTORY_TURNS:]},
+    }
+
+
+class KnowledgeIndex:
+    """The knowledge index, reopened once ``knowledge.ingest`` has updated it (manifest mtime)."""
+
+    def __init__(self):
+        self.version = index_version()
+        self.index = open_index()
+
+    def get(self):
+        version = index_version()
+        if version != self.version:
+            self.version, self.index = version, open_index()
+        return self.index
+
+
+def _user_id(session: ApiSession) -> str:
+    """Memory and answer-cache owner: the end user, within the authenticated caller."""
+    return session.context.user_id
+
+
+def _record(session: ApiSession, message: str, reply_text: str) -> None:
+    session.history.append(("user", message))
+    session.history.append(("assistant", reply_text))
+    del session.history[:-2 * HISTORY_TURNS]
+
+
+async def _sse_response(request: web.Request) -> web.StreamResponse:
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await response.prepare(request)
+    return response
+
+
+async def _send_event(response: web.StreamResponse, event: str, data: dict) -> None:
+    await response.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+
+
+async def _single_flight(request: web.Request, session: ApiSession, route: str, message: str, run):
+    """Run ``run()`` once per idempotency key, or once per concurrent identical message."""
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if not idempotency_key:
+        return await get_single_flight().do(f"{route}:{turn_key(session.id, message)}", run)
+    key = f"{session.id}:{route}:idem:{idempotency_key}"
+    try:
+        return await get_single_flight().do(
+            key, run, remember=TURN_REPLAY_SECONDS, fingerprint=hashlib.sha256(await request.read()).hexdigest()
+        )
+    except KeyReused:
+        raise Unprocessable("Idempotency-Key was already used with a different request body")
+
+
+# ── chat ───────────────────────────────────────────────────────
+
+async def chat(request: web.Request) -> web.Response:
+    session, message = await _read_turn(request)
+
+    async def _turn() -> dict:
+        async with session.lock:
+            remember(_user_id(session), message, session.id)
+            with metrics.timed("api_request_seconds", route="chat"):
+                reply = await chat_reply(message, **_turn_kwargs(request, session))
+            _record(session, message, reply.text)
+        return _reply_json(session, reply)
+
+    return web.json_response(await _single_flight(request, session, "chat", message, _turn))
+
+
+async def chat_stream(request: web.Request) -> web.StreamResponse:
+    session, message = await _read_turn(request)
+    async with session.lock:
+        remember(_user_id(session), message, session.id)
+        response = await _sse_response(request)
+        try:
+            with metrics.timed("api_request_seconds", route="chat_stream"):
+                async for item in stream_chat_reply(message, **_turn_kwargs(request, session)):
+                    if isinstance(item, ChatReply):
+                        _record(session, message, item.text)
+                        await _send_event(response, "done", _reply_json(session, item))
+                    else:
+                        await _send_event(response, "chunk", {"text": item})
+        except (ConnectionResetError, asyncio.CancelledError):
+            raise  # client went away
+        except Exception:
+            metrics.inc("api_errors_total", route=request.path)
+            await _send_event(response, "error", {"error": STREAM_ERROR})
+    await response.write_eof()
+    return response
+
+
+# ── planner agent ──────────────────────────────────────────────
+
+def _planner():
+    """The agents module, imported on first use (it needs OPENAI_API_KEY)."""
+    import agent
+    return agent
+
+
+def _planner_result(session: ApiSession, output, last_agent: str, degraded: bool = False) -> dict:
+    return {
+        "session_id": session.id,
+        "output": output if isinstance(output, (str, dict, list)) else str(output),
+        "agent": last_agent,
+        "degraded": degraded,
+        # only what the plan tools produced, not the whole health profile
+        "plan": plan_state(session.context),
+    }
+
+
+async def planner(request: web.Request) -> web.Response:
+    from agents.exceptions import InputGuardrailTripwireTriggered, OutputGuardrailTripwireTriggered
+    from utils.output_scanner import HALTED_MESSAGE
+
+    session, message = await _read_turn(request)
+
+    async def _turn() -> dict:
+        async with session.lock:
+            try:
+                with metrics.timed("api_request_seconds", route="planner"), \
+                        token_usage.attribute(session=session.id, user=_user_id(session)):
+                    result = await _planner().run_planner(message, session.context)
+            except InputGuardrailTripwireTriggered:
+                raise BadRequest("input rejected by guardrail; describe a goal like 'lose 5kg in 2 months'")
+            except OutputGuardrailTripwireTriggered:
+                return _planner_result(session, HALTED_MESSAGE, "guardrail")
+        return _planner_result(
+            session, result.final_output, result.last_agent.name, getattr(result, "degraded", False)
+        )
+
+    return web.json_response(await _single_flight(request, session, "planner", message, _turn))
+
+
+async def planner_stream(request: web.Request) -> web.StreamResponse:
+    from agents.exceptions import InputGuardrailTripwireTriggered, OutputGuardrailTripwireTriggered
+    from utils.output_scanner import HALTED_MESSAGE
+
+    session, message = await _read_turn(request)
+    async with session.lock:
+        response = await _sse_response(request)
+        try:
+            with metrics.timed("api_request_seconds", route="planner_stream"), \
+                    token_usage.attribute(session=session.id, user=_user_id(session)):
+                async for item in _planner().stream_planner(message, session.context):
+                    if isinstance(item, str):
+                        await _send_event(response, "chunk", {"text": item})
+                    elif getattr(item, "halted", False):
+                        await _send_event(response, "done", _planner_result(session, HALTED_MESSAGE, "guardrail"))
+                    else:
+                        await _send_event(response, "done", _planner_result(
+                            session, item.final_output, item.last_agent.name, getattr(item, "degraded", False)))
+        except InputGuardrailTripwireTriggered:
+            await _send_event(response, "error", {"error": "input rejected by guardrail"})
+        except OutputGuardrailTripwireTriggered:
+            await _send_event(response, "done", _planner_result(session, HALTED_MESSAGE, "guardrail"))
+        except (ConnectionResetError, asyncio.CancelledError):
+            raise
+        except Exception:
+            metrics.inc("api_errors_total", route=request.path)
+            await _send_event(response, "error", {"error": STREAM_ERROR})
+    await response.write_eof()
+    return response
+
+
+# ── service ────────────────────────────────────────────────────
+
+async def healthz(request: web.Request) -> web.Response:
+    return web.json_response({
+        "status": "ok",
+        "health": get_health_monitor().status(),
+        "models": get_router().stats(),
+    })
+
+
+async def readyz(request: web.Request) -> web.Response:
+    health = get_health_monitor().status()
+    return web.json_response(health, status=200 if health["ready"] else 503)
+
+
+async def _start_health_monitor(app: web.Application) -> None:
+    get_health_monitor().start()
+
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain")
+
+
+async def usage(request: web.Request) -> web.Response:
+    by = tuple(filter(None, request.query.get("by", "day").split(",")))
+    try:
+        rows = token_usage.get_usage_store().report(by)
+    except ValueError as e:
+        raise BadRequest(str(e))
+    if request.query.get("format") != "csv":
+        return web.json_response({"by": list(by), "rows": rows})
+    out = io.StringIO()
+    token_usage.write_csv(rows, by, out)
+    return web.Response(text=out.getvalue(), content_type="text/csv")
+
+
+@web.middleware
+async def _errors(request: web.Request, handler):
+    try:
+        return await handler(request)
+    except web.HTTPException:
+        raise
+    except Exception:
+        metrics.inc("api_errors_total", route=request.path)
+        return web.json_response({"error": STREAM_ERROR}, status=503)
+
+
+def create_app() -> web.Application:
+    app = web.Application(middlewares=[_errors, _auth])
+    app["api_keys"] = _api_keys(os.getenv("HEALTH_API_KEYS", ""))
+    app["api_admins"] = set(filter(None, (a.strip() for a in os.getenv("HEALTH_API_ADMINS", "").split(","))))
+    app["sessions"] = SessionStore()
+    app["kb"] = KnowledgeIndex()
+    app.add_routes([
+        web.post("/v1/chat", chat),
+        web.post("/v1/chat/stream", chat_stream),
+        web.post("/v1/planner", planner),
+        web.post("/v1/planner/stream", planner_stream),
+        web.get("/healthz", healthz),
+        web.get("/readyz", readyz),
+        web.get("/metrics", metrics_endpoint),
+        web.get("/v1/usage", usage),
+    ])
+    app.on_startup.append(_start_health_monitor)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=HOST, port=PORT)
@@ -0,0 +1,298 @@
+"""Run a JSONL file of user messages through the Gemini chat or the planner agent.
+
+Usage (from the health_wellness_agent directory):
+
+    python batch_runner.py cohort.jsonl results.jsonl --workers 16 --max-rps 5
+    python batch_runner.py cohort.jsonl results.jsonl --mode planner
+    python batch_runner.py cohort.jsonl results.jsonl --resume   # after a crash
+
+Each input line is a JSON object with a message and a user (field names are
+configurable, e.g. ``--message-field body``).  Results are appended to the
+output file as they complete, one JSON object per line, tagged with the input
+line number.  The input is streamed through a bounded queue and never loaded
+whole.  Chat calls go through the background lane of utils/rate_limit.py.
+Records are historical, so red flags and escalations never open tickets
+for staff: they are only listed on the result (``escalations``).
+Tokens are charged to the record's ``session_id`` (default ``batch-<user>``),
+so ``python -m utils.token_usage report --by session`` sizes a cohort run.
+
+Progress is checkpointed next to the output (``<output>.ckpt``): the highest
+line number below which everything is done, the completed lines above it
+(at most MAX_AHEAD: reading pauses while a slow record holds the watermark
+back), and the output size at that moment.  ``--resume`` truncates the output to
+that size and skips completed lines, so every record is written exactly once.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Iterator, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from context import UserSessionContext
+from knowledge.bm25_index import open_index
+from utils import token_usage
+from utils.chat_service import chat_reply
+from utils.escalation_queue import hold_escalations
+from utils.rate_limit import BACKGROUND
+
+load_dotenv()
+
+CHECKPOINT_EVERY = 2.0   # seconds between checkpoint writes
+REPORT_EVERY = 10.0      # seconds between progress lines
+MAX_CONTEXTS = 10000     # planner contexts kept for users seen recently
+MAX_AHEAD = 10000        # lines read past the checkpoint watermark
+
+
+class RecordError(ValueError):
+    """The record itself is unusable; retrying will not help."""
+
+
+def _write_json_atomic(path: str, data) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class Checkpoint:
+    """Completed input lines as a watermark plus the out-of-order tail."""
+
+    def __init__(self, path: str, input_path: str):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+        self.watermark = 0      # every line <= watermark is done
+        self.done = set()       # done lines > watermark (< MAX_AHEAD of them)
+        self.output_bytes = 0
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data["input"] != self.input_path:
+            raise SystemExit(f"checkpoint {self.path} belongs to {data['input']}")
+        self.watermark = data["watermark"]
+        self.done = set(data["done"])
+        self.output_bytes = data["output_bytes"]
+        return True
+
+    def is_done(self, line: int) -> bool:
+        return line <= self.watermark or line in self.done
+
+    def mark(self, line: int) -> None:
+        self.done.add(line)
+        while self.watermark + 1 in self.done:
+            self.watermark += 1
+            self.done.discard(self.watermark)
+
+    def save(self, output_bytes: int) -> None:
+        self.output_bytes = output_bytes
+        _write_json_atomic(self.path, {
+            "input": self.input_path,
+            "watermark": self.watermark,
+            "done": sorted(self.done),
+            "output_bytes": output_bytes,
+        })
+
+
+def _read_records(path: str) -> Iterator[Tuple[int, str]]:
+    """Every line, blank ones included (they must be marked done to move the watermark)."""
+    with open(path, encoding="utf-8") as f:
+        yield from enumerate(f, 1)
+
+
+class BatchRunner:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.kb = open_index()
+        self.contexts: "OrderedDict[str, Tuple[UserSessionContext, asyncio.Lock]]" = OrderedDict()
+        self.uids = itertools.count(1)
+        self.interval = 1.0 / args.max_rps if args.max_rps else 0.0
+        self.next_slot = 0.0
+        self.completed = self.failed = self.skipped = 0
+
+    async def _pace(self) -> None:
+        """Spread call starts at most ``--max-rps`` per second."""
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def _context(self, user: str) -> Tuple[UserSessionContext, asyncio.Lock]:
+        entry = self.contexts.get(user)
+        if entry is None:
+            entry = (UserSessionContext(name=user, uid=next(self.uids), session_id=f"batch-{user}", user_id=user), asyncio.Lock())
+            self.contexts[user] = entry
+            while len(self.contexts) > MAX_CONTEXTS:
+                self.contexts.popitem(last=False)
+        self.contexts.move_to_end(user)
+        return entry
+
+    async def _process(self, record: dict) -> dict:
+        args = self.args
+        message = str(record.get(args.message_field) or "").strip()
+        user = str(record.get(args.user_field) or "batch").strip()
+        if not message:
+            raise RecordError(f"missing '{args.message_field}'")
+        session_id = str(record.get("session_id") or f"batch-{user}")
+
+        with hold_escalations() as escalations:
+            if args.mode == "chat":
+                reply = await chat_reply(
+                    message, name=user, session_id=session_id, user_id=user, kb=self.kb, lane=BACKGROUND
+                )
+                result = {"reply": reply.text, "emergency": reply.emergency, "halted": reply.halted}
+            else:
+                result = await self._plan(message, user, session_id)
+        if escalations:
+            result["escalations"] = escalations
+        return result
+
+    async def _plan(self, message: str, user: str, session_id: str) -> dict:
+        from agent import run_planner
+
+        context, lock = self._context(user)
+        async with lock:  # a user's records share one context, so run them in turn
+            with token_usage.attribute(session=session_id, user=user):
+                result = await run_planner(message, context, degrade=False)
+        output = result.final_output
+        return {
+            "reply": output if isinstance(output, (str, dict, list)) else str(output),
+            "agent": result.last_agent.name,
+        }
+
+    async def _handle(self, number: int, line: str) -> dict:
+        start = time.perf_counter()
+        result = {"line": number}
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise RecordError("line is not a JSON object")
+            result["id"] = record.get(self.args.id_field)
+        except ValueError as e:  # includes JSONDecodeError
+            self.failed += 1
+            return {**result, "error": f"invalid record: {e}"}
+
+        for attempt in range(self.args.retries + 1):
+            await self._pace()
+            try:
+                result.update(await self._process(record))
+                result.pop("error", None)
+                break
+            except RecordError as e:
+                result["error"] = str(e)
+                break
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+                if attempt < self.args.retries:
+                    await asyncio.sleep(2 ** attempt)
+        if "error" in result:
+            self.failed += 1
+        else:
+            self.completed += 1
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+    async def run(self) -> None:
+        args = self.args
+        checkpoint = Checkpoint(args.output + ".ckpt", args.input)
+        if args.resume and checkpoint.load():
+            with open(args.output, "ab") as out:
+                out.truncate(checkpoint.output_bytes)  # drop results written after the checkpoint
+        elif os.path.exists(args.output) and not args.resume:
+            raise SystemExit(f"{args.output} exists; pass --resume to continue it")
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=args.workers * 2)
+        out = open(args.output, "a", encoding="utf-8")
+        started = last_report = last_save = time.monotonic()
+        advanced = asyncio.Event()  # the watermark moved
+
+        async def _worker() -> None:
+            nonlocal last_report, last_save
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                number, line = item
+                result = await self._handle(number, line)
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                checkpoint.mark(number)
+                advanced.set()
+
+                now = time.monotonic()
+                if now - last_save >= CHECKPOINT_EVERY:
+                    checkpoint.save(out.tell())
+                    last_save = now
+                if now - last_report >= REPORT_EVERY:
+                    self._report(now - started)
+                    last_report = now
+
+        workers = [asyncio.create_task(_worker()) for _ in range(args.workers)]
+        enqueued = 0
+        try:
+            for number, line in _read_records(args.input):
+                if checkpoint.is_done(number):
+                    self.skipped += 1
+                    continue
+                if not line.strip():
+                    checkpoint.mark(number)
+                    continue
+                # a stuck record holds the watermark: don't let the done set grow past MAX_AHEAD
+                while number - checkpoint.watermark > MAX_AHEAD:
+                    advanced.clear()
+                    await advanced.wait()
+                await queue.put((number, line))
+                enqueued += 1
+                if args.limit and enqueued >= args.limit:
+                    break
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            checkpoint.save(out.tell())
+            out.close()
+        self._report(time.monotonic() - started, final=True)
+
+    def _report(self, elapsed: float, final: bool = False) -> None:
+        processed = self.completed + self.failed
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        label = "done" if final else "progress"
+        print(
+            f"[{label}] {processed} records ({self.failed} failed, {self.skipped} skipped) "
+            f"in {elapsed:.1f}s = {rate:.2f} records/s",
+            file=sys.stderr,
+            flush=True,
+        )
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("input", help="JSONL file of records")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--mode", choices=("chat", "planner"), default="chat")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-rps", type=float, default=0.0, help="cap on model calls started per second")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many records")
+    parser.add_argument("--message-field", default="message")
+    parser.add_argument("--user-field", default="user")
+    parser.add_argument("--id-field", default="id")
+    args = parser.parse_args(argv)
+    asyncio.run(BatchRunner(args).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Chat throughput of the headless API vs. the Streamlit script.
+
+Both paths use the local fake model (HEALTH_FAKE_MODEL=1) so only the
+serving overhead differs.  The API is served in-process and driven with
+concurrent HTTP clients; the Streamlit path replays the same turns through
+streamlit's AppTest harness (one session, one full script rerun chain per
+turn).  Data is written to a temporary HEALTH_DATA_DIR.
+
+    python benchmarks/bench_api_throughput.py --requests 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ["HEALTH_FAKE_MODEL"] = "1"
+os.environ.setdefault("HEALTH_FAKE_LATENCY", "0.1")
+os.environ.setdefault("HEALTH_RPM", "0")  # measure serving overhead, not the quota
+os.environ.setdefault("HEALTH_TPM", "0")
+os.environ.setdefault("HEALTH_DATA_DIR", tempfile.mkdtemp(prefix="bench_api_"))
+os.environ["HEALTH_API_KEYS"] = "bench:bench-key"
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from api import create_app  # noqa: E402
+
+MESSAGES = [
+    "how can I sleep better",
+    "what should I eat before a morning run",
+    "is walking every day enough exercise",
+    "tips for drinking more water",
+]
+
+
+def _report(label: str, n: int, elapsed: float, latencies, cpu: float) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label:<24} {n / elapsed:7.1f} turns/s   p50 {statistics.median(latencies) * 1000:6.0f}ms"
+          f"   p95 {p95 * 1000:6.0f}ms   cpu/turn {cpu / n * 1000:6.1f}ms")
+
+
+async def _bench_api(n: int, concurrency: int) -> None:
+    runner = web.AppRunner(create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/v1/chat"
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _turn(http: aiohttp.ClientSession, i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            body = {"user": f"user{i % concurrency}", "message": MESSAGES[i % len(MESSAGES)]}
+            async with http.post(url, json=body) as response:
+                assert response.status == 200, await response.text()
+                await response.json()
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency),
+                                         headers={"Authorization": "Bearer bench-key"}) as http:
+            cpu, start = time.process_time(), time.perf_counter()
+            await asyncio.gather(*(_turn(http, i) for i in range(n)))
+            elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+    finally:
+        await runner.cleanup()
+    _report(f"api (concurrency {concurrency})", n, elapsed, latencies, cpu)
+
+
+def _bench_streamlit(n: int) -> None:
+    from streamlit.testing.v1 import AppTest
+
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    app = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=60)
+    app.run()
+    app.text_input(key="name_input").input("bench")
+    app.button(key="connect_btn").click().run()
+
+    latencies = []
+    cpu, start = time.process_time(), time.perf_counter()
+    for i in range(n):
+        turn_start = time.perf_counter()
+        app.text_input(key="neural_input").input(MESSAGES[i % len(MESSAGES)])
+        next(b for b in app.button if b.label == "⚡").click().run()
+        assert app.session_state.chat[-1][0] == "assistant"
+        latencies.append(time.perf_counter() - turn_start)
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+    _report("streamlit (1 session)", n, elapsed, latencies, cpu)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--streamlit-turns", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"fake model latency {float(os.environ['HEALTH_FAKE_LATENCY']) * 1000:.0f}ms + chunks")
+    asyncio.run(_bench_api(args.requests // args.concurrency or 1, 1))
+    asyncio.run(_bench_api(args.requests, args.concurrency))
+    _bench_streamlit(args.streamlit_turns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Tail latency of chat turns under overload, with and without load shedding.
+
+A crowd of users sends chat turns faster than the model quota allows, so
+interactive calls queue on the rate limiter.  Without shedding every user
+waits for the queue; with it, turns beyond the queue-depth threshold (or
+past the turn timeout) are answered locally and marked degraded.  Runs
+offline against the fake model; data goes to a temporary HEALTH_DATA_DIR.
+
+    python benchmarks/bench_degradation.py --users 60 --turns 3 --rpm 300
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ["HEALTH_FAKE_MODEL"] = "1"
+os.environ.setdefault("HEALTH_FAKE_LATENCY", "0.3")
+os.environ.setdefault("HEALTH_RATE_BURST_SECONDS", "1")
+os.environ["HEALTH_TPM"] = "0"
+os.environ.setdefault("HEALTH_DATA_DIR", tempfile.mkdtemp(prefix="bench_degrade_"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import chat_service, degradation, rate_limit  # noqa: E402
+from utils.chat_service import chat_reply  # noqa: E402
+
+MESSAGES = [
+    "how can I sleep better",
+    "give me a vegetarian meal plan for the week",
+    "tips for drinking more water",
+    "suggest a beginner workout plan",
+    "is walking every day enough exercise",
+]
+
+
+async def _scenario(users: int, turns: int, rpm: float, shedding: bool, timeout: float) -> dict:
+    rate_limit._limiter = rate_limit.FairRateLimiter(rpm=rpm, tpm=0)
+    if shedding:
+        degradation._shedder = degradation.LoadShedder()
+        chat_service.TURN_TIMEOUT_SECONDS = timeout
+    else:
+        degradation._shedder = degradation.LoadShedder(queue_depth=10 ** 9, p95_seconds=float("inf"))
+        chat_service.TURN_TIMEOUT_SECONDS = float("inf")
+    degradation._cache = degradation.ResponseCache()
+    latencies, degraded = [], 0
+
+    async def _user(u: int) -> None:
+        nonlocal degraded
+        for t in range(turns):
+            start = time.perf_counter()
+            reply = await chat_reply(MESSAGES[(u + t) % len(MESSAGES)], name=f"user{u}", session_id=f"s{u}")
+            latencies.append(time.perf_counter() - start)
+            degraded += reply.degraded
+
+    await asyncio.gather(*(_user(u) for u in range(users)))
+    return {"latencies": sorted(latencies), "degraded": degraded}
+
+
+def _print(label: str, result: dict) -> None:
+    latencies = result["latencies"]
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label:<14} p50 {statistics.median(latencies):6.2f}s   p95 {p95:6.2f}s   max {latencies[-1]:6.2f}s"
+          f"   degraded {result['degraded']}/{len(latencies)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--rpm", type=float, default=300)
+    parser.add_argument("--timeout", type=float, default=5.0, help="turn timeout with shedding on")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    print(f"{args.users} users x {args.turns} turns, quota {args.rpm:.0f} rpm, "
+          f"queue-depth threshold {degradation.DEGRADE_QUEUE_DEPTH}")
+    for shedding in (False, True):
+        result = asyncio.run(_scenario(args.users, args.turns, args.rpm, shedding, args.timeout))
+        _print("shedding on" if shedding else "shedding off", result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Script CPU per interaction in the Streamlit app, whole-script reruns vs fragments.
+
+Drives main.py headless (streamlit.testing) through a session with
+``--history`` messages already in the chat, then repeats each interaction:
+pressing Enter in the input box, sending a message, exporting the PDF and
+the status bar's periodic refresh.  With HEALTH_FRAGMENTS=0 every
+interaction reruns the whole script; with fragments only the fragment the
+widget belongs to reruns, as the server does when the browser sends the
+widget's fragment id.  CPU is the script thread's, as measured by
+utils/rerun_profiler.py, so time spent waiting on the (fake) model is not
+counted.
+
+    python benchmarks/bench_fragments.py --history 20 --repeat 10
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+
+os.environ["HEALTH_FAKE_MODEL"] = "1"
+os.environ.setdefault("HEALTH_FAKE_LATENCY", "0.02")
+os.environ["HEALTH_PROFILE"] = "1"
+os.environ["HEALTH_RPM"] = "0"
+os.environ["HEALTH_TPM"] = "0"
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("HEALTH_DATA_DIR", tempfile.mkdtemp(prefix="bench_fragments_"))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.runtime.fragment import MemoryFragmentStorage  # noqa: E402
+from streamlit.runtime.scriptrunner import RerunData  # noqa: E402
+from streamlit.testing.v1 import AppTest, local_script_runner  # noqa: E402
+
+from utils.rerun_profiler import SCRIPT, SESSION_KEY  # noqa: E402
+
+
+class _Session:
+    """An AppTest whose runs keep the fragments of the previous run, like a
+    browser session on the server, so an interaction can rerun one fragment."""
+
+    def __init__(self, fragments: bool):
+        os.environ["HEALTH_FRAGMENTS"] = "1" if fragments else "0"
+        self.fragments = fragments
+        self._storage = MemoryFragmentStorage()
+        self._queue = []
+        local_script_runner.MemoryFragmentStorage = lambda: self._storage
+        local_script_runner.RerunData = lambda **kw: RerunData(fragment_id_queue=list(self._queue), **kw)
+        self.at = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=60)
+        self.at.run()
+        self.at.text_input(key="name_input").input("bench")
+        self.at.button(key="connect_btn").click().run()
+
+    def _fragment_id(self, name: str) -> str:
+        for fragment_id, wrapped in self._storage._fragments.items():
+            if any(getattr(cell.cell_contents, "__name__", None) == name for cell in wrapped.__closure__ or ()):
+                return fragment_id
+        raise LookupError(name)
+
+    def run(self, widget, fragment: str, check: bool = True) -> dict:
+        """Rerun after ``widget`` changed (the fragment only, with fragments on) and return its profile."""
+        self._queue = [self._fragment_id(fragment)] if self.fragments else []
+        try:
+            (widget.run() if widget is not None else self.at.run())
+        finally:
+            self._queue = []
+        history = self.at.session_state[SESSION_KEY]["history"]
+        report = history[-1]
+        assert not check or report["scope"] == (fragment if self.fragments else SCRIPT), report["scope"]
+        return report
+
+    def button(self, label: str):
+        return next(b for b in self.at.button if b.label == label)
+
+    def send(self, message: str, check: bool = True) -> dict:
+        self.at.text_input(key="neural_input").input(message)
+        return self.run(self.button("⚡").click(), "conversation", check)
+
+
+def _interactions(session: _Session, history: int, repeat: int) -> dict:
+    for i in range(history // 2):
+        session.send(f"how much water should I drink, question {i}", check=False)  # the first one reruns it all
+    cpu = {"enter in input box": [], "send a message": [], "export PDF": [], "status refresh": []}
+    for i in range(repeat):
+        # a fragment rerun only returns that fragment's elements, so the untimed
+        # reruns put the widgets of the next interaction back in the test tree
+        session.run(None, "conversation")
+        cpu["enter in input box"].append(session.run(
+            session.at.text_input(key="neural_input").input(f"typing {i}"), "conversation")["cpu"])
+        cpu["send a message"].append(session.send(f"is coffee bad for sleep, take {i}")["cpu"])
+        session.run(None, "action_panel")
+        cpu["export PDF"].append(session.run(session.button("📄 EXPORT").click(), "action_panel")["cpu"])
+        cpu["status refresh"].append(session.run(None, "status_bar")["cpu"])
+    return {name: statistics.median(values) for name, values in cpu.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--history", type=int, default=20, help="messages in the chat before measuring")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    whole = _interactions(_Session(fragments=False), args.history, args.repeat)
+    partial = _interactions(_Session(fragments=True), args.history, args.repeat)
+    print(f"script CPU per interaction (median of {args.repeat}, {args.history} messages in the chat)")
+    print(f"{'interaction':<20} {'whole script':>13} {'fragments':>10}")
+    for name in whole:
+        print(f"{name:<20} {whole[name] * 1000:11.1f}ms {partial[name] * 1000:8.1f}ms"
+              f"   -{(1 - partial[name] / whole[name]) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
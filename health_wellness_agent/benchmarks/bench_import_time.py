@@ -0,0 +1,71 @@
+"""Cold-start budget for the Streamlit app.
+
+Each run starts a fresh interpreter, imports streamlit's test harness, then
+times the first run of main.py (module imports + first render) and one
+rerun.  The median cold first run must stay under ``--budget`` seconds, and
+none of the heavy optional dependencies may be loaded before they are used
+(PDF export, the agents SDK, provider SDKs, dataframes and plotting).
+Exits with status 1 when either check fails, so it can gate CI.
+
+    python benchmarks/bench_import_time.py --runs 5 --budget 0.6
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# loaded on first use only: PDF export, planner agents, model providers, future dashboard pages
+DEFERRED = ("fpdf", "agents", "openai", "google.generativeai", "groq", "pandas", "plotly", "aiohttp")
+
+_CHILD = """
+import json, logging, sys, time
+from streamlit.testing.v1 import AppTest
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+app = AppTest.from_file("main.py", default_timeout=60)
+start = time.perf_counter()
+app.run()
+first = time.perf_counter() - start
+start = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - start
+assert not app.exception, app.exception
+print(json.dumps({"first": first, "rerun": rerun, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def _run_once() -> dict:
+    env = dict(os.environ, HEALTH_FAKE_MODEL="1")
+    env.setdefault("HEALTH_DATA_DIR", tempfile.mkdtemp(prefix="bench_import_"))
+    out = subprocess.run(
+        [sys.executable, "-c", _CHILD % (DEFERRED,)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.6, help="seconds for the median cold first run")
+    args = parser.parse_args()
+
+    results = [_run_once() for _ in range(args.runs)]
+    first = statistics.median(r["first"] for r in results)
+    rerun = statistics.median(r["rerun"] for r in results)
+    loaded = sorted({m for r in results for m in r["loaded"]})
+    print(f"cold first run {first * 1000:6.0f}ms (budget {args.budget * 1000:.0f}ms)   rerun {rerun * 1000:6.0f}ms")
+    print(f"deferred modules loaded at startup: {', '.join(loaded) or 'none'}")
+
+    failed = first > args.budget or loaded
+    if failed:
+        print("FAIL: cold start over budget" if first > args.budget else "FAIL: heavy modules imported at startup")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
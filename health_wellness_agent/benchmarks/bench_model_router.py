@@ -0,0 +1,178 @@
+"""Fast/strong model routing and failover against local fake providers.
+
+1. mixed traffic: short factual questions and longer analysis requests sent
+   through utils/model_gateway.py, once with every call on the strong model
+   and once routed by ``classify_query``.
+2. failover: the preferred fast provider starts failing half-way through the
+   run; calls move to the backup provider without a failed turn and the
+   broken provider is taken out of rotation.
+3. latency shift: the fast provider slows down beyond the strong one; fast
+   calls follow the measured latency to the strong tier.
+
+    python benchmarks/bench_model_router.py --requests 300 --concurrency 20
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+os.environ["HEALTH_FAKE_MODEL"] = "1"
+os.environ["HEALTH_RPM"] = "0"  # measure routing, not the quota
+os.environ["HEALTH_TPM"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import metrics, model_gateway, model_router  # noqa: E402
+from utils.fake_model import FakeGenerativeModel  # noqa: E402
+from utils.model_router import FAST, STRONG, ModelRouter, Provider, classify_query  # noqa: E402
+
+SHORT = [
+    "how much water should I drink a day",
+    "is coffee bad for sleep",
+    "how many steps a day is healthy",
+    "what is a normal resting heart rate",
+    "are eggs a good source of protein",
+]
+LONG = [
+    "analyze my week: I ran three times, slept six hours a night and skipped breakfast",
+    "give me a detailed 8 week plan to go from walking to running 5k",
+    "compare intermittent fasting with calorie counting for someone with a desk job",
+    "explain why my energy drops every afternoon and what routine would help",
+]
+
+
+class FlakyModel(FakeGenerativeModel):
+    """Fake model whose latency and failure rate can be changed mid-run."""
+
+    def __init__(self, name: str, latency: float, error_rate: float = 0.0):
+        super().__init__(name, first_token_seconds=latency, chunk_seconds=0.0)
+        self.error_rate = error_rate
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        if random.random() < self.error_rate:
+            time.sleep(self.first_token_seconds / 4)
+            raise RuntimeError(f"{self.model_name}: 503 service unavailable")
+        return super().generate_content(prompt, stream=stream, **kwargs)
+
+
+def _install(providers) -> ModelRouter:
+    model_router._router = ModelRouter([Provider(name, tier, lambda m=model: m) for name, tier, model in providers])
+    return model_router._router
+
+
+def _p(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def _drive(n: int, concurrency: int, routed: bool, on_progress=None) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = {FAST: [], STRONG: []}
+    failed = Counter()
+
+    async def _one(i: int) -> None:
+        message = random.choice(SHORT if i % 10 < 7 else LONG)
+        kind = classify_query(message)
+        async with semaphore:
+            if on_progress:
+                on_progress(i)
+            start = time.perf_counter()
+            try:
+                await model_gateway.generate(message, tier=kind if routed else STRONG)
+            except Exception:
+                failed[kind] += 1
+                return
+            latencies[kind].append(time.perf_counter() - start)
+
+    await asyncio.gather(*(_one(i) for i in range(n)))
+    return {"latencies": latencies, "failed": failed}
+
+
+def _print(label: str, result: dict) -> None:
+    parts = []
+    for kind, values in result["latencies"].items():
+        if values:
+            parts.append(f"{kind}: p50 {statistics.median(values) * 1000:5.0f}ms p95 {_p(values, 0.95) * 1000:5.0f}ms")
+    failed = sum(result["failed"].values())
+    print(f"{label:<22} {'   '.join(parts)}   failed {failed}")
+
+
+def _route_counts(router: ModelRouter) -> Counter:
+    counts = Counter()
+    for provider in router.providers:
+        for tier in (FAST, STRONG):
+            for reason in ("preferred", "cross_tier", "failover"):
+                value = metrics.counter_value("model_route_total", tier=tier, provider=provider.name, reason=reason)
+                if value:
+                    counts[f"{provider.name} {reason}"] += value
+    return counts
+
+
+def _print_routes(router: ModelRouter, before: Counter) -> None:
+    counts = _route_counts(router) - before
+    print(f"{'':<22} routes: " + ", ".join(f"{k} {v:.0f}" for k, v in sorted(counts.items())))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--fast-latency", type=float, default=0.08)
+    parser.add_argument("--strong-latency", type=float, default=0.4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    random.seed(7)
+
+    print(f"fake providers: fast {args.fast_latency * 1000:.0f}ms, strong {args.strong_latency * 1000:.0f}ms")
+    for routed in (False, True):
+        _install([
+            ("fake:fast", FAST, FlakyModel("fast", args.fast_latency)),
+            ("fake:strong", STRONG, FlakyModel("strong", args.strong_latency)),
+        ])
+        result = asyncio.run(_drive(args.requests, args.concurrency, routed))
+        _print("routed fast/strong" if routed else "always strong", result)
+
+    # the preferred fast provider starts failing half-way through the run
+    primary = FlakyModel("fast-a", args.fast_latency)
+    router = _install([
+        ("fake:fast-a", FAST, primary),
+        ("fake:fast-b", FAST, FlakyModel("fast-b", args.fast_latency * 1.5)),
+        ("fake:strong", STRONG, FlakyModel("strong", args.strong_latency)),
+    ])
+    before = _route_counts(router)
+
+    def _break(i: int) -> None:
+        if i == args.requests // 2:
+            primary.error_rate = 1.0
+
+    result = asyncio.run(_drive(args.requests, args.concurrency, True, on_progress=_break))
+    _print("fast-a down mid-run", result)
+    _print_routes(router, before)
+
+    # the fast provider slows down past the strong one
+    fast = FlakyModel("fast", args.fast_latency)
+    router = _install([
+        ("fake:fast", FAST, fast),
+        ("fake:strong", STRONG, FlakyModel("strong", args.strong_latency)),
+    ])
+    before = _route_counts(router)
+
+    def _slow(i: int) -> None:
+        if i == args.requests // 3:
+            fast.first_token_seconds = args.strong_latency * 3
+
+    result = asyncio.run(_drive(args.requests, args.concurrency, True, on_progress=_slow))
+    _print("fast slows down", result)
+    _print_routes(router, before)
+    print(f"{'':<22} ewma: " + ", ".join(
+        f"{s['provider']} {s['latency'] * 1000:.0f}ms" for s in router.stats() if s["latency"] is not None
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Planner turn latency with and without parallel tool execution.
+
+The local tools finish instantly, so each step is given a simulated I/O
+latency (a remote planner, database or API call) to show the effect of
+running the meal and workout steps concurrently.
+
+    python benchmarks/bench_parallel_tools.py --tool-latency 0.2 --runs 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from context import UserSessionContext  # noqa: E402
+from tools.plan_pipeline import DEFAULT_STEPS, run_full_plan  # noqa: E402
+
+
+def _with_latency(step, seconds: float):
+    async def _slow(*args):
+        await asyncio.sleep(seconds)
+        return await step(*args)
+    return _slow
+
+
+async def _turn(parallel: bool, latency: float) -> float:
+    context = UserSessionContext(name="bench", uid=1, diet_preferences="vegetarian")
+    steps = {name: _with_latency(step, latency) for name, step in DEFAULT_STEPS.items()}
+    start = time.perf_counter()
+    await run_full_plan(context, "lose 5kg in 2 months", parallel=parallel, steps=steps)
+    elapsed = time.perf_counter() - start
+    assert context.meal_plan and context.workout_plan and context.progress_logs
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tool-latency", type=float, default=0.2)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for parallel in (False, True):
+        samples = [asyncio.run(_turn(parallel, args.tool_latency)) for _ in range(args.runs)]
+        label = "parallel" if parallel else "sequential"
+        print(f"{label:<11} median turn latency: {statistics.median(samples) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
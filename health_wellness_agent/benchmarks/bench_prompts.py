@@ -0,0 +1,139 @@
+"""Prompt bytes and tokens per chat request: inline f-string vs compiled templates.
+
+Runs chat turns of one user (with memories from an earlier session and a
+small knowledge base, so prompts carry both) through the chat service
+against the fake model, and rebuilds each turn's prompt the way it was
+built before utils/prompts.py: one indented f-string with the persona, the
+user's name, memories, references and the message.  Prints per request the
+bytes sent, the prompt tokens and how many of them the provider could serve
+from its prefix cache (the fake model reports a repeated system instruction
+as cached, like Gemini implicit caching).  Tokens are counted at four
+characters per token, as the fake model and the rate limiter do.
+
+Real providers only cache prefixes past a minimum length (about a thousand
+tokens), so with today's short persona the "cached" column is what a longer
+static prefix would earn; the byte and token savings apply as they are.
+
+    python benchmarks/bench_prompts.py --turns 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+
+os.environ["HEALTH_FAKE_MODEL"] = "1"
+os.environ["HEALTH_FAKE_LATENCY"] = "0"
+os.environ["HEALTH_FAKE_CHUNK_LATENCY"] = "0"
+os.environ["HEALTH_RPM"] = "0"
+os.environ["HEALTH_TPM"] = "0"
+os.environ["HEALTH_WARMUP"] = "0"
+os.environ.setdefault("HEALTH_DATA_DIR", tempfile.mkdtemp(prefix="bench_prompts_"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge.bm25_index import BM25Index, format_passages  # noqa: E402
+from memory.memory_index import format_memories, get_memory_index  # noqa: E402
+from utils import token_usage  # noqa: E402
+from utils.chat_service import build_prompt, chat_reply  # noqa: E402
+from utils.prompts import CHAT_SYSTEM, RECALLED_HEADER, REFERENCES_HEADER  # noqa: E402
+from utils.rate_limit import estimate_tokens  # noqa: E402
+
+USER = "bench"
+PASSAGES = [
+    ("Hydration", "Most adults need about two to three litres of fluid a day; more in heat or with exercise."),
+    ("Sleep", "Seven to nine hours of sleep, a regular schedule and no caffeine after midday improve sleep quality."),
+    ("Strength", "Two or three full-body strength sessions a week build a solid base for beginners."),
+    ("Caffeine", "Caffeine has a half-life of about five hours, so afternoon coffee can delay sleep."),
+    ("Protein", "Spreading protein over three or four meals supports muscle repair after training."),
+]
+EARLIER = [
+    "I want to sleep better before my exams",
+    "I drink about four coffees a day",
+    "I started lifting weights twice a week",
+]
+MESSAGES = [
+    "how much water should I drink a day",
+    "is coffee bad for sleep",
+    "suggest a beginner strength routine",
+    "how should I spread protein over the day",
+    "why do I wake up tired",
+]
+
+
+def _inline_prompt(message: str, name: str, kb) -> str:
+    """The prompt as chat_service.build_prompt built it before utils/prompts.py."""
+    references = ""
+    passages = kb.search(message, k=3)
+    if passages:
+        references = f"{REFERENCES_HEADER}\n" + format_passages(passages)
+    recalled = ""
+    memories = get_memory_index(USER).search(message, k=3, exclude_session="now")
+    if memories:
+        recalled = f"{RECALLED_HEADER}\n" + format_memories(memories)
+    return f"""
+        You are an advanced personal AI health intelligence system. You're assisting {name or 'User'}.
+
+        Core Parameters:
+        - Provide advanced, evidence-based health intelligence
+        - Maintain professional, authoritative tone
+        - Always recommend professional medical consultation for serious concerns
+        - Deliver precise, actionable health protocols
+        - Use sophisticated, clinical language when appropriate
+        - Keep responses focused and impactful
+
+        {recalled}
+
+        {references}
+
+        Query: {message}
+        """
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    kb = BM25Index(tempfile.mkdtemp(prefix="bench_prompts_kb_"))
+    kb.add_passages({"title": title, "source": "bench", "text": text} for title, text in PASSAGES)
+    for message in EARLIER:
+        get_memory_index(USER).add(message, "earlier")
+
+    inline_bytes, inline_tokens = [], []
+    for i in range(args.turns):
+        prompt = _inline_prompt(MESSAGES[i % len(MESSAGES)], USER, kb)
+        inline_bytes.append(len(prompt.encode("utf-8")))
+        inline_tokens.append(estimate_tokens(prompt))
+
+    template_bytes = []
+    for i in range(args.turns):
+        prompt = build_prompt(MESSAGES[i % len(MESSAGES)], name=USER, session_id="now", user_id=USER, kb=kb)
+        template_bytes.append(len(prompt.system.encode("utf-8")) + len(prompt.user.encode("utf-8")))
+
+    async def _turns() -> None:
+        for i in range(args.turns):
+            await chat_reply(MESSAGES[i % len(MESSAGES)], name=USER, session_id="now", user_id=USER, kb=kb)
+
+    asyncio.run(_turns())
+    (chat,) = token_usage.get_usage_store().report(("kind",))
+
+    rows = [
+        ("inline f-string", statistics.mean(inline_bytes), statistics.mean(inline_tokens), 0.0),
+        ("templates", statistics.mean(template_bytes), chat["prompt"] / chat["calls"], chat["cached"] / chat["calls"]),
+    ]
+    print(f"chat prompt per request (mean of {args.turns} turns, "
+          f"system instruction {len(CHAT_SYSTEM.text)} bytes)")
+    print(f"{'':<17} {'bytes':>7} {'tokens':>7} {'cached':>7} {'uncached':>9}")
+    for label, size, tokens, cached in rows:
+        print(f"{label:<17} {size:7.0f} {tokens:7.1f} {cached:7.1f} {tokens - cached:9.1f}")
+    (_, b0, t0, c0), (_, b1, t1, c1) = rows
+    print(f"{'saved':<17} {b0 - b1:7.0f} {t0 - t1:7.1f} {'':>7} {(t0 - c0) - (t1 - c1):9.1f}"
+          f"   ({(1 - b1 / b0) * 100:.0f}% bytes, {(1 - (t1 - c1) / (t0 - c0)) * 100:.0f}% uncached tokens)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Fairness of the shared model rate limiter under one heavy user.
+
+A heavy user fires a burst of calls (an ANALYZE run, a batch job) that
+exceeds the quota; shortly after, a few light users send one chat message
+each.  With per-user round-robin queues the light users wait about one
+refill interval; with a single FIFO queue (all calls under one key) they
+wait for the heavy user's whole backlog.  Runs offline against the fake
+model through utils/model_gateway.py.
+
+The second scenario has a larger crowd of light users and runs the heavy
+burst in the background lane (ANALYZE, batch jobs), compared with the same
+burst sent as interactive traffic.
+
+    python benchmarks/bench_rate_limit.py --rpm 1200 --heavy 100 --light 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+os.environ["HEALTH_FAKE_MODEL"] = "1"
+os.environ.setdefault("HEALTH_FAKE_LATENCY", "0.05")
+os.environ.setdefault("HEALTH_RATE_BURST_SECONDS", "1")
+os.environ["HEALTH_TPM"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import model_gateway, rate_limit  # noqa: E402
+from utils.rate_limit import BACKGROUND, INTERACTIVE  # noqa: E402
+
+
+async def _scenario(rpm: float, heavy: int, light: int, fair: bool, heavy_lane: str = INTERACTIVE) -> dict:
+    rate_limit._limiter = rate_limit.FairRateLimiter(rpm=rpm, tpm=0)
+    waits = {"heavy": [], "light": []}
+
+    async def _call(kind: str, user: str, i: int, lane: str = INTERACTIVE) -> None:
+        start = time.perf_counter()
+        await model_gateway.generate(f"{kind} question {i}", user=user if fair else "everyone", lane=lane)
+        waits[kind].append(time.perf_counter() - start)
+
+    heavy_calls = [asyncio.create_task(_call("heavy", "heavy", i, heavy_lane)) for i in range(heavy)]
+    await asyncio.sleep(0.1)
+    light_calls = [asyncio.create_task(_call("light", f"light{i}", i)) for i in range(light)]
+    await asyncio.gather(*heavy_calls, *light_calls)
+    return waits
+
+
+def _print(label: str, waits: dict) -> None:
+    print(f"{label:<26} light users: median {statistics.median(waits['light']) * 1000:6.0f}ms"
+          f"  max {max(waits['light']) * 1000:6.0f}ms   heavy user done after "
+          f"{max(waits['heavy']):.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rpm", type=float, default=1200)
+    parser.add_argument("--heavy", type=int, default=100)
+    parser.add_argument("--light", type=int, default=5)
+    args = parser.parse_args()
+
+    for fair in (False, True):
+        waits = asyncio.run(_scenario(args.rpm, args.heavy, args.light, fair))
+        _print("fair (per user)" if fair else "fifo (one queue)", waits)
+
+    # many light users arriving together: round-robin alone puts the heavy user in every round
+    crowd = args.light * 6
+    for lane in (INTERACTIVE, BACKGROUND):
+        waits = asyncio.run(_scenario(args.rpm, args.heavy, crowd, True, heavy_lane=lane))
+        _print(f"heavy in {lane} lane", waits)
+
+
+if __name__ == "__main__":
+    main()
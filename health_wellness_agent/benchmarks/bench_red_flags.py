@@ -0,0 +1,45 @@
+"""Red-flag scan latency on short and long messages.
+
+    python benchmarks/bench_red_flags.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.red_flags import detect_red_flag  # noqa: E402
+
+FILLER = (
+    "I have been trying to eat better and walk every evening but my knees get "
+    "sore after long runs and I wonder whether I should switch to cycling or "
+    "swimming for a few weeks while I also cut back on sugar and late snacks"
+).split()
+
+
+def _message(words: int, rng: random.Random, emergency: bool) -> str:
+    text = [rng.choice(FILLER) for _ in range(words)]
+    if emergency:
+        text.insert(rng.randrange(len(text)), "crushing chest pain")
+    return " ".join(text)
+
+
+def main() -> None:
+    rng = random.Random(1)
+    print(f"{'words':>6} {'chars':>7} {'flag':>5} {'p50 ms':>8} {'p99 ms':>8}")
+    for words in (20, 200, 2000, 5000):
+        for emergency in (False, True):
+            message = _message(words, rng, emergency)
+            samples = []
+            for _ in range(200):
+                start = time.perf_counter()
+                detect_red_flag(message)
+                samples.append((time.perf_counter() - start) * 1000)
+            samples.sort()
+            print(f"{words:>6} {len(message):>7} {str(emergency):>5} "
+                  f"{samples[len(samples) // 2]:>8.3f} {samples[int(len(samples) * 0.99)]:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
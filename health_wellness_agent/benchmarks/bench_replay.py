@@ -0,0 +1,105 @@
+"""Record a session to a cassette, then replay it offline.
+
+A mix of chat turns (whole and streamed) and direct model calls is run once
+against the model while recording (the fake model here; point HEALTH_FAKE_MODEL
+at 0 and set keys to record real providers), then replayed from the cassette
+at recorded speed and with waiting turned off.  Prints whether every replayed
+answer matches the recording, how closely replayed latencies follow the
+recorded ones, and the cassette size.
+
+    python benchmarks/bench_replay.py --turns 40 --concurrency 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("HEALTH_FAKE_MODEL", "1")
+os.environ.setdefault("HEALTH_FAKE_LATENCY", "0.2")
+os.environ["HEALTH_RPM"] = "0"
+os.environ["HEALTH_TPM"] = "0"
+os.environ["HEALTH_WARMUP"] = "0"
+os.environ.setdefault("HEALTH_DATA_DIR", tempfile.mkdtemp(prefix="bench_replay_"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import cassette, model_gateway, model_router  # noqa: E402
+from utils.cassette import RECORD, REPLAY, Cassette  # noqa: E402
+from utils.chat_service import chat_reply, stream_chat_reply  # noqa: E402
+from utils.streaming import get_gemini_response  # noqa: E402
+
+MESSAGES = [
+    "how much water should I drink a day",
+    "give me a weekly plan to improve my sleep routine",
+    "is coffee bad for sleep",
+    "explain why my energy drops every afternoon",
+    "suggest a beginner strength routine",
+]
+
+
+def _install(path: str, mode: str, speed: float = 1.0) -> None:
+    cassette._cassette = Cassette(path, mode, speed=speed)
+    model_router._router = None  # providers are wrapped when first built
+    model_gateway._model = None
+
+
+async def _turn(i: int) -> str:
+    message = MESSAGES[i % len(MESSAGES)]
+    if i % 3 == 0:
+        return (await chat_reply(message, name=f"user{i}", session_id=f"s{i}")).text
+    if i % 3 == 1:
+        reply = None
+        async for item in stream_chat_reply(message, name=f"user{i}", session_id=f"s{i}"):
+            reply = item
+        return reply.text
+    return await asyncio.to_thread(get_gemini_response, f"{message} (direct {i})")
+
+
+async def _session(turns: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    answers, latencies = {}, {}
+
+    async def _one(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            answers[i] = await _turn(i)
+            latencies[i] = time.perf_counter() - start
+
+    await asyncio.gather(*(_one(i) for i in range(turns)))
+    return {"answers": answers, "latencies": latencies}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    path = os.path.join(tempfile.mkdtemp(prefix="cassette_"), "session.jsonl.gz")
+
+    _install(path, RECORD)
+    start = time.perf_counter()
+    recorded = asyncio.run(_session(args.turns, args.concurrency))
+    recorded_wall = time.perf_counter() - start
+    cassette.get_cassette().flush()
+    print(f"recorded {args.turns} turns in {recorded_wall:5.2f}s   cassette {os.path.getsize(path) / 1024:.1f} KiB")
+
+    for label, speed in (("replay 1x", 1.0), ("replay no wait", 0.0)):
+        _install(path, REPLAY, speed=speed)
+        start = time.perf_counter()
+        replayed = asyncio.run(_session(args.turns, args.concurrency))
+        wall = time.perf_counter() - start
+        same = sum(replayed["answers"][i] == recorded["answers"][i] for i in range(args.turns))
+        drift = [abs(replayed["latencies"][i] - recorded["latencies"][i]) for i in range(args.turns)]
+        print(f"{label:<15} {wall:5.2f}s   identical answers {same}/{args.turns}   "
+              f"p50 turn {statistics.median(replayed['latencies'].values()) * 1000:5.0f}ms "
+              f"(recorded {statistics.median(recorded['latencies'].values()) * 1000:.0f}ms, "
+              f"median drift {statistics.median(drift) * 1000:.0f}ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Retrieval latency benchmark for the BM25 knowledge index.
+
+Builds a synthetic corpus (Zipf-distributed vocabulary, default 1M passages)
+in a temporary directory and reports per-query latency percentiles.
+
+    python benchmarks/bench_retrieval.py                 # 1M passages
+    python benchmarks/bench_retrieval.py --passages 100000 --queries 500
+"""
+import argparse
+import itertools
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge.bm25_index import BM25Index  # noqa: E402
+
+VOCAB_SIZE = 50_000
+WORDS_PER_PASSAGE = 60
+
+
+def _vocabulary():
+    words = [f"w{i}" for i in range(VOCAB_SIZE)]
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(VOCAB_SIZE)))
+    return words, cum_weights
+
+
+def _corpus(n: int, rng: random.Random, words, cum_weights):
+    for i in range(n):
+        text = " ".join(rng.choices(words, cum_weights=cum_weights, k=WORDS_PER_PASSAGE))
+        yield {"title": f"doc {i}", "source": "synthetic", "text": text}
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--passages", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--keep", action="store_true", help="keep the generated index")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    words, cum_weights = _vocabulary()
+    directory = tempfile.mkdtemp(prefix="bench_bm25_")
+    try:
+        index = BM25Index(directory)
+        start = time.perf_counter()
+        index.add_passages(_corpus(args.passages, rng, words, cum_weights))
+        build = time.perf_counter() - start
+        print(f"built {index.n_docs:,} passages in {len(index.segments)} segments: {build:.1f}s")
+
+        # queries mix frequent (head) and rare (tail) terms like real questions
+        queries = [
+            " ".join(rng.choices(words[:200], k=2) + rng.choices(words[200:], k=3))
+            for _ in range(args.queries)
+        ]
+        for q in queries[:20]:
+            index.search(q, args.k)  # warm the page cache
+
+        latencies = []
+        for q in queries:
+            t0 = time.perf_counter()
+            index.search(q, args.k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        print(
+            f"search k={args.k}: p50={_percentile(latencies, 50):.2f}ms "
+            f"p95={_percentile(latencies, 95):.2f}ms p99={_percentile(latencies, 99):.2f}ms"
+        )
+        index.close()
+    finally:
+        if args.keep:
+            print(f"index kept in {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
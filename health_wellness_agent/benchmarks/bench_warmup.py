@@ -0,0 +1,82 @@
+"""First-request latency on a fresh worker, with and without background warm-up.
+
+Each fake provider pays a one-off connection setup (``--connect``) on its
+first call, like a real client opening its connection.  Without warm-up the
+first user message of each tier pays it; with utils/health.py the warm-up
+thread pays it before the message arrives.  Also measures what reading the
+health status costs while a probe is in flight (the Streamlit status bar
+reads it on every rerun).  Runs offline against the fake model.
+
+    python benchmarks/bench_warmup.py --connect 1.5 --latency 0.3
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+os.environ["HEALTH_FAKE_MODEL"] = "1"
+os.environ["HEALTH_RPM"] = "0"
+os.environ["HEALTH_TPM"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import model_gateway, model_router  # noqa: E402
+from utils.fake_model import FakeGenerativeModel  # noqa: E402
+from utils.health import STARTING, HealthMonitor  # noqa: E402
+from utils.model_router import FAST, STRONG, ModelRouter, Provider  # noqa: E402
+
+
+def _install(connect: float, latency: float) -> ModelRouter:
+    model_router._router = ModelRouter([
+        Provider("fake:fast", FAST, lambda: FakeGenerativeModel(
+            "fast", first_token_seconds=latency / 3, chunk_seconds=0.0, connect_seconds=connect)),
+        Provider("fake:strong", STRONG, lambda: FakeGenerativeModel(
+            "strong", first_token_seconds=latency, chunk_seconds=0.0, connect_seconds=connect)),
+    ])
+    return model_router._router
+
+
+def _first_requests() -> dict:
+    seconds = {}
+    for tier in (FAST, STRONG):
+        start = time.perf_counter()
+        asyncio.run(model_gateway.generate("how much water should I drink a day", tier=tier))
+        seconds[tier] = time.perf_counter() - start
+    return seconds
+
+
+def _print(label: str, seconds: dict) -> None:
+    print(f"{label:<18} " + "   ".join(f"first {tier} call {s * 1000:6.0f}ms" for tier, s in seconds.items()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connect", type=float, default=1.5, help="one-off setup seconds per provider")
+    parser.add_argument("--latency", type=float, default=0.3, help="strong model first-token seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    _install(args.connect, args.latency)
+    _print("no warm-up", _first_requests())
+
+    router = _install(args.connect, args.latency)
+    monitor = HealthMonitor(router).start()
+    reads = []
+    while True:  # what a rerun pays to show the status while warm-up runs
+        start = time.perf_counter()
+        state = monitor.status()["status"]
+        reads.append(time.perf_counter() - start)
+        if state != STARTING:
+            break
+        time.sleep(0.01)
+    _print("warmed up", _first_requests())
+    print(f"{'':<18} warm-up done ({state}); status() during warm-up: "
+          f"median {statistics.median(reads) * 1e6:.0f}us, max {max(reads) * 1e6:.0f}us over {len(reads)} reads")
+    monitor.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import uuid
 from typing import Optional, List, Dict
 from pydantic import BaseModel, Field
 
@@ -6,6 +7,11 @@ class UserSessionContext(BaseModel):
    
     name: str
     uid: int
+    # the conversation's own id (API / app session); escalation tickets are
+    # keyed on it, since ``uid`` only counts contexts within one process
+    session_id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    # stable owner for rate limits and usage (the API's caller:user), never the display name
+    user_id: str = ""
 
     goal: Optional[dict] = None
     diet_preferences: Optional[str] = None
@@ -9,6 +9,9 @@ from agents import (
     output_guardrail
 )
 from context import UserSessionContext
+from utils import token_usage
+from utils.deadline import within
+from utils.output_scanner import passes_review, scan_text
 
 
 class GoalInputGuardrailOutput(BaseModel):
@@ -28,8 +31,24 @@ async def validate_goal_input(
     agent: Agent,
     input: str
 ) -> GuardrailFunctionOutput:
-    result = await Runner.run(goal_check_agent, input, context=ctx.context)
+    result = await within(Runner.run(goal_check_agent, input, context=ctx.context), "input_guardrail")
+    token_usage.record_run(result, kind="input_guardrail")
     return GuardrailFunctionOutput(
         output_info=result.final_output,
         tripwire_triggered=not result.final_output.is_valid
     )
+
+
+# ──────────────────────────────────────────────────────────────
+# Output guardrail: local scan first, LLM check only for flagged spans
+# (the same check as the chat service, utils/output_scanner.passes_review)
+# ──────────────────────────────────────────────────────────────
+@output_guardrail
+async def validate_health_output(
+    ctx: RunContextWrapper[UserSessionContext],
+    agent: Agent,
+    output: str
+) -> GuardrailFunctionOutput:
+    scan = scan_text(str(output))
+    safe = await within(passes_review(scan, user=ctx.context.user_id or ctx.context.session_id), "output_guardrail")
+    return GuardrailFunctionOutput(output_info=scan, tripwire_triggered=not safe)
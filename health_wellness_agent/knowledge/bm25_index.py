@@ -0,0 +1,328 @@
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ──────────────────────────────────────────────────────────────
+# On-disk BM25 index over the health knowledge corpus
+#
+# The index is a list of immutable segments.  Each segment stores
+#   lexicon.json    term -> [start, count] into the postings arrays
+#   ids.u32         local passage ids      (memory-mapped)
+#   imp.f32         BM25 tf-component      (memory-mapped)
+#   passages.jsonl  passage records        (memory-mapped)
+#   offsets.u64     byte offset of every passage line (memory-mapped)
+#
+# Postings of a term are sorted by impact (the BM25 tf/length part), so a
+# query only walks the best MAX_POSTINGS_PER_TERM entries of very common terms
+# instead of the whole list.  The idf part depends on corpus-wide statistics
+# and is applied at query time, which keeps old segments valid when new ones
+# are added: incremental updates simply append a segment.  Passages of a
+# document that changed are retired by id (``remove_docs``, kept in the
+# manifest) and dropped from results; segments are never rewritten.
+# ──────────────────────────────────────────────────────────────
+
+K1 = 1.2
+B = 0.75
+MAX_POSTINGS_PER_TERM = 4000
+MIN_SEGMENT_POSTINGS = 256
+SEGMENT_PASSAGES = 100_000
+
+MANIFEST = "manifest.json"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in into is it its me my "
+    "not of on or our so that the their them then there these they this to was "
+    "we were what when which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+@dataclass
+class Passage:
+    id: int
+    text: str
+    title: str = ""
+    source: str = ""
+    score: float = 0.0
+
+
+def _mmap_array(path: str, typecode: str):
+    """Memory-map a flat binary file as a typed memoryview."""
+    if os.path.getsize(path) == 0:
+        return array(typecode), None
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm).cast(typecode), mm
+
+
+def _write_json_atomic(path: str, data) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class _Segment:
+    def __init__(self, path: str, doc_base: int):
+        self.path = path
+        self.doc_base = doc_base
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.n_docs = meta["n_docs"]
+        self.total_len = meta["total_len"]
+        with open(os.path.join(path, "lexicon.json"), encoding="utf-8") as f:
+            self.lexicon: Dict[str, List[int]] = json.load(f)
+        self.ids, self._ids_mm = _mmap_array(os.path.join(path, "ids.u32"), "I")
+        self.imp, self._imp_mm = _mmap_array(os.path.join(path, "imp.f32"), "f")
+        self.offsets, self._off_mm = _mmap_array(os.path.join(path, "offsets.u64"), "Q")
+        self.passages, self._pas_mm = _mmap_array(os.path.join(path, "passages.jsonl"), "B")
+
+    def df(self, term: str) -> int:
+        entry = self.lexicon.get(term)
+        return entry[1] if entry else 0
+
+    def passage(self, local_id: int) -> dict:
+        # slicing the mapping (no shared file position) keeps reads thread-safe
+        start = self.offsets[local_id]
+        end = self.offsets[local_id + 1] if local_id + 1 < self.n_docs else len(self.passages)
+        return json.loads(bytes(self.passages[start:end]))
+
+    def close(self) -> None:
+        views = (
+            (self.ids, self._ids_mm),
+            (self.imp, self._imp_mm),
+            (self.offsets, self._off_mm),
+            (self.passages, self._pas_mm),
+        )
+        for view, mm in views:
+            if mm is not None:
+                view.release()
+                mm.close()
+
+
+def _write_segment(path: str, records: List[dict]) -> None:
+    """Build one immutable segment from passage records."""
+    os.makedirs(path, exist_ok=True)
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    lengths = array("I")
+
+    offsets = array("Q")
+    with open(os.path.join(path, "passages.jsonl"), "wb") as f:
+        for local_id, record in enumerate(records):
+            offsets.append(f.tell())
+            f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+            tokens = tokenize(f"{record.get('title', '')} {record['text']}")
+            lengths.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((local_id, tf))
+
+    total_len = sum(lengths)
+    avgdl = (total_len / len(records)) if records else 1.0
+
+    ids, imp = array("I"), array("f")
+    lexicon: Dict[str, List[int]] = {}
+    for term, plist in postings.items():
+        scored = []
+        for local_id, tf in plist:
+            norm = K1 * (1 - B + B * lengths[local_id] / avgdl)
+            scored.append((tf * (K1 + 1) / (tf + norm), local_id))
+        scored.sort(reverse=True)
+        lexicon[term] = [len(ids), len(scored)]
+        ids.extend(local_id for _, local_id in scored)
+        imp.extend(score for score, _ in scored)
+
+    with open(os.path.join(path, "ids.u32"), "wb") as f:
+        ids.tofile(f)
+    with open(os.path.join(path, "imp.f32"), "wb") as f:
+        imp.tofile(f)
+    with open(os.path.join(path, "offsets.u64"), "wb") as f:
+        offsets.tofile(f)
+    _write_json_atomic(os.path.join(path, "lexicon.json"), lexicon)
+    _write_json_atomic(os.path.join(path, "meta.json"), {"n_docs": len(records), "total_len": total_len})
+
+
+class BM25Index:
+    """Segmented BM25 index living in ``directory``."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.segments: List[_Segment] = []
+        self.deleted: frozenset = frozenset()
+        self._load()
+
+    # ── loading ───────────────────────────────────────────────
+    def _manifest(self) -> dict:
+        path = os.path.join(self.directory, MANIFEST)
+        if not os.path.exists(path):
+            return {"segments": []}
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _load(self) -> None:
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        doc_base = 0
+        manifest = self._manifest()
+        self.deleted = frozenset(manifest.get("deleted", ()))
+        for name in manifest["segments"]:
+            segment = _Segment(os.path.join(self.directory, name), doc_base)
+            self.segments.append(segment)
+            doc_base += segment.n_docs
+
+    @property
+    def n_docs(self) -> int:
+        return sum(s.n_docs for s in self.segments)
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+    # ── incremental updates ───────────────────────────────────
+    def add_passages(self, records: Iterable[dict], segment_size: int = SEGMENT_PASSAGES) -> int:
+        """Append passages as new segment(s); returns the number added.
+
+        Each record needs a ``text`` key and may carry ``title``/``source``.
+        Existing segments are never rewritten.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self._manifest()
+        added = 0
+        batch: List[dict] = []
+
+        def _flush() -> None:
+            name = f"seg_{len(manifest['segments']) + 1:05d}"
+            _write_segment(os.path.join(self.directory, name), batch)
+            manifest["segments"].append(name)
+            _write_json_atomic(os.path.join(self.directory, MANIFEST), manifest)
+
+        for record in records:
+            if not record.get("text", "").strip():
+                continue
+            batch.append(record)
+            added += 1
+            if len(batch) >= segment_size:
+                _flush()
+                batch = []
+        if batch:
+            _flush()
+
+        self._load()
+        return added
+
+    def remove_docs(self, doc_ids: Iterable[int]) -> None:
+        """Retire passages so searches no longer return them.
+
+        Doc ids are stable (segments are only ever appended), so the ids are
+        recorded in the manifest and filtered at query time.
+        """
+        doc_ids = set(doc_ids)
+        if not doc_ids:
+            return
+        manifest = self._manifest()
+        manifest["deleted"] = sorted(set(manifest.get("deleted", ())) | doc_ids)
+        _write_json_atomic(os.path.join(self.directory, MANIFEST), manifest)
+        self._load()
+
+    def docs_from(self, source: str) -> List[int]:
+        """Ids of the live passages whose ``source`` is ``source`` (a full scan)."""
+        return [
+            segment.doc_base + local
+            for segment in self.segments
+            for local in range(segment.n_docs)
+            if segment.doc_base + local not in self.deleted and segment.passage(local).get("source") == source
+        ]
+
+    # ── search ────────────────────────────────────────────────
+    def search(self, query: str, k: int = 3, max_postings: int = MAX_POSTINGS_PER_TERM) -> List[Passage]:
+        terms = set(tokenize(query))
+        n_docs = self.n_docs
+        if not terms or not n_docs:
+            return []
+
+        scores: Dict[int, float] = {}
+        for term in terms:
+            df = sum(s.df(term) for s in self.segments)
+            if not df:
+                continue
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for segment in self.segments:
+                entry = segment.lexicon.get(term)
+                if not entry:
+                    continue
+                # the postings budget is shared between segments by size
+                budget = max(MIN_SEGMENT_POSTINGS, max_postings * segment.n_docs // n_docs)
+                start, count = entry
+                end = start + min(count, budget)
+                ids, imp, base = segment.ids, segment.imp, segment.doc_base
+                for i in range(start, end):
+                    doc = base + ids[i]
+                    scores[doc] = scores.get(doc, 0.0) + idf * imp[i]
+
+        for doc in self.deleted:
+            scores.pop(doc, None)
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self._passage(doc, score) for doc, score in top]
+
+    def _passage(self, doc: int, score: float) -> Passage:
+        for segment in self.segments:
+            if doc < segment.doc_base + segment.n_docs:
+                record = segment.passage(doc - segment.doc_base)
+                return Passage(
+                    id=doc,
+                    text=record["text"],
+                    title=record.get("title", ""),
+                    source=record.get("source", ""),
+                    score=score,
+                )
+        raise IndexError(doc)
+
+
+def format_passages(passages: List[Passage], max_chars: int = 600) -> str:
+    """Render retrieved passages as a compact reference block for a prompt."""
+    lines = []
+    for i, p in enumerate(passages, 1):
+        text = p.text if len(p.text) <= max_chars else p.text[:max_chars].rsplit(" ", 1)[0] + "..."
+        label = f"{p.title} ({p.source})" if p.source else p.title
+        lines.append(f"[{i}] {label}: {text}" if label else f"[{i}] {text}")
+    return "\n".join(lines)
+
+
+def _default_directory() -> str:
+    from utils.paths import DATA_DIR
+    return os.getenv("HEALTH_KB_DIR", os.path.join(DATA_DIR, "knowledge"))
+
+
+def index_version(directory: Optional[str] = None) -> Optional[float]:
+    """Modification time of the index manifest (changes with every update), or None."""
+    try:
+        return os.path.getmtime(os.path.join(directory or _default_directory(), MANIFEST))
+    except OSError:
+        return None
+
+
+def open_index(directory: Optional[str] = None) -> Optional[BM25Index]:
+    """Open the default knowledge index, or ``None`` if nothing was ingested."""
+    directory = directory or _default_directory()
+    if not os.path.exists(os.path.join(directory, MANIFEST)):
+        return None
+    index = BM25Index(directory)
+    return index if index.n_docs else None
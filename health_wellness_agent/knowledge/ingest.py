@@ -0,0 +1,138 @@
+"""Ingest a folder of vetted health/nutrition documents into the knowledge index.
+
+Usage (from the health_wellness_agent directory):
+
+    python -m knowledge.ingest path/to/corpus            # add new/changed files
+    python -m knowledge.ingest path/to/corpus --rebuild  # start from scratch
+
+Documents are ``.txt``/``.md`` files; the first non-empty line is used as the
+title.  Files already ingested (same path and content hash) are skipped, so
+re-running only indexes what changed; the passages of a changed or deleted
+file are retired from the index.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from typing import Dict, Iterator, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge.bm25_index import BM25Index  # noqa: E402
+from utils.paths import DATA_DIR  # noqa: E402
+
+PASSAGE_WORDS = 120
+EXTENSIONS = (".txt", ".md")
+INGESTED = "ingested.json"
+
+
+def default_index_dir() -> str:
+    return os.getenv("HEALTH_KB_DIR", os.path.join(DATA_DIR, "knowledge"))
+
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS) -> List[str]:
+    """Split on paragraphs, then pack paragraphs into ~max_words passages."""
+    passages, current = [], []
+    for paragraph in re.split(r"\n\s*\n", text):
+        words = paragraph.split()
+        while words:
+            room = max_words - len(current)
+            if room <= 0:
+                passages.append(" ".join(current))
+                current, room = [], max_words
+            current.extend(words[:room])
+            words = words[room:]
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def _iter_files(corpus_dir: str) -> Iterator[str]:
+    for root, _, files in os.walk(corpus_dir):
+        for name in sorted(files):
+            if name.lower().endswith(EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def _records(path: str, corpus_dir: str, text: str) -> Iterator[dict]:
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    title = lines[0].lstrip("# ").strip() if lines else os.path.basename(path)
+    source = os.path.relpath(path, corpus_dir)
+    for passage in split_passages(text):
+        yield {"title": title, "source": source, "text": passage}
+
+
+def _old_docs(index: BM25Index, source: str, entry) -> List[int]:
+    if isinstance(entry, dict):
+        return list(range(*entry["docs"]))
+    return index.docs_from(source)  # ingested before doc ranges were kept
+
+
+def ingest(corpus_dir: str, index_dir: Optional[str] = None, rebuild: bool = False) -> int:
+    index_dir = index_dir or default_index_dir()
+    if rebuild and os.path.isdir(index_dir):
+        shutil.rmtree(index_dir)
+    os.makedirs(index_dir, exist_ok=True)
+
+    # source -> {"sha1": content hash, "docs": [first, end) doc ids}
+    seen_path = os.path.join(index_dir, INGESTED)
+    seen: Dict[str, dict] = {}
+    if os.path.exists(seen_path):
+        with open(seen_path, encoding="utf-8") as f:
+            seen = json.load(f)
+
+    index = BM25Index(index_dir)
+    fresh: Dict[str, dict] = {}
+    present = set()
+    stale: List[int] = []
+    next_doc = index.n_docs
+
+    def _pending() -> Iterator[dict]:
+        nonlocal next_doc
+        for path in _iter_files(corpus_dir):
+            source = os.path.relpath(path, corpus_dir)
+            present.add(source)
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            previous = seen.get(source)
+            if previous is not None and (previous if isinstance(previous, str) else previous["sha1"]) == digest:
+                continue
+            if previous is not None:
+                stale.extend(_old_docs(index, source, previous))
+            # add_passages assigns consecutive ids to the records it keeps
+            records = [r for r in _records(path, corpus_dir, text) if r["text"].strip()]
+            fresh[source] = {"sha1": digest, "docs": [next_doc, next_doc + len(records)]}
+            next_doc += len(records)
+            yield from records
+
+    added = index.add_passages(_pending())
+    for source in set(seen) - present:  # deleted from the corpus
+        stale.extend(_old_docs(index, source, seen.pop(source)))
+    index.remove_docs(stale)
+    index.close()
+
+    seen.update(fresh)
+    with open(seen_path, "w", encoding="utf-8") as f:
+        json.dump(seen, f, indent=1)
+    return added
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus_dir")
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    added = ingest(args.corpus_dir, args.index_dir, args.rebuild)
+    print(f"Indexed {added} passages in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,23 @@
 import os
 import streamlit as st
 from dotenv import load_dotenv
-import tempfile
 import re
 from datetime import datetime
-from fpdf import FPDF
-import google.generativeai as genai
-import time
+import functools
+import queue
+import uuid
+
+from utils import rerun_profiler
+from utils.async_runner import get_background_loop
+from utils.cassette import get_cassette
+from utils.chat_service import TURN_REPLAY_SECONDS, chat_reply, remember, turn_key
+from utils.degradation import get_load_shedder
+from utils.health import DOWN, STARTING, get_health_monitor
+from utils.model_gateway import FAKE_MODEL
+from utils.session_analysis import analyze_session
+from utils.single_flight import get_single_flight
+from utils.token_usage import get_usage_store
+from knowledge.bm25_index import index_version, open_index
 
 # Load environment variables first
 load_dotenv()
@@ -19,9 +30,39 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Opt-in per-rerun profiling (HEALTH_PROFILE=1 or ?profile=1, see utils/rerun_profiler.py)
+_profile = rerun_profiler.start_rerun(st)
+_profile.mark("setup")
+
+# Partial reruns: the status bar, the conversation (chat list and input box)
+# and the action panel are fragments, so an interaction with one of them
+# reruns that function only, not the CSS, header and the rest of the page.
+# HEALTH_FRAGMENTS=0 reruns the whole script on every interaction instead.
+FRAGMENTS = os.getenv("HEALTH_FRAGMENTS", "1") == "1"
+STATUS_REFRESH_SECONDS = float(os.getenv("HEALTH_STATUS_REFRESH_SECONDS", "15"))  # 0: on full reruns only
+
+# Cross-session memory needs an identity the app can trust: the request
+# header an authenticating reverse proxy sets (e.g. X-Forwarded-Email from
+# oauth2-proxy), named by HEALTH_USER_HEADER.  Without one, memory lives as
+# long as the browser session; a URL parameter is never taken as identity.
+USER_HEADER = os.getenv("HEALTH_USER_HEADER", "")
+
+def _authenticated_user() -> str:
+    if not USER_HEADER:
+        return ""
+    from streamlit.web.server.websocket_headers import _get_websocket_headers
+    headers = _get_websocket_headers() or {}
+    return next((value for key, value in headers.items() if key.lower() == USER_HEADER.lower()), "")
+
+def _fragment(run_every: float = 0):
+    if not FRAGMENTS:
+        return lambda func: func
+    return st.experimental_fragment(run_every=run_every or None)
+
 # Check API key before importing other modules
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
+_replaying = get_cassette() is not None and get_cassette().replaying  # offline, from a recorded session
+if not GEMINI_API_KEY and not os.getenv("GROQ_API_KEY") and not FAKE_MODEL and not _replaying:
     st.error("❌ **GEMINI_API_KEY not found!**")
     st.info("📝 **How to fix this:**")
     st.code("""
@@ -32,9 +73,19 @@ if not GEMINI_API_KEY:
     """)
     st.stop()
 
-# Configure Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-pro")
+# Warm the model clients and start health probes in the background, once per
+# worker; the first render does not wait for it (see utils/health.py)
+get_health_monitor().start()
+
+# Local knowledge index (None until a corpus is ingested with knowledge/ingest.py);
+# cached per manifest version, so a re-ingest is picked up without a restart
+@st.cache_resource(max_entries=1)
+def _knowledge_index(version):
+    return open_index()
+
+
+def get_knowledge_index():
+    return _knowledge_index(index_version())
 
 # Initialize session state
 if "chat" not in st.session_state:
@@ -45,6 +96,25 @@ if "dark_mode" not in st.session_state:
     st.session_state.dark_mode = True
 if "typing" not in st.session_state:
     st.session_state.typing = False
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if "user_id" not in st.session_state:
+    # owner of the cross-session memory and cached answers (never the display
+    # name): the proxy-authenticated user, else this browser session only
+    user = _authenticated_user()
+    st.session_state.user_id = f"auth:{user}" if user else uuid.uuid4().hex
+    if "uid" in st.query_params:
+        del st.query_params["uid"]  # links from before carried the id; it grants nothing now
+if "analyze_requested" not in st.session_state:
+    st.session_state.analyze_requested = False
+if "analysis_cache" not in st.session_state:
+    st.session_state.analysis_cache = {}
+if "turn_id" not in st.session_state:
+    st.session_state.turn_id = None  # idempotency key of the chat turn being answered
+if "pdf_export" not in st.session_state:
+    st.session_state.pdf_export = None  # (chat length, pdf bytes) of the last export
+if "action_panel_shown" not in st.session_state:
+    st.session_state.action_panel_shown = False  # the action panel fragment drew its buttons
 
 # Strip emojis and non-latin1 characters for PDF
 def _strip_nonlatin(text: str) -> str:
@@ -54,6 +124,10 @@ def _strip_nonlatin(text: str) -> str:
 # Export PDF function
 def export_chat_to_pdf() -> str:
     """Export chat history to PDF file"""
+    # imported on first export: fpdf (and PIL behind it) are not needed to render the chat
+    import tempfile
+    from fpdf import FPDF
+
     try:
         pdf = FPDF()
         pdf.add_page()
@@ -1255,50 +1329,71 @@ def get_css():
         """
 
 # Apply CSS
+_profile.mark("css")
 st.markdown(get_css(), unsafe_allow_html=True)
 
-# Gemini API call function
-def get_gemini_response(prompt: str) -> str:
+# Gemini API call function (prompt assembly and safety checks live in utils/chat_service.py)
+def get_gemini_response(prompt: str, turn_id: str = None) -> str:
     try:
-        health_context = f"""
-        You are an advanced personal AI health intelligence system. You're assisting {st.session_state.name or 'User'}.
-        
-        Core Parameters:
-        - Provide advanced, evidence-based health intelligence
-        - Maintain professional, authoritative tone
-        - Always recommend professional medical consultation for serious concerns
-        - Deliver precise, actionable health protocols
-        - Use sophisticated, clinical language when appropriate
-        - Keep responses focused and impactful
-        
-        Query: {prompt}
-        """
-        
-        response = model.generate_content(health_context)
-        return response.text
+        session_id = st.session_state.session_id
+        run_turn = functools.partial(
+            chat_reply,
+            prompt,
+            name=st.session_state.name,
+            session_id=session_id,
+            user_id=st.session_state.user_id,
+            kb=get_knowledge_index(),
+            snapshot={"chat": st.session_state.chat[-10:]},
+        )
+        # a rerun while this turn is still being answered joins the running
+        # generation (or replays its result) instead of starting a second one
+        if turn_id:
+            flight = get_single_flight().do(f"{session_id}:turn:{turn_id}", run_turn, remember=TURN_REPLAY_SECONDS)
+        else:
+            flight = get_single_flight().do(turn_key(session_id, prompt), run_turn)
+        reply = get_background_loop().run(flight, cancel_on_interrupt=False)
+        return reply.text
     except Exception as e:
         return "AI SYSTEM ERROR: Connection to health intelligence network interrupted. Attempting reconnection..."
 
-# Status bar
-st.markdown(f"""
-<div class="status-bar">
-    <div class="status-left">
-        <div class="neural-indicator">
-            <div class="neural-dot"></div>
-            AI ACTIVE
+# Status bar (cached health snapshot, never waits on a probe); it reruns on
+# its own every STATUS_REFRESH_SECONDS, so warm-up and outages show without
+# an interaction
+@_fragment(run_every=STATUS_REFRESH_SECONDS)
+def status_bar():
+    with rerun_profiler.fragment(st, "status_bar", _profile) as profile:
+        profile.mark("status_bar")
+        health = get_health_monitor().status()["status"]
+        if health == STARTING:
+            ai_state = 'AI WARMING UP'
+        elif health == DOWN:
+            ai_state = 'AI OFFLINE'
+        elif get_load_shedder().degraded:
+            ai_state = 'AI REDUCED MODE'
+        else:
+            ai_state = 'AI ACTIVE'
+        st.markdown(f"""
+        <div class="status-bar">
+            <div class="status-left">
+                <div class="neural-indicator">
+                    <div class="neural-dot"></div>
+                    {ai_state}
+                </div>
+                {f'<div class="user-badge">{st.session_state.name}</div>' if st.session_state.name else ''}
+            </div>
+            <div class="theme-switch" onclick="toggleTheme()">
+                {'NIGHT MODE' if st.session_state.dark_mode else 'DAY MODE'}
+            </div>
         </div>
-        {f'<div class="user-badge">{st.session_state.name}</div>' if st.session_state.name else ''}
-    </div>
-    <div class="theme-switch" onclick="toggleTheme()">
-        {'NIGHT MODE' if st.session_state.dark_mode else 'DAY MODE'}
-    </div>
-</div>
-""", unsafe_allow_html=True)
+        """, unsafe_allow_html=True)
+
+status_bar()
 
 # Main container
 st.markdown('<div class="nexus-container">', unsafe_allow_html=True)
 
 # Header
+_profile.mark("header")
 st.markdown("""
 <div class="nexus-header">
     <div class="nexus-logo">
@@ -1310,6 +1405,7 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Name input screen if not set
+_profile.mark("name_screen")
 if not st.session_state.name.strip():
     st.markdown("""
     <div class="name-prompt">
@@ -1330,172 +1426,253 @@ if not st.session_state.name.strip():
     st.markdown('</div>', unsafe_allow_html=True)
     st.stop()
 
-# Theme toggle
+# Theme toggle (the CSS and every fragment change with it: full rerun)
+_profile.mark("theme_toggle")
 col1, col2, col3 = st.columns([2, 1, 2])
 with col2:
     if st.button(f"{'🌙 NIGHT' if not st.session_state.dark_mode else '☀️ DAY'}", use_container_width=True):
         st.session_state.dark_mode = not st.session_state.dark_mode
         st.rerun()
 
-# Chat interface
-st.markdown('<div class="chat-interface">', unsafe_allow_html=True)
-
-# Chat header
-st.markdown(f"""
-<div class="chat-header">
-    <div class="session-info">SESSION: ACTIVE</div>
-    <div class="chat-stats">
-        <span>MSG: <span class="stat">{len(st.session_state.chat)}</span></span>
-        <span>QRY: <span class="stat">{len([msg for role, msg in st.session_state.chat if role == 'user'])}</span></span>
-    </div>
-</div>
-""", unsafe_allow_html=True)
-
-# Chat messages area
-st.markdown('<div class="chat-messages">', unsafe_allow_html=True)
-
-if not st.session_state.chat:
-    # Welcome screen
-    st.markdown(f"""
-    <div class="welcome-screen">
-        <h2 class="welcome-title">AI CONNECTION ESTABLISHED</h2>
-        <p class="welcome-subtitle">
-            Welcome, {st.session_state.name}. I am your advanced personal health intelligence system.
-            I provide evidence-based health analysis, wellness optimization protocols, and medical insights.
-        </p>
-        <div class="capabilities">
-            <div class="capability">
-                <div class="capability-title">🧬 HEALTH ANALYSIS</div>
-                Advanced symptom evaluation and health risk assessment
-            </div>
-            <div class="capability">
-                <div class="capability-title">⚕️ MEDICAL INSIGHTS</div>
-                Evidence-based medical information and treatment protocols
-            </div>
-            <div class="capability">
-                <div class="capability-title">💪 OPTIMIZATION</div>
-                Personalized fitness and nutrition optimization strategies
+def _message_html(role: str, msg: str) -> str:
+    if role == "user":
+        return f"""
+        <div class="message">
+            <div class="user-message">
+                <div class="user-bubble">{msg}</div>
             </div>
         </div>
+        """
+    return f"""
+    <div class="message">
+        <div class="ai-message">
+            <div class="ai-avatar">⚡</div>
+            <div class="ai-bubble">{msg}</div>
+        </div>
     </div>
-    """, unsafe_allow_html=True)
-else:
-    # Render chat messages
-    for role, msg in st.session_state.chat:
-        if role == "user":
-            st.markdown(f"""
-            <div class="message">
-                <div class="user-message">
-                    <div class="user-bubble">{msg}</div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div class="message">
-                <div class="ai-message">
-                    <div class="ai-avatar">⚡</div>
-                    <div class="ai-bubble">{msg}</div>
+    """
+
+# Send (⚡ callback, runs before the conversation fragment reruns)
+def _send():
+    text = st.session_state.neural_input.strip()
+    # (a double click re-sends the message that is still being answered; ignore it)
+    if text and st.session_state.chat[-1:] != [("user", text)]:
+        st.session_state.chat.append(("user", text))
+        st.session_state.turn_id = uuid.uuid4().hex
+        remember(st.session_state.user_id, text, st.session_state.session_id)
+        st.session_state.typing = True
+
+# Conversation: chat list and input box.  They share one fragment because a
+# fragment can only rerun itself and a send has to redraw the list; the
+# list is drawn into a container above the input, after the input, so the
+# input box stays live while an answer is generated.
+@_fragment()
+def conversation():
+    with rerun_profiler.fragment(st, "conversation", _profile) as profile:
+        st.markdown('<div class="chat-interface">', unsafe_allow_html=True)
+        chat_area = st.container()
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        # Input zone
+        profile.mark("input")
+        st.markdown('<div class="input-zone">', unsafe_allow_html=True)
+        st.markdown('<div class="input-container">', unsafe_allow_html=True)
+
+        st.text_input(
+            "",
+            placeholder="Input health query or medical concern...",
+            key="neural_input",
+            label_visibility="collapsed"
+        )
+
+        col_input, col_send = st.columns([6, 1])
+        with col_send:
+            st.button("⚡", help="Transmit", use_container_width=True, on_click=_send)
+
+        st.markdown('</div>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+        profile.mark("chat_render")
+        with chat_area:
+            # Chat header (filled in last, with the counts after this rerun's answer)
+            chat_header = st.empty()
+
+            # Chat messages area
+            st.markdown('<div class="chat-messages">', unsafe_allow_html=True)
+
+            if not st.session_state.chat:
+                # Welcome screen
+                st.markdown(f"""
+                <div class="welcome-screen">
+                    <h2 class="welcome-title">AI CONNECTION ESTABLISHED</h2>
+                    <p class="welcome-subtitle">
+                        Welcome, {st.session_state.name}. I am your advanced personal health intelligence system.
+                        I provide evidence-based health analysis, wellness optimization protocols, and medical insights.
+                    </p>
+                    <div class="capabilities">
+                        <div class="capability">
+                            <div class="capability-title">🧬 HEALTH ANALYSIS</div>
+                            Advanced symptom evaluation and health risk assessment
+                        </div>
+                        <div class="capability">
+                            <div class="capability-title">⚕️ MEDICAL INSIGHTS</div>
+                            Evidence-based medical information and treatment protocols
+                        </div>
+                        <div class="capability">
+                            <div class="capability-title">💪 OPTIMIZATION</div>
+                            Personalized fitness and nutrition optimization strategies
+                        </div>
+                    </div>
                 </div>
-            </div>
-            """, unsafe_allow_html=True)
-    
-    # Typing indicator
-    if st.session_state.typing:
-        st.markdown("""
-        <div class="typing-indicator">
-            AI processing...
-            <div class="neural-waves">
-                <div class="wave"></div>
-                <div class="wave"></div>
-                <div class="wave"></div>
-                <div class="wave"></div>
-                <div class="wave"></div>
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+                """, unsafe_allow_html=True)
+            else:
+                # Render chat messages
+                for role, msg in st.session_state.chat:
+                    st.markdown(_message_html(role, msg), unsafe_allow_html=True)
 
-st.markdown('</div>', unsafe_allow_html=True)
+                # Streamed session analysis (ANALYZE button)
+                if st.session_state.analyze_requested:
+                    report_placeholder = st.empty()
 
-# Input zone
-st.markdown('<div class="input-zone">', unsafe_allow_html=True)
-st.markdown('<div class="input-container">', unsafe_allow_html=True)
+                    def _render_report(text: str) -> None:
+                        report_placeholder.markdown(_message_html("analysis", text), unsafe_allow_html=True)
 
-user_input = st.text_input(
-    "",
-    placeholder="Input health query or medical concern...",
-    key="neural_input",
-    label_visibility="collapsed"
-)
+                    _render_report("🧬 Analysing session...")
+                    progress = queue.Queue()
+                    try:
+                        # runs on the shared background loop; partial text comes back via
+                        # ``progress`` so the placeholder is only touched from this thread
+                        run_analysis = functools.partial(
+                            analyze_session,
+                            None,  # routed: fast model for chunk summaries, strong for the report
+                            list(st.session_state.chat),
+                            st.session_state.analysis_cache,
+                            name=st.session_state.name or "User",
+                            session_id=st.session_state.session_id,
+                            user_id=st.session_state.user_id,
+                            on_text=progress.put_nowait,
+                        )
+                        # a second click (or rerun) while analysing joins the running analysis
+                        flight_key = f"{st.session_state.session_id}:analysis:{len(st.session_state.chat)}"
+                        with profile.section("analysis"):
+                            report = get_background_loop().run(
+                                get_single_flight().do(flight_key, run_analysis, remember=60),
+                                progress=progress,
+                                on_progress=_render_report,
+                                cancel_on_interrupt=False,
+                            )
+                    except Exception:
+                        report = "AI SYSTEM ERROR: Session analysis failed. Please try again."
+                    st.session_state.chat.append(("analysis", report))
+                    st.session_state.analyze_requested = False
+                    _render_report(report)
 
-col_input, col_send = st.columns([6, 1])
-with col_send:
-    send_clicked = st.button("⚡", help="Transmit", use_container_width=True)
+            # Process AI response
+            profile.mark("response")
+            if st.session_state.chat and st.session_state.chat[-1][0] == "user":
+                reply_placeholder = st.empty()
+                # Typing indicator
+                if st.session_state.typing:
+                    reply_placeholder.markdown("""
+                    <div class="typing-indicator">
+                        AI processing...
+                        <div class="neural-waves">
+                            <div class="wave"></div>
+                            <div class="wave"></div>
+                            <div class="wave"></div>
+                            <div class="wave"></div>
+                            <div class="wave"></div>
+                        </div>
+                    </div>
+                    """, unsafe_allow_html=True)
+                with st.spinner("🧠 AI PROCESSING..."):
+                    try:
+                        user_message = st.session_state.chat[-1][1]
+                        # red flags are answered locally inside chat_reply, before any model call
+                        with profile.section("model"):
+                            ai_response = get_gemini_response(user_message, st.session_state.turn_id)
+                    except Exception as e:
+                        ai_response = "AI DIAGNOSTIC: System temporarily unavailable. Retrying connection..."
+                if ai_response:
+                    st.session_state.chat.append(("assistant", ai_response))
+                    st.session_state.typing = False
+                    reply_placeholder.markdown(_message_html("assistant", ai_response), unsafe_allow_html=True)
+                    if FRAGMENTS and not st.session_state.action_panel_shown:
+                        st.rerun()  # first answer: the action panel fragment has to appear
 
-st.markdown('</div>', unsafe_allow_html=True)
-st.markdown('</div>', unsafe_allow_html=True)
-st.markdown('</div>', unsafe_allow_html=True)
+            st.markdown('</div>', unsafe_allow_html=True)
+            chat_header.markdown(f"""
+            <div class="chat-header">
+                <div class="session-info">SESSION: ACTIVE</div>
+                <div class="chat-stats">
+                    <span>MSG: <span class="stat">{len(st.session_state.chat)}</span></span>
+                    <span>QRY: <span class="stat">{len([msg for role, msg in st.session_state.chat if role == 'user'])}</span></span>
+                    <span>TOK: <span class="stat">{get_usage_store().session_totals(st.session_state.session_id).total}</span></span>
+                </div>
+            </div>
+            """, unsafe_allow_html=True)
 
-# Handle message sending
-if send_clicked and user_input.strip():
-    st.session_state.chat.append(("user", user_input.strip()))
-    st.session_state.typing = True
-    st.rerun()
+conversation()
 
-# Process AI response
-if st.session_state.chat and st.session_state.chat[-1][0] == "user":
-    with st.spinner("🧠 AI PROCESSING..."):
-        try:
-            user_message = st.session_state.chat[-1][1]
-            ai_response = get_gemini_response(user_message)
-            
-            if ai_response:
-                st.session_state.chat.append(("assistant", ai_response))
+# Action panel (EXPORT reruns only the panel; RESET and ANALYZE change the
+# conversation, so they rerun the whole script)
+@_fragment()
+def action_panel():
+    with rerun_profiler.fragment(st, "action_panel", _profile) as profile:
+        profile.mark("action_panel")
+        st.session_state.action_panel_shown = bool(st.session_state.chat)
+        if not st.session_state.chat:
+            return
+        st.markdown('<div class="action-panel">', unsafe_allow_html=True)
+        
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            if st.button("🔄 RESET", use_container_width=True):
+                st.session_state.chat = []
                 st.session_state.typing = False
-                time.sleep(0.1)
+                st.session_state.analyze_requested = False
+                st.session_state.analysis_cache = {}
+                st.session_state.pdf_export = None
                 st.rerun()
-                
-        except Exception as e:
-            st.session_state.chat.append(("assistant", "AI DIAGNOSTIC: System temporarily unavailable. Retrying connection..."))
-            st.session_state.typing = False
-            st.rerun()
-
-# Action panel
-if st.session_state.chat:
-    st.markdown('<div class="action-panel">', unsafe_allow_html=True)
-    
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        if st.button("🔄 RESET", use_container_width=True):
-            st.session_state.chat = []
-            st.session_state.typing = False
-            st.rerun()
-    
-    with col2:
-        try:
-            pdf_path = export_chat_to_pdf()
-            if pdf_path:
-                with open(pdf_path, "rb") as file:
-                    st.download_button(
-                        "📄 EXPORT",
-                        data=file,
-                        file_name=f"nexus_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                        mime="application/pdf",
-                        use_container_width=True
-                    )
+        
+        with col2:
+            # the PDF is built only when asked for, not on every rerun
+            export_slot = st.empty()
+            export = st.session_state.pdf_export
+            if not (export and export[0] == len(st.session_state.chat)) and export_slot.button("📄 EXPORT", use_container_width=True):
                 try:
-                    os.unlink(pdf_path)
-                except:
-                    pass
-        except Exception as e:
-            st.error(f"Export error: {e}")
-    
-    with col3:
-        if st.button("🧬 ANALYZE", use_container_width=True):
-            st.session_state.chat.append(("user", "Provide comprehensive health analysis based on our discussion"))
-            st.rerun()
-    
-    st.markdown('</div>', unsafe_allow_html=True)
+                    with profile.section("pdf_export"):
+                        pdf_path = export_chat_to_pdf()
+                    if pdf_path:
+                        with open(pdf_path, "rb") as file:
+                            st.session_state.pdf_export = (len(st.session_state.chat), file.read())
+                        try:
+                            os.unlink(pdf_path)
+                        except:
+                            pass
+                except Exception as e:
+                    st.error(f"Export error: {e}")
+            export = st.session_state.pdf_export
+            if export and export[0] == len(st.session_state.chat):
+                export_slot.download_button(
+                    "📄 DOWNLOAD",
+                    data=export[1],
+                    file_name=f"nexus_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+                    mime="application/pdf",
+                    use_container_width=True
+                )
+        
+        with col3:
+            if st.button("🧬 ANALYZE", use_container_width=True):
+                st.session_state.analyze_requested = True
+                st.rerun()
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+
+action_panel()
+
+st.markdown('</div>', unsafe_allow_html=True)
 
-st.markdown('</div>', unsafe_allow_html=True)
\ No newline at end of file
+# Profiling overlay (no-op unless profiling is on)
+rerun_profiler.render(st, _profile)
@@ -0,0 +1,73 @@
+import hashlib
+import math
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# ──────────────────────────────────────────────────────────────
+# Local text embedding (no network, no model download)
+#
+# Feature hashing of (stop-word filtered, lightly stemmed) word unigrams and
+# bigrams into a fixed number of signed buckets, with sublinear term frequency
+# and L2 normalisation, so the dot product of two embeddings is their cosine
+# similarity.
+# ──────────────────────────────────────────────────────────────
+
+DIMENSIONS = 2048
+BIGRAM_WEIGHT = 0.5
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a about am an and any are as at be been but by can could do does for from "
+    "had has have how i if in into is it its just me my of on or our so "
+    "some that the their them then there these they this to too very was we "
+    "were what when which who will with would you your".split()
+)
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ies", "es", "ed", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def _features(text: str) -> List[Tuple[str, float]]:
+    words = [_stem(w) for w in _WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+    return [(w, 1.0) for w in words] + [(f"{a} {b}", BIGRAM_WEIGHT) for a, b in zip(words, words[1:])]
+
+
+def _bucket(feature: str, dims: int):
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dims, (1.0 if value >> 63 else -1.0)
+
+
+def _sublinear(count: float) -> float:
+    magnitude = abs(count)
+    if magnitude > 1:
+        magnitude = 1 + math.log(magnitude)
+    return math.copysign(magnitude, count)
+
+
+def embed_sparse(text: str, dims: int = DIMENSIONS) -> Dict[int, float]:
+    """Hashed features as a sparse ``{bucket: weight}`` mapping (L2-normalised)."""
+    counts: Dict[int, float] = {}
+    for feature, weight in _features(text):
+        index, sign = _bucket(feature, dims)
+        counts[index] = counts.get(index, 0.0) + sign * weight
+
+    weights = {i: _sublinear(c) for i, c in counts.items() if c}
+    norm = math.sqrt(sum(w * w for w in weights.values()))
+    if not norm:
+        return {}
+    return {i: w / norm for i, w in weights.items()}
+
+
+def embed(text: str, dims: int = DIMENSIONS) -> np.ndarray:
+    """Dense float32 embedding of ``text``; all zeros for empty text."""
+    vector = np.zeros(dims, dtype=np.float32)
+    for index, weight in embed_sparse(text, dims).items():
+        vector[index] = weight
+    return vector
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from memory.hashing_embedder import DIMENSIONS, embed
+from utils import metrics
+
+# ──────────────────────────────────────────────────────────────
+# Per-user cross-session memory
+#
+#   vectors.f32    one float32 row per remembered message (memory-mapped)
+#   records.jsonl  the matching text + metadata, one line per row
+#
+# Search is a single matrix-vector product over the mapped matrix followed by
+# an argpartition for the top-k, so it never replays the chat history.
+#
+# Indexes are keyed on an opaque user id owned by the session or the
+# authenticated caller, never on the display name: two people who type the
+# same name must not see each other's memories.  At most MAX_OPEN indexes
+# (HEALTH_MEMORY_OPEN_INDEXES) stay open; the least recently used is closed
+# beyond that, and a caller still holding it is sent to a reopened one.
+# ──────────────────────────────────────────────────────────────
+
+MIN_WORDS = 4          # very short messages ("ok", "thanks") carry no facts
+MIN_SCORE = 0.15       # cosine similarity below this is noise for hashed features
+MAX_OPEN = int(os.getenv("HEALTH_MEMORY_OPEN_INDEXES", "256"))
+
+
+@dataclass
+class Memory:
+    text: str
+    session_id: str
+    timestamp: float
+    score: float = 0.0
+
+
+def user_key(user_id: str) -> str:
+    """Stable, non-reversible directory name for a user id."""
+    return hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:16]
+
+
+class MemoryIndex:
+    def __init__(self, directory: str, dims: int = DIMENSIONS):
+        self.directory = directory
+        self.dims = dims
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._records_path = os.path.join(directory, "records.jsonl")
+        self._lock = threading.Lock()
+        self._records: List[dict] = []
+        self._seen = set()
+        self._matrix: Optional[np.memmap] = None
+        self._closed = False
+        self._load()
+
+    def _load(self) -> None:
+        if os.path.exists(self._records_path):
+            with open(self._records_path, encoding="utf-8") as f:
+                self._records = [json.loads(line) for line in f if line.strip()]
+        # a crash between the two appends can leave one file a row ahead
+        rows = os.path.getsize(self._vectors_path) // (4 * self.dims) if os.path.exists(self._vectors_path) else 0
+        n = min(rows, len(self._records))
+        self._records = self._records[:n]
+        self._seen = {r["text"].strip().lower() for r in self._records}
+        self._remap(n)
+
+    def _remap(self, rows: int) -> None:
+        self._matrix = (
+            np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dims))
+            if rows else None
+        )
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, text: str, session_id: str = "") -> bool:
+        """Remember ``text``; returns False if it is too short or a duplicate."""
+        text = text.strip()
+        if len(text.split()) < MIN_WORDS or text.lower() in self._seen:
+            return False
+        vector = embed(text, self.dims)
+        record = {"text": text, "session_id": session_id, "timestamp": time.time()}
+        with self._lock:
+            if not self._closed:
+                if text.lower() in self._seen:
+                    return False
+                with open(self._vectors_path, "ab") as f:
+                    f.write(vector.tobytes())
+                with open(self._records_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._records.append(record)
+                self._seen.add(text.lower())
+                self._remap(len(self._records))
+                return True
+        # evicted while the caller held it: only the open index writes the files
+        return _open(self.directory, self.dims).add(text, session_id)
+
+    def close(self) -> None:
+        """Release the mapped matrix and records; later calls go to a reopened index."""
+        with self._lock:
+            self._closed = True
+            self._matrix, self._records, self._seen = None, [], set()
+
+    def search(
+        self,
+        query: str,
+        k: int = 3,
+        *,
+        exclude_session: Optional[str] = None,
+        min_score: float = MIN_SCORE,
+    ) -> List[Memory]:
+        """Top-k remembered messages by cosine similarity to ``query``."""
+        if self._closed:
+            return _open(self.directory, self.dims).search(query, k, exclude_session=exclude_session,
+                                                           min_score=min_score)
+        matrix, records = self._matrix, self._records
+        if matrix is None or not query.strip():
+            return []
+        scores = matrix @ embed(query, self.dims)
+        if exclude_session is not None:
+            mask = np.fromiter((r["session_id"] == exclude_session for r in records[:len(scores)]), dtype=bool)
+            scores = np.where(mask, -1.0, scores)
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            Memory(
+                text=records[i]["text"],
+                session_id=records[i]["session_id"],
+                timestamp=records[i]["timestamp"],
+                score=float(scores[i]),
+            )
+            for i in top
+            if scores[i] >= min_score
+        ]
+
+
+_indexes: "OrderedDict[str, MemoryIndex]" = OrderedDict()  # least recently used first
+_indexes_lock = threading.Lock()
+
+
+def _open(directory: str, dims: int = DIMENSIONS) -> MemoryIndex:
+    with _indexes_lock:
+        index = _indexes.get(directory)
+        if index is None:
+            index = _indexes[directory] = MemoryIndex(directory, dims)
+        _indexes.move_to_end(directory)
+        evicted = [_indexes.popitem(last=False)[1] for _ in range(len(_indexes) - max(MAX_OPEN, 1))]
+    for old in evicted:
+        old.close()
+    metrics.set_gauge("memory_indexes_open", len(_indexes))
+    return index
+
+
+def get_memory_index(user_id: str, base_dir: Optional[str] = None) -> MemoryIndex:
+    """Process-wide MemoryIndex for the user ``user_id`` (not a display name)."""
+    if base_dir is None:
+        from utils.paths import DATA_DIR
+        base_dir = os.path.join(DATA_DIR, "memory")
+    return _open(os.path.join(base_dir, user_key(user_id)))
+
+
+def format_memories(memories: List[Memory]) -> str:
+    return "\n".join(f"- {m.text}" for m in memories)
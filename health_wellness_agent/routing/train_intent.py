@@ -0,0 +1,95 @@
+"""Train the local intent classifier used by routing/intent_router.py.
+
+    python -m routing.train_intent [--examples routing/intent_examples.jsonl]
+
+Multinomial logistic regression over the hashed features of
+memory/hashing_embedder.py, trained with plain SGD.  Prints held-out accuracy
+on a deterministic 20% split, then retrains on everything and writes
+routing/intent_model.json.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from typing import Dict, List, Tuple
+
+ROUTING_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(ROUTING_DIR))
+
+from memory.hashing_embedder import DIMENSIONS, embed_sparse  # noqa: E402
+
+EPOCHS = 40
+LEARNING_RATE = 0.5
+L2 = 1e-4
+
+Example = Tuple[Dict[int, float], int]
+
+
+def _softmax(scores: List[float]) -> List[float]:
+    top = max(scores)
+    exps = [math.exp(s - top) for s in scores]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+def train(examples: List[Example], n_classes: int, seed: int = 0):
+    rng = random.Random(seed)
+    weights = [dict() for _ in range(n_classes)]
+    bias = [0.0] * n_classes
+    order = list(examples)
+    for epoch in range(EPOCHS):
+        rng.shuffle(order)
+        lr = LEARNING_RATE / (1 + epoch * 0.1)
+        for features, label in order:
+            probs = _softmax([bias[c] + sum(weights[c].get(i, 0.0) * v for i, v in features.items())
+                              for c in range(n_classes)])
+            for c in range(n_classes):
+                grad = probs[c] - (1.0 if c == label else 0.0)
+                bias[c] -= lr * grad
+                w = weights[c]
+                for i, v in features.items():
+                    w[i] = w.get(i, 0.0) * (1 - lr * L2) - lr * grad * v
+    return weights, bias
+
+
+def predict(weights, bias, features: Dict[int, float]) -> int:
+    scores = [bias[c] + sum(weights[c].get(i, 0.0) * v for i, v in features.items())
+              for c in range(len(bias))]
+    return max(range(len(scores)), key=scores.__getitem__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--examples", default=os.path.join(ROUTING_DIR, "intent_examples.jsonl"))
+    parser.add_argument("--output", default=os.path.join(ROUTING_DIR, "intent_model.json"))
+    args = parser.parse_args()
+
+    with open(args.examples, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    classes = sorted({row["intent"] for row in rows})
+    examples = [(embed_sparse(row["text"]), classes.index(row["intent"])) for row in rows]
+
+    shuffled = list(examples)
+    random.Random(42).shuffle(shuffled)
+    cut = len(shuffled) // 5
+    held_out, train_set = shuffled[:cut], shuffled[cut:]
+    weights, bias = train(train_set, len(classes))
+    correct = sum(predict(weights, bias, x) == y for x, y in held_out)
+    print(f"held-out accuracy: {correct}/{len(held_out)} ({correct / max(1, len(held_out)):.0%})")
+
+    weights, bias = train(examples, len(classes))
+    model = {
+        "dims": DIMENSIONS,
+        "classes": classes,
+        "bias": [round(b, 5) for b in bias],
+        "weights": [{str(i): round(v, 5) for i, v in w.items() if abs(v) > 1e-4} for w in weights],
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(model, f, separators=(",", ":"))
+    print(f"wrote {args.output} ({len(classes)} classes, {len(rows)} examples)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,15 @@
 from agents import Agent
 
+from tools.escalation import request_human_support
+
 escalation_agent = Agent(
     name="Escalation Agent",
-    instructions="You are a human support assistant. Help the user and prepare to hand them off to a real human if needed."
+    instructions=(
+        "You are a human support assistant. Help the user and, when they ask "
+        "for a person or the situation needs one, call request_human_support "
+        "with a short reason and an urgency (emergency for risk to life, high "
+        "for medical concerns, normal otherwise). Tell the user their ticket "
+        "number and expected wait."
+    ),
+    tools=[request_human_support],
 )
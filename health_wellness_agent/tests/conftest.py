@@ -0,0 +1,16 @@
+"""Tests run against the local fake model and a throwaway data directory.
+
+    python -m pytest tests      (from the health_wellness_agent directory)
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("HEALTH_DATA_DIR", tempfile.mkdtemp(prefix="health_tests_"))
+os.environ.setdefault("HEALTH_FAKE_MODEL", "1")
+os.environ.setdefault("HEALTH_FAKE_LATENCY", "0")
+os.environ.setdefault("HEALTH_FAKE_CHUNK_LATENCY", "0")
+os.environ.setdefault("HEALTH_WARMUP", "0")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
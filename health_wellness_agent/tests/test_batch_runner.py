@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import batch_runner
+from batch_runner import Checkpoint
+from utils.escalation_queue import get_escalation_queue
+
+RECORDS = [
+    {"id": "a", "user": "ana", "message": "How much water should I drink a day?"},
+    {"id": "b", "user": "ben", "message": "Any tips for better sleep?"},
+    "",
+    "not json",
+    {"id": "c", "user": "ana", "message": ""},
+    {"id": "d", "user": "cem", "message": "I have crushing chest pain and can't breathe"},
+    {"id": "e", "user": "ben", "message": "What is a good post-workout snack?"},
+]
+
+
+def write_input(tmp_path):
+    path = tmp_path / "cohort.jsonl"
+    lines = [r if isinstance(r, str) else json.dumps(r) for r in RECORDS]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def results(path):
+    with open(path, encoding="utf-8") as f:
+        return {r["line"]: r for r in map(json.loads, f)}
+
+
+def test_checkpoint_watermark_follows_the_completed_prefix(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "out.ckpt"), "cohort.jsonl")
+    for line in (2, 3, 5):
+        checkpoint.mark(line)
+    assert (checkpoint.watermark, checkpoint.done) == (0, {2, 3, 5})
+    checkpoint.mark(1)
+    assert (checkpoint.watermark, checkpoint.done) == (3, {5})
+    assert checkpoint.is_done(2) and checkpoint.is_done(5) and not checkpoint.is_done(4)
+    checkpoint.save(123)
+
+    loaded = Checkpoint(str(tmp_path / "out.ckpt"), "cohort.jsonl")
+    assert loaded.load() and (loaded.watermark, loaded.done, loaded.output_bytes) == (3, {5}, 123)
+    with pytest.raises(SystemExit):
+        Checkpoint(str(tmp_path / "out.ckpt"), "other.jsonl").load()
+
+
+def test_every_record_gets_one_result_and_escalations_are_only_listed(tmp_path):
+    source, output = write_input(tmp_path), str(tmp_path / "results.jsonl")
+    open_before = len(get_escalation_queue().open_tickets())
+    batch_runner.main([source, output, "--workers", "3", "--retries", "0"])
+
+    by_line = results(output)
+    assert sorted(by_line) == [1, 2, 4, 5, 6, 7]  # the blank line has no result
+    assert by_line[1]["id"] == "a" and by_line[1]["reply"]
+    assert "invalid record" in by_line[4]["error"]
+    assert by_line[5]["error"] == "missing 'message'"
+    assert by_line[6]["emergency"] and by_line[6]["escalations"]
+    assert len(get_escalation_queue().open_tickets()) == open_before  # historical: no staff tickets
+    with pytest.raises(SystemExit):
+        batch_runner.main([source, output])  # refuses to append without --resume
+
+
+def test_resume_writes_each_remaining_record_exactly_once(tmp_path):
+    source, output = write_input(tmp_path), str(tmp_path / "results.jsonl")
+    batch_runner.main([source, output, "--workers", "1", "--limit", "2"])
+    assert sorted(results(output)) == [1, 2]
+
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"line": 4, "partial": tr')  # a crash mid-write after the last checkpoint
+    batch_runner.main([source, output, "--workers", "2", "--resume"])
+    with open(output, encoding="utf-8") as f:
+        lines = [json.loads(line)["line"] for line in f]
+    assert sorted(lines) == [1, 2, 4, 5, 6, 7]
@@ -0,0 +1,50 @@
+import asyncio
+
+from context import UserSessionContext
+from utils.context_merge import merge_into, run_concurrently
+
+
+def context():
+    return UserSessionContext(name="ana", uid=1, handoff_logs=["start"])
+
+
+def copies(base, n):
+    return [base.model_copy(deep=True) for _ in range(n)]
+
+
+def test_steps_run_on_isolated_copies_and_their_changes_are_merged():
+    shared = context()
+
+    async def meals(copy):
+        await asyncio.sleep(0.01)
+        copy.meal_plan = ["Day 1: Lentil soup"]
+        copy.handoff_logs.append("meals")
+        return "meals"
+
+    async def workouts(copy):
+        assert copy.meal_plan is None  # never sees the other step's writes
+        copy.workout_plan = {"level": "beginner"}
+        copy.handoff_logs.append("workouts")
+        return "workouts"
+
+    assert asyncio.run(run_concurrently(shared, meals, workouts)) == ["meals", "workouts"]
+    assert shared.meal_plan == ["Day 1: Lentil soup"]
+    assert shared.workout_plan == {"level": "beginner"}
+    assert shared.handoff_logs == ["start", "meals", "workouts"]  # appended in step order
+
+
+def test_conflicting_writes_are_reported_and_the_later_step_wins():
+    target = context()
+    before, first, second = copies(target, 3)
+    first.diet_preferences, second.diet_preferences = "vegan", "vegetarian"
+    second.injury_notes = "knee"
+    assert merge_into(target, before, [first, second]) == ["diet_preferences"]
+    assert (target.diet_preferences, target.injury_notes) == ("vegetarian", "knee")
+
+
+def test_a_list_rewritten_by_a_step_is_taken_as_a_whole():
+    target = context()
+    before, trimmed, untouched = copies(target, 3)
+    trimmed.handoff_logs = ["summary"]
+    assert merge_into(target, before, [trimmed, untouched]) == []
+    assert target.handoff_logs == ["summary"]
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from utils import deadline
+from utils.deadline import DeadlineExceeded
+
+
+def test_within_is_a_plain_await_outside_a_turn():
+    async def answer():
+        await asyncio.sleep(0.01)
+        return 42
+
+    assert asyncio.run(deadline.within(answer(), "model")) == 42
+    assert deadline.current() is None
+
+
+def test_expiry_cancels_the_work_and_blames_the_innermost_stage():
+    cancelled = []
+
+    async def slow_tool():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def turn():
+        with deadline.deadline(0.05) as turn_deadline:
+            with deadline.stage("agent:planner"):
+                with pytest.raises(DeadlineExceeded) as info:
+                    await deadline.within(deadline.within(slow_tool(), "tool:plan_meals"), "agent_run")
+        return turn_deadline, info.value
+
+    turn_deadline, error = asyncio.run(turn())
+    assert cancelled == [True]
+    assert error.stage == turn_deadline.blown == "tool:plan_meals"
+    assert set(turn_deadline.spent) == {"tool:plan_meals", "agent_run", "agent:planner"}
+
+
+def test_a_timeout_of_the_work_itself_is_not_a_blown_deadline():
+    async def flaky():
+        raise asyncio.TimeoutError("upstream read timeout")
+
+    async def turn():
+        with deadline.deadline(5) as turn_deadline:
+            with pytest.raises(asyncio.TimeoutError) as info:
+                await deadline.within(flaky(), "model")
+        return turn_deadline, info.value
+
+    turn_deadline, error = asyncio.run(turn())
+    assert not isinstance(error, DeadlineExceeded)
+    assert turn_deadline.blown is None
+
+
+def test_an_inner_deadline_cannot_outlive_the_outer_one():
+    async def turn():
+        with deadline.deadline(0.05) as outer:
+            with deadline.deadline(10) as inner:
+                assert inner is outer
+            with deadline.deadline(0.01) as shorter:
+                assert shorter is not outer and deadline.current() is shorter
+            assert deadline.current() is outer
+
+    asyncio.run(turn())
+
+
+def test_tasks_started_in_a_turn_share_its_deadline():
+    async def turn():
+        with deadline.deadline(0.05) as turn_deadline:
+            seen = await asyncio.create_task(asyncio.sleep(0, deadline.current()))
+            with pytest.raises(DeadlineExceeded):
+                await asyncio.gather(deadline.within(asyncio.sleep(5), "guardrail:input"))
+        return turn_deadline, seen
+
+    turn_deadline, seen = asyncio.run(turn())
+    assert seen is turn_deadline and turn_deadline.blown == "guardrail:input"
@@ -0,0 +1,28 @@
+import pytest
+
+from context import UserSessionContext
+from utils.degradation import local_answer
+
+
+def test_local_plans_leave_the_session_context_alone():
+    context = UserSessionContext(name="a", uid=1)
+    text, source = local_answer("I'm vegetarian, suggest a meal plan to lose 5kg in 2 months", context=context)
+    assert source == "plan" and "meal plan" in text
+    assert context.diet_preferences is None
+    assert context.goal is None and context.meal_plan is None and context.workout_plan is None
+
+
+@pytest.mark.parametrize("message, vegetarian", [
+    ("suggest a vegetarian meal plan for the week", True),
+    ("I'm not vegetarian, suggest a meal plan for the week", False),
+    ("I am no longer a vegetarian, suggest a meal plan for the week", False),
+    ("suggest a non-vegetarian meal plan for the week", False),
+])
+def test_vegetarian_is_read_from_the_message_with_negations(message, vegetarian, monkeypatch):
+    import tools.plan_builders as builders
+
+    seen = []
+    real = builders.build_meal_plan
+    monkeypatch.setattr(builders, "build_meal_plan", lambda context: seen.append(context.diet_preferences) or real(context))
+    local_answer(message, context=UserSessionContext(name="a", uid=1))
+    assert seen == ["vegetarian" if vegetarian else None]
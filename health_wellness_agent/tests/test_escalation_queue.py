@@ -0,0 +1,96 @@
+import pytest
+
+from context import UserSessionContext
+from utils import escalation_queue
+from utils.escalation_queue import EscalationQueue, hold_escalations
+from utils.journal import Journal
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journal.jsonl")
+
+
+def test_stores_sharing_a_journal_keep_sessions_apart(journal_path):
+    app, api = EscalationQueue(journal_path), EscalationQueue(journal_path)
+    alice = app.enqueue("session-alice", "Alice", "wants a human", "normal", {"chat": ["alice"]})
+    bob = api.enqueue("session-bob", "Bob", "red flag", "emergency", {"chat": ["bob"]})
+
+    assert bob.id != alice.id and bob.user_name == "Bob" and bob.snapshot == {"chat": ["bob"]}
+    assert {t.user_name for t in app.open_tickets()} == {"Alice", "Bob"}
+
+    # the same session escalated from the other process only raises the urgency
+    again = api.enqueue("session-alice", "Alice", "red flag", "emergency")
+    assert again.id == alice.id
+    (upgraded,) = [t for t in app.open_tickets() if t.id == alice.id]
+    assert upgraded.urgency == "emergency"
+
+
+def test_contexts_get_their_own_session_ids():
+    # ``uid`` restarts at 1 in every process; tickets must not merge on it
+    first, second = UserSessionContext(name="a", uid=1), UserSessionContext(name="b", uid=1)
+    assert first.session_id != second.session_id
+
+
+def test_claims_and_resolutions_are_seen_by_the_other_store(journal_path):
+    app, staff = EscalationQueue(journal_path), EscalationQueue(journal_path)
+    low = app.enqueue("s1", "A", "question", "low")
+    urgent = app.enqueue("s2", "B", "red flag", "emergency")
+
+    claimed = staff.claim("nurse")
+    assert claimed.id == urgent.id
+    assert app.position(low.id) == 1 and app.position(urgent.id) == 0
+    assert staff.resolve(urgent.id)
+    assert [t.id for t in app.open_tickets()] == [low.id]
+
+
+def test_compaction_keeps_what_other_stores_appended(journal_path, monkeypatch):
+    monkeypatch.setattr(escalation_queue, "COMPACT_AFTER", 3)
+    first, second = EscalationQueue(journal_path), EscalationQueue(journal_path)
+    kept = []
+    for i in range(20):
+        queue = (first, second)[i % 2]
+        ticket = queue.enqueue(f"s{i}", f"user {i}", "question")
+        if i % 3:
+            assert queue.resolve(ticket.id)
+        else:
+            kept.append(ticket.id)
+
+    for queue in (first, second, EscalationQueue(journal_path)):
+        assert sorted(t.id for t in queue.open_tickets()) == sorted(kept)
+    with open(journal_path) as f:
+        assert sum(1 for _ in f) < 20  # compacted
+
+
+def test_held_escalations_are_not_queued(journal_path):
+    queue = EscalationQueue(journal_path)
+    with hold_escalations() as held:
+        ticket = queue.enqueue("s1", "A", "red flag", "emergency")
+    assert ticket.status == "held"
+    assert held == [{"urgency": "emergency", "reason": "red flag"}]
+    assert queue.open_tickets() == []
+
+
+def test_journal_follows_rewrites_by_another_process(journal_path):
+    reader, writer = Journal(journal_path), Journal(journal_path)
+    writer.read_new()
+    writer.append({"n": 1})
+    assert reader.read_new() == (False, [{"n": 1}])
+
+    # two rewrites: the second may get the first replaced file's inode back
+    for n in (2, 3):
+        writer.read_new()
+        writer.rewrite([{"n": n}])
+    assert reader.read_new() == (True, [{"n": 3}])
+    writer.append({"n": 4})
+    assert reader.read_new() == (False, [{"n": 4}])
+
+
+def test_journal_leaves_a_partial_line_for_later(journal_path):
+    journal = Journal(journal_path)
+    with open(journal_path, "w") as f:
+        f.write('{"n": 1}\n{"n": ')
+    assert journal.read_new() == (False, [{"n": 1}])
+    with open(journal_path, "a") as f:
+        f.write('2}\n')
+    assert journal.read_new() == (False, [{"n": 2}])
@@ -0,0 +1,33 @@
+import os
+
+from knowledge.bm25_index import BM25Index, open_index
+
+
+def _index(directory, passages):
+    index = BM25Index(directory)
+    index.add_passages({"title": title, "source": title.lower(), "text": text} for title, text in passages)
+    return index
+
+
+def test_removed_docs_are_not_returned(tmp_path):
+    index = _index(str(tmp_path), [("Sleep", "Seven to nine hours of sleep a night"),
+                                   ("Nap", "A short nap of twenty minutes restores alertness")])
+    index.remove_docs(index.docs_from("sleep"))
+    for reopened in (index, open_index(str(tmp_path))):
+        assert [p.title for p in reopened.search("hours of sleep and nap", k=3)] == ["Nap"]
+
+
+def test_api_reopens_the_index_after_ingest(tmp_path, monkeypatch):
+    import api
+
+    monkeypatch.setenv("HEALTH_KB_DIR", str(tmp_path))
+    _index(str(tmp_path), [("Sleep", "Seven to nine hours of sleep a night")])
+    kb = api.KnowledgeIndex()
+    first = kb.get()
+    assert kb.get() is first  # unchanged: no reopen
+
+    _index(str(tmp_path), [("Caffeine", "Caffeine has a half-life of about five hours")])
+    manifest = os.path.join(str(tmp_path), "manifest.json")
+    os.utime(manifest, (os.path.getmtime(manifest) + 1,) * 2)  # coarse mtime clocks
+    assert kb.get() is not first
+    assert kb.get().search("caffeine half-life", k=1)
@@ -0,0 +1,25 @@
+from memory import memory_index
+from memory.memory_index import get_memory_index
+
+
+def test_open_indexes_are_bounded_and_evicted_ones_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_index, "MAX_OPEN", 2)
+    monkeypatch.setattr(memory_index, "_indexes", memory_index.OrderedDict())
+    first = get_memory_index("first", str(tmp_path))
+    assert first.add("I sleep about five hours a night", "s1")
+    get_memory_index("second", str(tmp_path))
+    get_memory_index("third", str(tmp_path))
+
+    assert len(memory_index._indexes) == 2
+    assert first._closed and first._matrix is None
+
+    # a caller still holding the evicted index is served by a reopened one
+    (memory,) = first.search("how many hours do I sleep", k=1)
+    assert memory.text == "I sleep about five hours a night"
+    assert first.add("I drink three coffees before noon", "s2")
+    assert len(get_memory_index("first", str(tmp_path))) == 2
+
+
+def test_memories_are_keyed_on_the_user_id(tmp_path):
+    get_memory_index("user-a", str(tmp_path)).add("I am allergic to peanuts and shellfish", "s1")
+    assert get_memory_index("user-b", str(tmp_path)).search("what am I allergic to") == []
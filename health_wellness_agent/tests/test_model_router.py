@@ -0,0 +1,138 @@
+"""GeminiModel against the installed google-generativeai (no key or network needed), and routing.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import model_gateway, model_router  # noqa: E402
+from utils.model_router import FAST, STRONG, GeminiModel, ModelRouter, Provider  # noqa: E402
+
+
+@pytest.mark.parametrize("model_name", ["gemini-1.5-pro", "gemini-pro"])
+def test_system_instruction_fits_the_installed_sdk(monkeypatch, model_name):
+    import google.generativeai as genai
+
+    sent = {}
+    monkeypatch.setattr(genai.GenerativeModel, "generate_content",
+                        lambda self, prompt, **kwargs: sent.update(model=self, prompt=prompt))
+    gemini = GeminiModel(model_name)
+    gemini.generate_content("How much water?", system="Be brief.")  # builds a real GenerativeModel
+
+    if gemini.system_instruction:
+        assert sent["prompt"] == "How much water?"
+        assert sent["model"] is gemini._model("Be brief.")
+    else:
+        assert sent["prompt"] == "Be brief.\n\nHow much water?"
+        assert sent["model"] is gemini._model(None)
+
+
+# ── routing ────────────────────────────────────────────────────
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Answer:
+    def __init__(self, text=None, error=None):
+        self.text, self.error, self.calls = text, error, 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return model_router._Text(self.text)
+
+
+def provider(name, tier, model=None):
+    return Provider(name, tier, lambda: model or Answer(name))
+
+
+def names(providers):
+    return [p.name for p in providers]
+
+
+@pytest.mark.parametrize("message, tier", [
+    ("How much water should I drink?", FAST),
+    ("Plan my workouts for next week", STRONG),
+    ("Why do I feel tired after lunch?", STRONG),
+    (" ".join(["word"] * 40), STRONG),
+])
+def test_queries_are_classified_by_length_and_intent(message, tier):
+    assert model_router.classify_query(message) == tier
+
+
+def test_own_tier_comes_first_ordered_by_latency_and_errors():
+    slow, quick, strong = provider("slow", FAST), provider("quick", FAST), provider("strong", STRONG)
+    router = ModelRouter([slow, quick, strong], clock=Clock())
+    router.record(slow, 2.0)
+    router.record(quick, 0.5)
+    router.record(strong, 3.0)
+    assert names(router.candidates(FAST)) == ["quick", "slow", "strong"]
+    router.record(quick, error=TimeoutError())  # one error costs more than the latency gap
+    assert names(router.candidates(FAST)) == ["slow", "quick", "strong"]
+    with pytest.raises(ValueError):
+        router.candidates("medium")
+
+
+def test_fast_calls_use_a_strong_model_that_is_currently_faster():
+    fast, strong = provider("fast", FAST), provider("strong", STRONG)
+    router = ModelRouter([fast, strong], clock=Clock())
+    router.record(fast, 8.0)
+    router.record(strong, 1.0)
+    assert names(router.candidates(FAST)) == ["strong", "fast"]
+    assert names(router.candidates(STRONG)) == ["strong", "fast"]
+
+
+def test_circuit_opens_after_repeated_failures_and_closes_after_the_cooldown():
+    clock = Clock()
+    flaky, backup = provider("flaky", STRONG), provider("backup", STRONG)
+    router = ModelRouter([flaky, backup], clock=clock)
+    router.record(backup, 5.0)
+    for _ in range(model_router.CIRCUIT_FAILURES):
+        router.record(flaky, error=ConnectionError())
+    assert names(router.candidates(STRONG)) == ["backup", "flaky"]  # tripped ones are a last resort
+    assert [s["available"] for s in router.stats()] == [False, True]
+    clock.now += model_router.CIRCUIT_COOLDOWN + 1
+    assert router.stats()[0]["available"]
+    router.record(flaky, error=ConnectionError())
+    router.probed(flaky)  # a passing health probe puts it straight back
+    assert router.stats()[0]["available"] and flaky.failures == 0
+
+
+def test_every_nth_call_probes_the_least_recently_measured_provider():
+    clock = Clock()
+    stale, best = provider("stale", STRONG), provider("best", STRONG)
+    router = ModelRouter([stale, best], clock=clock)
+    router.record(stale, 9.0)
+    clock.now += 60
+    router.record(best, 1.0)
+    firsts = [router.candidates(STRONG)[0].name for _ in range(model_router.PROBE_EVERY)]
+    assert firsts == ["best"] * (model_router.PROBE_EVERY - 1) + ["stale"]
+
+
+def test_generate_fails_over_to_the_next_provider(monkeypatch):
+    down = Answer(error=ConnectionError("503"))
+    router = ModelRouter([provider("down", STRONG, down), provider("up", STRONG)], clock=Clock())
+    monkeypatch.setattr(model_gateway, "get_router", lambda: router)
+    assert asyncio.run(model_gateway.generate("Hello", user="tests")) == "up"
+    assert down.calls == 1 and router.providers[0].failures == 1
+
+
+def test_providers_without_a_key_are_skipped(monkeypatch):
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    spec = "groq:llama-3.1-8b-instant, gemini:gemini-1.5-flash"
+    assert names(model_router.parse_providers(spec, FAST)) == ["gemini:gemini-1.5-flash"]
+    with pytest.raises(ValueError):
+        model_router.parse_providers("openai:gpt-4", FAST)
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from utils import model_gateway
+from utils.output_scanner import BLOCK, REVIEW, StreamingOutputScanner, passes_review, scan_text
+
+
+def categories(state, severity):
+    return [f.category for f in state.flags if f.severity == severity]
+
+
+def test_unsafe_advice_halts_the_stream_as_soon_as_it_completes():
+    scanner = StreamingOutputScanner()
+    for chunk in ["You could just stop ", "taking your medi"]:
+        assert not scanner.feed(chunk).halted
+    assert scanner.feed("cation today.").halted
+    scanner.feed(" More text.")
+    assert scanner.text.endswith("cation today.")  # nothing is taken in after a halt
+    assert categories(scanner.close(), BLOCK) == ["unsafe_advice"]
+
+
+@pytest.mark.parametrize("text", [
+    "Please do not stop taking your medication without talking to your GP.",
+    "You should never double the dose if you miss one.",
+])
+def test_negated_advice_is_only_sent_for_review(text):
+    state = scan_text(text)
+    assert not state.halted
+    assert categories(state, REVIEW) == ["unsafe_advice"]
+
+
+def test_negation_in_an_earlier_clause_does_not_excuse_the_advice():
+    assert scan_text("Don't worry about it. Just stop taking your medication.").halted
+
+
+def test_doses_are_flagged_only_next_to_a_drug():
+    assert categories(scan_text("Take 400 mg of ibuprofen with food."), REVIEW) == ["dosage"]
+    assert categories(scan_text("The 400 mg dose works best."), REVIEW) == ["dosage"]
+    assert scan_text("A slice has 300 mg of sodium and 2 mg of iron.").flags == []
+
+
+def test_a_dose_split_across_chunks_is_caught_once():
+    scanner = StreamingOutputScanner()
+    for chunk in ["Most adults take 5", "00 mg of para", "cetamol every six hours."]:
+        scanner.feed(chunk)
+    spans = scanner.close().review_spans
+    assert len(spans) == 1 and "500 mg" in spans[0].text
+
+
+def test_diagnosis_claims_need_review_but_do_not_halt():
+    state = scan_text("From what you describe, you have diabetes.")
+    assert not state.halted and categories(state, REVIEW) == ["diagnosis"]
+
+
+def test_passes_review_checks_only_the_flagged_spans(monkeypatch):
+    seen = []
+
+    async def generate(prompt, **kwargs):
+        seen.append((prompt, kwargs["user"]))
+        return "UNSAFE"
+
+    monkeypatch.setattr(model_gateway, "generate", generate)
+    clean = scan_text("Aim for five portions of vegetables a day.")
+    flagged = scan_text("Eat well. Take 1000 mg of metformin twice a day.")
+
+    assert asyncio.run(passes_review(clean, user="u1")) is True
+    assert asyncio.run(passes_review(flagged, user="u1")) is False
+    assert asyncio.run(passes_review(scan_text("Just drink bleach."), user="u1")) is False
+    assert len(seen) == 1 and "metformin" in seen[0][0] and seen[0][1] == "u1"
+
+
+def test_a_checker_outage_does_not_block_the_answer(monkeypatch):
+    async def generate(prompt, **kwargs):
+        raise ConnectionError("model down")
+
+    monkeypatch.setattr(model_gateway, "generate", generate)
+    assert asyncio.run(passes_review(scan_text("Take 200 mg of ibuprofen."))) is True
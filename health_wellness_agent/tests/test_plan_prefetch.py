@@ -0,0 +1,92 @@
+import asyncio
+
+from context import UserSessionContext
+from tools.plan_builders import VEGETARIAN_MEALS
+from utils import plan_prefetch
+from utils.plan_prefetch import PlanPrefetcher
+
+GOAL = {"quantity": 5, "metric": "kg", "duration": "2 months", "experience_level": "beginner"}
+
+
+def user(uid, **fields):
+    return UserSessionContext(name=f"user{uid}", uid=uid, goal=dict(GOAL), **fields)
+
+
+def test_nothing_is_prefetched_when_disabled_or_without_a_goal():
+    async def main():
+        assert not PlanPrefetcher(enabled=False).schedule(user(1))
+        assert not PlanPrefetcher(enabled=True).schedule(UserSessionContext(name="x", uid=2))
+
+    asyncio.run(main())
+
+
+def test_plan_is_served_without_waiting_for_the_narrative():
+    async def main():
+        done = asyncio.Event()
+
+        async def writer(context):
+            await done.wait()
+            return "Your week at a glance."
+
+        prefetcher = PlanPrefetcher(enabled=True, narrative_writer=writer)
+        context = user(1, diet_preferences="vegetarian")
+        assert prefetcher.schedule(context)
+        assert not prefetcher.schedule(context)  # same version: already under way
+
+        plan = await asyncio.wait_for(prefetcher.take(context), 1)
+        assert plan.meal_plan == VEGETARIAN_MEALS and plan.narrative is None
+        done.set()
+        await asyncio.sleep(0.01)
+        assert plan.narrative == "Your week at a glance."
+
+        fresh = user(1, diet_preferences="vegetarian")
+        plan.apply(fresh)
+        assert fresh.meal_plan == VEGETARIAN_MEALS and fresh.workout_plan["level"] == "beginner"
+
+    asyncio.run(main())
+
+
+def test_plan_is_dropped_when_a_field_it_depends_on_changes():
+    async def main():
+        prefetcher = PlanPrefetcher(enabled=True)
+        context = user(1)
+        prefetcher.schedule(context)
+        context.handoff_logs.append("planner -> nutrition")  # not a plan input
+        assert await prefetcher.take(context) is not None
+        context.diet_preferences = "vegetarian"
+        assert await prefetcher.take(context) is None
+        assert await prefetcher.take(context) is None  # and it is gone for good
+
+    asyncio.run(main())
+
+
+def test_a_failing_narrative_writer_keeps_the_plan():
+    async def writer(context):
+        raise RuntimeError("model down")
+
+    async def main():
+        prefetcher = PlanPrefetcher(enabled=True, narrative_writer=writer)
+        context = user(1)
+        prefetcher.schedule(context)
+        await asyncio.sleep(0.01)
+        plan = await prefetcher.take(context)
+        assert plan is not None and plan.meal_plan and plan.narrative is None
+
+    asyncio.run(main())
+
+
+def test_least_recently_used_users_are_evicted(monkeypatch):
+    monkeypatch.setattr(plan_prefetch, "MAX_ENTRIES", 2)
+
+    async def main():
+        prefetcher = PlanPrefetcher(enabled=True)
+        first, second, third = user(1), user(2), user(3)
+        prefetcher.schedule(first)
+        prefetcher.schedule(second)
+        assert await prefetcher.take(first) is not None  # first is now the most recent
+        prefetcher.schedule(third)
+        assert await prefetcher.take(second) is None
+        assert await prefetcher.take(first) is not None
+        assert await prefetcher.take(third) is not None
+
+    asyncio.run(main())
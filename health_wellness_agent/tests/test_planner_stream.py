@@ -0,0 +1,48 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import agent
+from context import UserSessionContext
+
+
+def _stream(monkeypatch, deltas):
+    """stream_planner over a fake agent run yielding ``deltas``; returns (items, closed)."""
+    planner = SimpleNamespace(name="Planner")
+    closed = []
+
+    async def fake_run(message, context, target, decision, budget):
+        try:
+            for delta in deltas:
+                yield delta
+            yield SimpleNamespace(final_output="".join(deltas), last_agent=target)
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(agent, "_start_turn", lambda message, context: (None, planner, None))
+    monkeypatch.setattr(agent, "_stream_agents", fake_run)
+    monkeypatch.setattr(agent, "get_cassette", lambda: None)
+
+    async def collect():
+        return [item async for item in agent.stream_planner("plan", UserSessionContext(name="a", uid=1))]
+
+    return asyncio.run(collect()), closed
+
+
+def test_stream_stops_at_the_first_blocked_span(monkeypatch):
+    items, closed = _stream(monkeypatch, ["Your plan is ready. ", "You can stop taking ", "insulin on rest days. ",
+                                          "More text that must never be sent."])
+    *text, last = items
+    assert "".join(text) == "Your plan is ready. You can stop taking "  # the blocked phrase is never sent
+    assert isinstance(last, agent.HaltedResult) and last.final_output == agent.HALTED_MESSAGE
+    assert last.last_agent.name == "Planner"
+    assert closed == [True]  # the run was abandoned
+
+
+@pytest.mark.parametrize("deltas", [["Walk 30 minutes ", "a day and ", "drink water."]])
+def test_safe_stream_passes_through(monkeypatch, deltas):
+    items, _ = _stream(monkeypatch, deltas)
+    *text, last = items
+    assert text == deltas
+    assert not getattr(last, "halted", False) and last.final_output == "".join(deltas)
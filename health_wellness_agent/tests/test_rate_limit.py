@@ -0,0 +1,193 @@
+import asyncio
+
+import pytest
+
+from utils import rate_limit
+from utils.rate_limit import FairRateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def fast_dispatch(monkeypatch):
+    monkeypatch.setattr(rate_limit, "MAX_DISPATCH_SLEEP", 0.005)
+
+
+async def drain(limiter, user="warmup"):
+    """Use up the request bucket so later callers have to queue."""
+    while limiter.requests.level >= 1:
+        await limiter.acquire(user, 1)
+
+
+async def settle(tasks, done):
+    for _ in range(200):
+        await asyncio.sleep(0.005)
+        if sum(t.done() for t in tasks) >= done:
+            return
+    raise AssertionError("grant never arrived")
+
+
+def test_waiting_users_are_served_round_robin():
+    clock = Clock()
+    limiter = FairRateLimiter(rpm=60, tpm=0, clock=clock)  # one request a second
+    order = []
+
+    async def call(user):
+        await limiter.acquire(user, 10)
+        order.append(user)
+
+    async def main():
+        await drain(limiter)
+        tasks = [asyncio.create_task(call(user)) for user in ("heavy", "heavy", "heavy", "light")]
+        await asyncio.sleep(0.01)
+        assert limiter.waiting()["interactive"] == {"heavy": 3, "light": 1}
+        for done in range(1, 5):
+            clock.now += 1
+            await settle(tasks, done)
+
+    asyncio.run(main())
+    # the light user goes second even though it queued last
+    assert order == ["heavy", "light", "heavy", "heavy"]
+
+
+def test_cancelled_waiter_leaves_the_queue_without_spending_quota():
+    clock = Clock()
+    limiter = FairRateLimiter(rpm=60, tpm=6000, clock=clock)
+
+    async def main():
+        await drain(limiter)
+        requests, tokens = limiter.requests.level, limiter.tokens.level
+        task = asyncio.create_task(limiter.acquire("alice", 50))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert limiter.waiting()["interactive"] == {}
+        assert (limiter.requests.level, limiter.tokens.level) == (requests, tokens)
+
+    asyncio.run(main())
+
+
+def test_grant_cancelled_before_the_call_runs_is_refunded(monkeypatch):
+    monkeypatch.setattr(rate_limit, "MAX_DISPATCH_SLEEP", 60)  # grant by hand below
+    clock = Clock()
+    limiter = FairRateLimiter(rpm=60, tpm=6000, clock=clock)
+
+    async def main():
+        await drain(limiter)
+        task = asyncio.create_task(limiter.acquire("alice", 50))
+        await asyncio.sleep(0.01)
+        clock.now += 1
+        limiter.requests.wait_time(0)  # bring the levels up to date before comparing
+        limiter.tokens.wait_time(0)
+        requests, tokens = limiter.requests.level, limiter.tokens.level
+        grant, _ = limiter._next()
+        assert grant is not None and grant.granted
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        limiter._dispatcher.cancel()
+        assert limiter.requests.level == pytest.approx(requests)
+        assert limiter.tokens.level == pytest.approx(tokens)
+
+    asyncio.run(main())
+
+
+def test_release_settles_the_token_estimate():
+    limiter = FairRateLimiter(rpm=0, tpm=6000, clock=Clock())  # frozen clock: no refill
+
+    async def main():
+        start = limiter.tokens.level
+        grant = await limiter.acquire("alice", 100)
+        assert limiter.tokens.level == start - 100
+        limiter.release(grant, 40)
+        assert limiter.tokens.level == start - 40
+        grant = await limiter.acquire("alice", 100)
+        limiter.release(grant, 300)
+        assert limiter.tokens.level == start - 340
+
+    asyncio.run(main())
+
+
+def test_token_bucket_refills_at_the_quota_rate():
+    clock = Clock()
+    bucket = rate_limit.TokenBucket(60, burst_seconds=10, clock=clock)
+    assert bucket.capacity == 10
+    bucket.take(10)
+    assert bucket.wait_time(3) == pytest.approx(3)
+    clock.now += 2
+    assert bucket.wait_time(3) == pytest.approx(1)
+    assert bucket.wait_time(50) == pytest.approx(8)  # oversized asks wait for a full bucket only
+    clock.now += 100
+    assert bucket.wait_time(1) == 0 and bucket.level == 10
+
+
+def test_interactive_calls_jump_ahead_of_queued_background_work():
+    clock = Clock()
+    limiter = FairRateLimiter(rpm=60, tpm=0, clock=clock)
+    order = []
+
+    async def call(user, lane):
+        await limiter.acquire(user, 10, lane=lane)
+        order.append(user)
+
+    async def main():
+        await drain(limiter)
+        batch = asyncio.create_task(call("batch", rate_limit.BACKGROUND))
+        await asyncio.sleep(0.01)
+        chat = asyncio.create_task(call("alice", rate_limit.INTERACTIVE))
+        clock.now += 1
+        await settle([chat], 1)
+        assert not batch.done()  # one request of quota is below the background reserve
+        clock.now += 3
+        await settle([batch], 1)
+
+    asyncio.run(main())
+    assert order == ["alice", "batch"]
+
+
+def test_background_work_leaves_the_reserve_to_interactive_calls():
+    limiter = FairRateLimiter(rpm=60, tpm=0, clock=Clock())  # 10 requests, 2 held back
+
+    async def main():
+        for _ in range(8):
+            await limiter.acquire("batch", 10, lane=rate_limit.BACKGROUND)
+        queued = asyncio.create_task(limiter.acquire("batch", 10, lane=rate_limit.BACKGROUND))
+        await asyncio.sleep(0.01)
+        assert limiter.waiting()["background"] == {"batch": 1}
+        await asyncio.wait_for(limiter.acquire("alice", 10), 0.5)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+
+    asyncio.run(main())
+
+
+def test_unknown_lane_is_rejected():
+    with pytest.raises(ValueError):
+        asyncio.run(FairRateLimiter(clock=Clock()).acquire("alice", 1, lane="urgent"))
+
+
+def test_background_cap_halves_on_slow_interactive_calls_and_recovers():
+    clock = Clock()
+    throttle = rate_limit.BackgroundThrottle(target_seconds=1.0, max_inflight=8, clock=clock)
+    for _ in range(rate_limit.ADJUST_EVERY):
+        throttle.observe_interactive(5.0)
+    assert throttle.limit == 4
+    throttle.inflight = 4
+    assert not throttle.allows()
+    clock.now += rate_limit.IDLE_RECOVERY_SECONDS + 1
+    throttle.background_done()
+    assert (throttle.inflight, throttle.limit) == (3, 5)
+    for _ in range(rate_limit.THROTTLE_WINDOW):
+        throttle.observe_interactive(0.1)
+    assert throttle.limit == 2  # backs off until the slow samples age out of the window
+    for _ in range(rate_limit.ADJUST_EVERY):
+        throttle.observe_interactive(0.1)
+    assert throttle.limit == 3  # then grows back one step at a time
@@ -0,0 +1,62 @@
+import pytest
+
+from utils.aho_corasick import AhoCorasick
+from utils.red_flags import detect_red_flag
+
+
+@pytest.mark.parametrize("message, category", [
+    ("I have crushing chest pain", "cardiac"),
+    ("mujhe seene mein dard hai", "cardiac"),
+    ("मुझे सीने में दर्द है।", "cardiac"),
+    ("मुझे छाती में दर्द है", "cardiac"),
+    ("साँस नहीं आ रही", "breathing"),
+    ("مجھے سینے میں درد ہے", "cardiac"),
+    ("سانس نہیں آ رہی", "breathing"),
+    ("I think I'm having a stroke", "stroke"),
+])
+def test_emergency_phrases_are_flagged(message, category):
+    flag = detect_red_flag(message)
+    assert flag is not None and flag.category == category
+
+
+@pytest.mark.parametrize("message", [
+    "सोने में दर्द होता है",          # sleeping, not chest (सोने / सीने)
+    "सोने से पहले छाती की कसरत",      # chest workout before sleeping
+    "سونے میں درد ہوتا ہے",           # sleeping, not chest (سونے / سینے)
+    "I love painting my chest of drawers",
+    "I poisoned the weeds in my garden",
+    "how many breaths per minute is normal",
+])
+def test_near_misses_are_not_flagged(message):
+    assert detect_red_flag(message) is None
+
+
+def test_word_level_keeps_combining_marks_inside_words():
+    automaton = AhoCorasick(word_level=True)
+    automaton.add("सीने में दर्द", "chest")
+    automaton.build()
+    assert automaton.match_values("सोने में दर्द") == []
+    text = "कल रात सीने में दर्द हुआ"
+    ((start, end, value),) = automaton.find_all(text)
+    assert (text[start:end], value) == ("सीने में दर्द", "chest")
+
+
+def test_character_mode_boundaries_respect_vowel_signs():
+    automaton = AhoCorasick(whole_words=True)
+    automaton.add("दर्द")
+    automaton.build()
+    assert automaton.find_all("दर्दी") == []    # a longer word, not दर्द
+    assert len(automaton.find_all("दर्द है")) == 1
+
+
+def test_stream_matches_like_a_single_scan():
+    automaton = AhoCorasick(whole_words=True)
+    automaton.add_many(["chest pain", "pain"])
+    automaton.build()
+    text = "sudden chest pain, painting later, then pain"
+    stream = automaton.stream()
+    streamed = []
+    for i in range(0, len(text), 3):
+        streamed += stream.feed(text[i:i + 3])
+    streamed += stream.close()
+    assert sorted(streamed) == sorted(automaton.find_all(text))
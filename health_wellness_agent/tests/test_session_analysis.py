@@ -0,0 +1,71 @@
+import asyncio
+
+from utils import model_gateway, session_analysis, token_usage
+from utils.session_analysis import analyze_session, chunk_history, summarize_chunks
+
+
+def chat(turns):
+    return [("user" if i % 2 == 0 else "assistant", f"message {i}") for i in range(turns)]
+
+
+def fake_generate(monkeypatch, fail=()):
+    prompts = []
+
+    async def generate(prompt, **kwargs):
+        prompts.append(prompt)
+        if any(marker in prompt for marker in fail):
+            raise ConnectionError("model down")
+        return f"summary {len(prompts)}"
+
+    monkeypatch.setattr(model_gateway, "generate", generate)
+    return prompts
+
+
+def test_chunks_skip_reports_and_stay_aligned_as_the_chat_grows():
+    history = chat(10)
+    history.insert(3, ("analysis", "an earlier report"))
+    chunks = chunk_history(history, size=4)
+    assert [len(c) for c in chunks] == [4, 4, 2]
+    assert all(role != "analysis" for chunk in chunks for role, _ in chunk)
+    assert chunk_history(history + chat(12)[10:], size=4)[:2] == chunks[:2]
+
+
+def test_only_new_or_grown_chunks_are_summarised_again(monkeypatch):
+    prompts = fake_generate(monkeypatch)
+    cache = {}
+
+    async def main():
+        first = await summarize_chunks(None, chunk_history(chat(10), size=4), cache)
+        assert len(prompts) == 3 and len(cache) == 3
+        again = await summarize_chunks(None, chunk_history(chat(13), size=4), cache)
+        return first, again
+
+    first, again = asyncio.run(main())
+    assert len(prompts) == 5  # the grown third chunk and the new fourth
+    assert again[:2] == first[:2] and len(cache) == 4  # the stale third summary is dropped
+
+
+def test_a_failed_summary_falls_back_to_the_transcript_and_is_retried(monkeypatch):
+    prompts = fake_generate(monkeypatch, fail=("message 4",))
+    cache = {}
+    chunks = chunk_history(chat(8), size=4)
+    summaries = asyncio.run(summarize_chunks(None, chunks, cache))
+    assert summaries[0].startswith("summary") and "User: message 4" in summaries[1]
+    assert len(cache) == 1
+    asyncio.run(summarize_chunks(None, chunks, cache))
+    assert len(prompts) == 3
+
+
+def test_report_streams_from_the_fake_model():
+    seen = []
+    report = asyncio.run(analyze_session(None, chat(6), {}, name="Ana", session_id="s-analysis",
+                                         on_text=seen.append))
+    assert report and seen and seen[-1].strip() == report
+    assert asyncio.run(analyze_session(None, [], {})) == "No conversation to analyse yet."
+
+
+def test_no_analysis_runs_over_the_token_budget(monkeypatch):
+    prompts = fake_generate(monkeypatch)
+    monkeypatch.setattr(token_usage, "budget_action", lambda *a, **k: token_usage.REFUSE)
+    report = asyncio.run(analyze_session(None, chat(6), {}, session_id="s-over"))
+    assert report == session_analysis.OVER_BUDGET_MESSAGE and prompts == []
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from utils.single_flight import KeyReused, SingleFlight
+
+
+def test_concurrent_callers_share_one_run():
+    flights, runs = SingleFlight(), []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return len(runs)
+
+    async def main():
+        return await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+
+    assert asyncio.run(main()) == [1] * 5
+    assert asyncio.run(flights.do("k", work)) == 2  # nothing remembered without ``remember``
+
+
+def test_remembered_result_is_replayed_for_the_same_fingerprint_only():
+    flights, runs = SingleFlight(), []
+
+    async def work():
+        runs.append(1)
+        return "answer"
+
+    async def main():
+        assert await flights.do("k", work, remember=60, fingerprint="body-a") == "answer"
+        assert await flights.do("k", work, remember=60, fingerprint="body-a") == "answer"
+        with pytest.raises(KeyReused):
+            await flights.do("k", work, remember=60, fingerprint="body-b")
+
+    asyncio.run(main())
+    assert len(runs) == 1
+
+
+def test_a_running_key_rejects_another_fingerprint():
+    flights = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "first"
+
+    async def main():
+        leader = asyncio.ensure_future(flights.do("k", slow, fingerprint="a"))
+        await asyncio.sleep(0)
+        with pytest.raises(KeyReused):
+            await flights.do("k", slow, fingerprint="b")
+        return await leader
+
+    assert asyncio.run(main()) == "first"
+
+
+def test_failures_are_shared_but_not_remembered():
+    flights, calls = SingleFlight(), []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("provider down")
+        return "ok"
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await flights.do("k", flaky, remember=60)
+        return await flights.do("k", flaky, remember=60)
+
+    assert asyncio.run(main()) == "ok"
+
+
+def test_api_idempotency_key_is_bound_to_the_body(monkeypatch):
+    from aiohttp.test_utils import TestClient, TestServer
+
+    monkeypatch.setenv("HEALTH_API_KEYS", "tests:secret")
+    import api
+
+    async def main():
+        client = TestClient(TestServer(api.create_app()))
+        await client.start_server()
+        try:
+            headers = {"Authorization": "Bearer secret", "Idempotency-Key": "turn-1"}
+            body = {"user": "a", "session_id": "s-idem", "message": "how much water should I drink"}
+            first = await client.post("/v1/chat", json=body, headers=headers)
+            again = await client.post("/v1/chat", json=body, headers=headers)
+            other = await client.post("/v1/chat", json={**body, "message": "how much sleep do I need"},
+                                      headers=headers)
+            return first.status, await first.json(), again.status, await again.json(), other.status
+        finally:
+            await client.close()
+
+    first_status, first, again_status, again, other_status = asyncio.run(main())
+    assert (first_status, again_status) == (200, 200) and again == first
+    assert other_status == 422
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils import token_usage
+from utils.token_usage import Tokens, UsageStore
+
+DAY = 1_700_000_000  # 2023-11-14 UTC
+
+
+def spend(store, prompt, completion=0, *, session="s1", user="u1", kind="chat", at=DAY):
+    store.record(Tokens(prompt, completion), session=session, user=user, kind=kind, model="fake", at=at)
+
+
+def test_stores_sharing_a_journal_count_each_others_spending(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    app, api = UsageStore(path), UsageStore(path)
+    spend(app, 100, 20)
+    spend(api, 50, 5, kind="span_check")
+    assert app.session_totals("s1").total == api.session_totals("s1").total == 175
+    assert api.user_day_totals("u1", "2023-11-14").calls == 2
+    assert UsageStore(path).session_totals("s1").total == 175
+
+
+def test_compaction_merges_rows_without_losing_another_store_s_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(token_usage, "COMPACT_AFTER", 4)
+    path = str(tmp_path / "journal.jsonl")
+    first, second = UsageStore(path), UsageStore(path)
+    for _ in range(3):
+        spend(first, 10)
+    spend(second, 10, session="s2")  # fourth line: second store compacts
+    spend(first, 10)
+    with open(path) as f:
+        assert len(f.readlines()) == 3  # two merged rows and one new line
+    for store in (first, second, UsageStore(path)):
+        assert store.session_totals("s1").total == 40
+        assert store.session_totals("s2").total == 10
+
+
+def test_report_groups_and_orders_by_total(tmp_path):
+    store = UsageStore(str(tmp_path / "journal.jsonl"))
+    spend(store, 10, user="light")
+    spend(store, 300, user="heavy")
+    spend(store, 100, user="heavy", kind="analysis")
+    rows = store.report(by=("user",))
+    assert [(r["user"], r["total"], r["calls"]) for r in rows] == [("heavy", 400, 2), ("light", 10, 1)]
+    with pytest.raises(ValueError):
+        store.report(by=("name",))
+
+
+def test_attribute_scopes_nest_and_fill_in_the_record(tmp_path, monkeypatch):
+    store = UsageStore(str(tmp_path / "journal.jsonl"))
+    monkeypatch.setattr(token_usage, "get_usage_store", lambda: store)
+    with token_usage.attribute(session="s1", user="u1", kind="chat"):
+        with token_usage.attribute(kind="span_check"):
+            token_usage.record(Tokens(7, 3), model="fake")
+        token_usage.record(Tokens(1, 1), model="fake", user="ignored")
+    token_usage.record(Tokens(2, 0), model="fake")
+    by_kind = {(r["user"], r["kind"]): r["total"] for r in store.report(by=("user", "kind"))}
+    assert by_kind == {("u1", "span_check"): 10, ("u1", "chat"): 2, ("anonymous", "other"): 2}
+
+
+def test_budget_action_summarizes_near_the_budget_and_refuses_past_it(tmp_path, monkeypatch):
+    store = UsageStore(str(tmp_path / "journal.jsonl"))
+    monkeypatch.setattr(token_usage, "get_usage_store", lambda: store)
+    monkeypatch.setattr(token_usage, "SESSION_BUDGET", 0)
+    assert token_usage.budget_action("s1", "u1") == token_usage.OK
+    monkeypatch.setattr(token_usage, "USER_DAILY_BUDGET", 1000)
+    spend(store, 700, at=None)
+    assert token_usage.budget_action("s1", "u1") == token_usage.OK
+    spend(store, 100, session="s2", at=None)  # another session, same user and day
+    assert token_usage.budget_action("s3", "u1") == token_usage.SUMMARIZE
+    spend(store, 200, at=None)
+    with token_usage.attribute(session="s4", user="u1"):
+        assert token_usage.budget_action() == token_usage.REFUSE
+    assert token_usage.budget_action("s1", "u2") == token_usage.OK
+
+
+def test_usage_is_read_from_each_provider_s_response_shape():
+    gemini = SimpleNamespace(usage_metadata=SimpleNamespace(
+        prompt_token_count=12, candidates_token_count=30, cached_content_token_count=4))
+    groq = SimpleNamespace(usage=SimpleNamespace(prompt_tokens=9, completion_tokens=2, prompt_tokens_details=None))
+    agents = SimpleNamespace(usage=SimpleNamespace(
+        input_tokens=5, output_tokens=6, input_tokens_details=SimpleNamespace(cached_tokens=1)))
+    assert token_usage.usage_of(gemini) == Tokens(12, 30, 4)
+    assert token_usage.usage_of(groq) == Tokens(9, 2, 0)
+    assert token_usage.usage_of(agents) == Tokens(5, 6, 1)
+    assert token_usage.usage_of(SimpleNamespace(usage={"prompt": 3, "completion": 4})) == Tokens(3, 4)
+    assert token_usage.usage_of(SimpleNamespace()) is None
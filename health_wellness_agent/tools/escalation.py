@@ -0,0 +1,35 @@
+from agents import function_tool, RunContextWrapper
+from context import UserSessionContext
+from utils.escalation_queue import SLA_SECONDS, get_escalation_queue
+
+
+@function_tool
+async def request_human_support(
+    ctx: RunContextWrapper[UserSessionContext],
+    reason: str,
+    urgency: str = "normal"
+) -> str:
+    """
+    Queue this session for a human staff member.
+    urgency: one of "emergency", "high", "normal", "low".
+    """
+    queue = get_escalation_queue()
+    ticket = queue.enqueue(
+        session_id=ctx.context.session_id,
+        user_name=ctx.context.name,
+        reason=reason,
+        urgency=urgency,
+        snapshot=ctx.context.model_dump(),
+    )
+    ctx.context.handoff_logs.append(f"escalation ticket {ticket.id} ({ticket.urgency})")
+    if ticket.status == "held":
+        return f"Escalation recorded with {ticket.urgency} priority; no ticket was queued in this run."
+
+    minutes = max(1, SLA_SECONDS[ticket.urgency] // 60)
+    position = queue.position(ticket.id)
+    if position:
+        return (
+            f"Ticket {ticket.id} queued with {ticket.urgency} priority "
+            f"(position {position}); a human will respond within about {minutes} minutes."
+        )
+    return f"Ticket {ticket.id} is already with a human staff member."
@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from agents import function_tool, RunContextWrapper
+from context import UserSessionContext
+from tools.plan_pipeline import run_full_plan
+
+
+class FullPlanOutput(BaseModel):
+    goal: dict
+    meal_plan: List[str]
+    workout_plan: List[str]
+    checkins: str
+    narrative: Optional[str] = None
+
+
+@function_tool
+async def build_full_plan(ctx: RunContextWrapper[UserSessionContext], goal: str) -> FullPlanOutput:
+    """
+    Analyse the goal, then build the meal and workout plans concurrently and
+    schedule check-ins. Use this when the user asks for a complete plan.
+    """
+    return FullPlanOutput(**await run_full_plan(ctx.context, goal))
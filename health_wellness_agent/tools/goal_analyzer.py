@@ -2,6 +2,8 @@ from pydantic import BaseModel
 from typing import Optional
 from agents import function_tool, RunContextWrapper
 from context import UserSessionContext
+from tools.plan_builders import parse_goal
+from utils.plan_prefetch import get_prefetcher
 
 
 class GoalOutput(BaseModel):
@@ -18,19 +20,9 @@ async def analyze_goal(
 ) -> GoalOutput:
     """
     Very simple goal parser (demo purposes).
+    Stores the parsed goal on the session context.
     """
-    if "lose" in input.lower() and "kg" in input.lower():
-        return GoalOutput(
-            quantity=5,
-            metric="kg",
-            duration="2 months",
-            description="Weight‑loss goal"
-        )
-
-    # fallback
-    return GoalOutput(
-        quantity=0,
-        metric="",
-        duration="",
-        description="Unable to parse goal"
-    )
+    goal = parse_goal(input, ctx.context)
+    # meal & workout plans are the usual next request; start them now (opt-in)
+    get_prefetcher().schedule(ctx.context)
+    return GoalOutput(**goal)
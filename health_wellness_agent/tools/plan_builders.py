@@ -0,0 +1,100 @@
+import re
+from typing import List, Optional
+
+from context import UserSessionContext
+
+# ──────────────────────────────────────────────────────────────
+# Plain plan-building logic behind the function tools
+#
+# Kept free of the agents SDK so the same code can run inside a tool call,
+# in the parallel plan pipeline, in background prefetch, or locally when the
+# model is unavailable.  Each builder writes its result into the context.
+# ──────────────────────────────────────────────────────────────
+
+VEGETARIAN_MEALS = [
+    "Day 1: Veggie stir-fry with tofu",
+    "Day 2: Lentil soup with whole grain bread",
+    "Day 3: Grilled paneer with quinoa",
+    "Day 4: Chickpea curry with rice",
+    "Day 5: Stuffed bell peppers",
+    "Day 6: Mixed veggie pasta",
+    "Day 7: Spinach and mushroom pizza"
+]
+
+BALANCED_MEALS = [
+    "Day 1: Grilled chicken with broccoli",
+    "Day 2: Fish curry with rice",
+    "Day 3: Turkey sandwich",
+    "Day 4: Egg salad",
+    "Day 5: Beef stir-fry",
+    "Day 6: Chicken soup",
+    "Day 7: Tuna pasta"
+]
+
+BEGINNER_WORKOUTS = [
+    "Day 1: Full body stretching",
+    "Day 2: Light cardio (15 mins)",
+    "Day 3: Bodyweight strength (squats, pushups)",
+    "Day 4: Rest day",
+    "Day 5: Light yoga",
+    "Day 6: Walking (30 mins)",
+    "Day 7: Rest day"
+]
+
+ADVANCED_WORKOUTS = [
+    "Day 1: Upper body strength",
+    "Day 2: HIIT cardio",
+    "Day 3: Lower body strength",
+    "Day 4: Core workout",
+    "Day 5: Yoga or mobility",
+    "Day 6: Full body circuit",
+    "Day 7: Active recovery"
+]
+
+CHECKIN_MESSAGE = "Check-ins scheduled every Monday at 8 AM."
+
+_GOAL_RE = re.compile(
+    r"\b(lose|gain|drop|build)\s+(\d+(?:\.\d+)?)\s*(kg|kgs|lbs?|pounds)\b"
+    r"(?:.*?\b(?:in|within|over)\s+(\d+\s*(?:days?|weeks?|months?|years?)))?",
+    re.IGNORECASE,
+)
+
+
+def parse_goal(text: str, context: Optional[UserSessionContext] = None) -> dict:
+    """Extract quantity/metric/duration from a goal like 'lose 5kg in 2 months'."""
+    match = _GOAL_RE.search(text)
+    if match:
+        verb, quantity, metric, duration = match.groups()
+        goal = {
+            "quantity": float(quantity),
+            "metric": "kg" if metric.lower().startswith("kg") else "lbs",
+            "duration": duration or "",
+            "description": "Weight-gain goal" if verb.lower() in ("gain", "build") else "Weight‑loss goal",
+        }
+    else:
+        goal = {"quantity": 0, "metric": "", "duration": "", "description": "Unable to parse goal"}
+
+    if context is not None and goal["metric"]:
+        # keep fields other tools read (e.g. experience_level) when re-parsing
+        context.goal = {**(context.goal or {}), **goal}
+    return goal
+
+
+def build_meal_plan(context: UserSessionContext) -> List[str]:
+    preference = context.diet_preferences or "balanced"
+    plan = list(VEGETARIAN_MEALS if "vegetarian" in preference.lower() else BALANCED_MEALS)
+    context.meal_plan = plan
+    return plan
+
+
+def build_workout_plan(context: UserSessionContext) -> List[str]:
+    goal = context.goal or {}
+    experience = goal.get("experience_level", "beginner")
+    workouts = list(BEGINNER_WORKOUTS if experience == "beginner" else ADVANCED_WORKOUTS)
+    context.workout_plan = {"level": experience, "schedule": workouts}
+    return workouts
+
+
+def schedule_checkins_for(context: UserSessionContext) -> str:
+    context.progress_logs.append({"event": "checkin_scheduled", "message": CHECKIN_MESSAGE})
+    return CHECKIN_MESSAGE
@@ -0,0 +1,76 @@
+from typing import Awaitable, Callable, Dict, Optional
+
+from context import UserSessionContext
+from tools.plan_builders import build_meal_plan, build_workout_plan, parse_goal, schedule_checkins_for
+from utils.context_merge import run_concurrently
+from utils.plan_prefetch import get_prefetcher
+
+# ──────────────────────────────────────────────────────────────
+# Full plan in one turn
+#
+#   analyze goal ──▶ meal plan ─┐
+#                └─▶ workout  ──┴─▶ schedule check-ins
+#
+# Meal and workout plans only depend on the goal, so they run concurrently,
+# unless the prefetcher already computed them for this exact goal.
+# ``steps`` lets callers swap an implementation (e.g. a remote planner or a
+# latency-simulating stand-in in benchmarks/bench_parallel_tools.py).
+# ──────────────────────────────────────────────────────────────
+
+StepFn = Callable[[UserSessionContext], Awaitable[object]]
+
+
+async def _goal(context: UserSessionContext, text: str):
+    return parse_goal(text, context)
+
+
+async def _meals(context: UserSessionContext):
+    return build_meal_plan(context)
+
+
+async def _workout(context: UserSessionContext):
+    return build_workout_plan(context)
+
+
+async def _checkins(context: UserSessionContext):
+    return schedule_checkins_for(context)
+
+
+DEFAULT_STEPS: Dict[str, Callable] = {
+    "goal": _goal,
+    "meals": _meals,
+    "workout": _workout,
+    "checkins": _checkins,
+}
+
+
+async def run_full_plan(
+    context: UserSessionContext,
+    goal_text: str,
+    *,
+    parallel: bool = True,
+    steps: Optional[Dict[str, Callable]] = None,
+) -> dict:
+    steps = {**DEFAULT_STEPS, **(steps or {})}
+    goal = await steps["goal"](context, goal_text)
+
+    prefetched = await get_prefetcher().take(context)
+    if prefetched:
+        prefetched.apply(context)
+        checkins = await steps["checkins"](context)
+        return {
+            "goal": goal,
+            "meal_plan": context.meal_plan,
+            "workout_plan": context.workout_plan["schedule"],
+            "checkins": checkins,
+            "narrative": prefetched.narrative,
+        }
+
+    if parallel:
+        meals, workout = await run_concurrently(context, steps["meals"], steps["workout"])
+    else:
+        meals = await steps["meals"](context)
+        workout = await steps["workout"](context)
+
+    checkins = await steps["checkins"](context)
+    return {"goal": goal, "meal_plan": meals, "workout_plan": workout, "checkins": checkins, "narrative": None}
@@ -0,0 +1,231 @@
+import re
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+# ──────────────────────────────────────────────────────────────
+# Aho-Corasick multi-pattern matcher
+#
+# All phrases are compiled into one automaton, so a message is scanned once in
+# O(len(text) + matches) no matter how many phrases there are.  Matching is
+# case-insensitive; with ``whole_words`` a match must not start or end inside
+# a word ("pain" does not fire on "painting").
+#
+# With ``word_level`` the automaton steps over words instead of characters:
+# the text is split by the C regex engine and the Python loop runs once per
+# word, which is several times faster on long messages (matches are always
+# whole words in this mode).
+#
+# A word is a run of ``\w`` characters and combining marks: Python's ``\w``
+# leaves out vowel signs and viramas (Devanagari and the other Indic
+# scripts), Arabic-script harakat and the joiners Urdu uses, and splitting
+# there would reduce "सीने" (chest) and "सोने" (sleeping) to the same
+# consonants.
+# ──────────────────────────────────────────────────────────────
+
+Match = Tuple[int, int, Any]  # (start, end, value)
+
+# combining diacritics, Arabic-script marks, the Indic blocks (without the
+# danda punctuation) and ZWNJ / ZWJ
+_MARKS = (
+    "\u0300-\u036f\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06dc\u06df-\u06e4\u06e7\u06e8\u06ea-\u06ed"
+    "\u0900-\u0963\u0966-\u0dff\u200c\u200d"
+)
+_WORD_RE = re.compile(f"[\\w{_MARKS}]+")
+_WORD_CHAR_RE = re.compile(f"[\\w{_MARKS}]")
+
+
+def _is_word(ch: str) -> bool:
+    return _WORD_CHAR_RE.match(ch) is not None
+
+
+class AhoCorasick:
+    def __init__(self, whole_words: bool = True, word_level: bool = False):
+        self.whole_words = whole_words
+        self.word_level = word_level
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]  # (pattern length, value)
+        self._built = False
+
+    def add(self, phrase: str, value: Any = None) -> None:
+        phrase = phrase.lower().strip()
+        symbols = _WORD_RE.findall(phrase) if self.word_level else phrase
+        if not symbols:
+            return
+        state = 0
+        for ch in symbols:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(symbols), phrase if value is None else value))
+        self._built = False
+
+    def add_many(self, phrases: Iterable[str], value: Any = None) -> None:
+        for phrase in phrases:
+            self.add(phrase, value)
+
+    def build(self) -> "AhoCorasick":
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                # inherit the outputs of the longest proper suffix state
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+        return self
+
+    def iter_matches(self, text: str) -> Iterator[Match]:
+        if not self._built:
+            self.build()
+        if self.word_level:
+            yield from self._iter_word_matches(text)
+            return
+        goto, fail, out = self._goto, self._fail, self._out
+        lowered = text.lower()
+        # str.lower() can change the length for a few scripts; fall back to
+        # the original text so reported offsets stay valid
+        if len(lowered) != len(text):
+            lowered = text
+        state = 0
+        for i, ch in enumerate(lowered):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, value in out[state]:
+                start = i - length + 1
+                if self.whole_words and not self._on_word_boundary(lowered, start, i + 1):
+                    continue
+                yield start, i + 1, value
+
+    def _word_hits(self, lowered: str) -> List[Tuple[int, int, Any]]:
+        """(index of last word, pattern length in words, value) per match."""
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        hits = []
+        state = 0
+        for i, word in enumerate(_WORD_RE.findall(lowered)):
+            if not state and word not in root:
+                continue  # the common case: a word no phrase starts with
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for length, value in out[state]:
+                hits.append((i, length, value))
+        return hits
+
+    def _iter_word_matches(self, text: str) -> Iterator[Match]:
+        lowered = text.lower()
+        hits = self._word_hits(lowered)
+        if not hits:
+            return
+        # offsets are only needed for the (rare) matches; they refer to the
+        # lowered text, like the character mode
+        spans = [m.span() for m in _WORD_RE.finditer(lowered)]
+        for last, length, value in hits:
+            yield spans[last - length + 1][0], spans[last][1], value
+
+    @staticmethod
+    def _on_word_boundary(text: str, start: int, end: int) -> bool:
+        if start > 0 and _is_word(text[start - 1]) and _is_word(text[start]):
+            return False
+        if end < len(text) and _is_word(text[end]) and _is_word(text[end - 1]):
+            return False
+        return True
+
+    def stream(self) -> "StreamMatcher":
+        """Incremental matcher for text that arrives in chunks (character mode)."""
+        if self.word_level:
+            raise ValueError("streaming is only supported in character mode")
+        if not self._built:
+            self.build()
+        return StreamMatcher(self)
+
+    def match_values(self, text: str) -> List[Any]:
+        """Values of every match, in order, without computing offsets."""
+        if not self._built:
+            self.build()
+        if self.word_level:
+            return [value for _, _, value in self._word_hits(text.lower())]
+        return [value for _, _, value in self.iter_matches(text)]
+
+    def find_all(self, text: str) -> List[Match]:
+        return list(self.iter_matches(text))
+
+    def search(self, text: str):
+        """First match in ``text`` or ``None``."""
+        return next(self.iter_matches(text), None)
+
+
+class StreamMatcher:
+    """Carries the automaton state across chunks, so each character is seen once.
+
+    Offsets are absolute positions in the concatenated stream.  With
+    ``whole_words`` a match ending on the last character of a chunk is held
+    back until the next character (or ``close()``) shows it ends a word.
+    """
+
+    def __init__(self, automaton: AhoCorasick):
+        self._ac = automaton
+        self._state = 0
+        self._pos = 0
+        self._tail = ""   # last characters seen, enough to look behind any match
+        self._keep = 1 + max((length for outs in automaton._out for length, _ in outs), default=0)
+        self._pending: List[Match] = []
+
+    def feed(self, chunk: str) -> List[Match]:
+        ac = self._ac
+        goto, fail, out = ac._goto, ac._fail, ac._out
+        lowered = chunk.lower()
+        if len(lowered) != len(chunk):
+            lowered = chunk
+        if not lowered:
+            return []
+
+        matches = []
+        if self._pending:
+            if not (_is_word(lowered[0]) and self._tail and _is_word(self._tail[-1])):
+                matches.extend(self._pending)
+            self._pending = []
+
+        window = self._tail + lowered
+        base = len(self._tail)
+        state = self._state
+        for i, ch in enumerate(lowered):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length, value in out[state]:
+                start, end = base + i + 1 - length, base + i + 1
+                match = (self._pos + i + 1 - length, self._pos + i + 1, value)
+                if ac.whole_words:
+                    if start > 0 and _is_word(window[start - 1]) and _is_word(window[start]):
+                        continue
+                    if end == len(window):
+                        self._pending.append(match)
+                        continue
+                    if _is_word(window[end]) and _is_word(window[end - 1]):
+                        continue
+                matches.append(match)
+
+        self._state = state
+        self._pos += len(lowered)
+        self._tail = window[-self._keep:]
+        return matches
+
+    def close(self) -> List[Match]:
+        """Flush matches held back at the end of the stream."""
+        pending, self._pending = self._pending, []
+        return pending
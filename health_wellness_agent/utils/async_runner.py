@@ -0,0 +1,174 @@
+import asyncio
+import concurrent.futures
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from utils import metrics
+
+# ──────────────────────────────────────────────────────────────
+# Process-wide background event loop
+#
+# Streamlit reruns are synchronous scripts, one thread per session.  Instead
+# of a fresh ``asyncio.run`` (new loop, new client sessions) per call, every
+# session submits its coroutines to one long-lived loop running in a daemon
+# thread.  Async HTTP clients, caches and background tasks bound to that loop
+# (agents SDK client, plan prefetch, rate limiter, ...) stay warm across
+# reruns and users.
+#
+# Runs are tagged with a key (usually the Streamlit session id).  Submitting
+# a new run under the same key cancels the previous one, and a run whose
+# script is interrupted by a rerun is cancelled as well.  A script only
+# notices a rerun when it calls into Streamlit, so a thread waiting for a run
+# polls every POLL_SECONDS and makes the same check Streamlit makes at each
+# ``st.*`` call.
+# ──────────────────────────────────────────────────────────────
+
+MAX_CONCURRENT_RUNS = int(os.getenv("HEALTH_MAX_CONCURRENT_RUNS", "32"))
+POLL_SECONDS = 0.05
+
+
+class BackgroundLoop:
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_RUNS):
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="health-async-loop", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        self._semaphore = self.call(self._make_semaphore(max_concurrency))
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._active = 0
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._ready.set)
+        self.loop.run_forever()
+
+    @staticmethod
+    async def _make_semaphore(limit: int) -> asyncio.Semaphore:
+        return asyncio.Semaphore(limit)
+
+    def call(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Run ``coro`` on the loop without concurrency accounting (internal use)."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def _bounded(self, coro: Awaitable) -> Any:
+        queued = time.perf_counter()
+        async with self._semaphore:
+            metrics.observe("async_runner_wait_seconds", time.perf_counter() - queued)
+            self._active += 1  # only touched on the loop thread
+            metrics.set_gauge("async_runner_active", self._active)
+            try:
+                return await coro
+            finally:
+                self._active -= 1
+                metrics.set_gauge("async_runner_active", self._active)
+
+    def submit(self, coro: Awaitable, *, key: Optional[str] = None) -> concurrent.futures.Future:
+        """Schedule ``coro``; a previous run under the same ``key`` is cancelled."""
+        future = asyncio.run_coroutine_threadsafe(self._bounded(coro), self.loop)
+        if key is not None:
+            with self._lock:
+                previous = self._inflight.get(key)
+                self._inflight[key] = future
+            if previous is not None and not previous.done():
+                previous.cancel()
+                metrics.inc("async_runner_cancelled_total", reason="superseded")
+            future.add_done_callback(lambda f, k=key: self._forget(k, f))
+        return future
+
+    def _forget(self, key: str, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def cancel(self, key: str) -> bool:
+        with self._lock:
+            future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            metrics.inc("async_runner_cancelled_total", reason="explicit")
+            return future.cancel()
+        return False
+
+    def run(
+        self,
+        coro: Awaitable,
+        *,
+        key: Optional[str] = None,
+        timeout: Optional[float] = None,
+        on_progress: Optional[Callable[[Any], None]] = None,
+        progress: Optional["queue.Queue"] = None,
+        cancel_on_interrupt: bool = True,
+    ) -> Any:
+        """Block the calling (script) thread until ``coro`` finishes.
+
+        Items the coroutine puts on ``progress`` are handed to ``on_progress``
+        on the *calling* thread, so Streamlit elements can be updated safely.
+        If the caller is interrupted (e.g. Streamlit stops the script for a
+        rerun) the run is cancelled instead of being left to finish unseen,
+        unless ``cancel_on_interrupt`` is False (runs the next rerun will pick
+        up again through utils/single_flight.py).
+        """
+        future = self.submit(coro, key=key)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    result = future.result(timeout=POLL_SECONDS)
+                    break
+                except concurrent.futures.TimeoutError:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise
+                finally:
+                    if progress is not None and on_progress is not None:
+                        _drain(progress, on_progress)
+                _check_interrupt()
+            return result
+        finally:
+            if cancel_on_interrupt and not future.done():
+                future.cancel()
+                metrics.inc("async_runner_cancelled_total", reason="interrupted")
+
+
+def _check_interrupt() -> None:
+    """Raise Streamlit's rerun/stop exception if this script thread has been asked to stop."""
+    if "streamlit" not in sys.modules:
+        return  # API, batch runner, CLI
+    from streamlit.runtime.scriptrunner import RerunException, StopException, get_script_run_ctx
+    from streamlit.runtime.scriptrunner.script_requests import ScriptRequestType
+
+    requests = getattr(get_script_run_ctx(suppress_warning=True), "script_requests", None)
+    request = requests.on_scriptrunner_yield() if requests is not None else None
+    if request is None:
+        return
+    if request.type == ScriptRequestType.RERUN:
+        raise RerunException(request.rerun_data)
+    raise StopException()
+
+
+def _drain(items: "queue.Queue", on_progress: Callable[[Any], None]) -> None:
+    """Deliver only the newest pending item; intermediate ones are stale."""
+    latest, found = None, False
+    while True:
+        try:
+            latest, found = items.get_nowait(), True
+        except queue.Empty:
+            break
+    if found:
+        on_progress(latest)
+
+
+_background: Optional[BackgroundLoop] = None
+_background_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundLoop:
+    global _background
+    with _background_lock:
+        if _background is None:
+            _background = BackgroundLoop()
+        return _background
@@ -0,0 +1,341 @@
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import asdict
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Optional
+
+from utils import metrics
+from utils.token_usage import usage_of
+
+# ──────────────────────────────────────────────────────────────
+# Record / replay cassettes for offline performance runs
+#
+# With HEALTH_CASSETTE=<file> every model and agent interaction is recorded
+# (HEALTH_CASSETTE_MODE=record, the default) or served back from the file
+# (HEALTH_CASSETTE_MODE=replay), at two levels:
+#   model   every ``generate_content`` call of a routed provider or of
+#           ``get_model()``: utils/streaming.get_gemini_response,
+#           stream_agent_response, the chat service, session analysis
+#           (keyed on the prompt and the system instruction)
+#   agent   every planner turn of agent.py (run_planner / stream_planner):
+#           final output, last agent and the streamed deltas
+# with the prompt (hash and a short excerpt), response chunks, timings
+# (seconds to each chunk) and the reported token usage.  The file is gzip-compressed JSON lines, appended
+# in batches (every FLUSH_ENTRIES entries or FLUSH_SECONDS, and at exit) as
+# the session goes, so a production worker can record real traffic.
+#
+# Replay needs no key, quota or network: answers come back in recorded
+# order per prompt, chunk by chunk with the recorded gaps scaled by
+# 1/HEALTH_CASSETTE_SPEED (0 = no waiting).  A prompt that is not in the
+# cassette takes the next unused entry of its kind, so changes that reword
+# prompts still replay; CassetteMiss is raised once the kind is exhausted.
+# Local work (routing, red flags, tools, scanning, UI) runs for real, which
+# is what replay is for: benchmarking it against real model timings.
+# ──────────────────────────────────────────────────────────────
+
+CASSETTE_PATH = os.getenv("HEALTH_CASSETTE", "")
+CASSETTE_MODE = os.getenv("HEALTH_CASSETTE_MODE", "record")
+REPLAY_SPEED = float(os.getenv("HEALTH_CASSETTE_SPEED", "1"))
+FLUSH_ENTRIES = 20
+FLUSH_SECONDS = 5.0
+EXCERPT_CHARS = 200
+
+MODEL, AGENT = "model", "agent"
+RECORD, REPLAY = "record", "replay"
+
+log = logging.getLogger(__name__)
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class ReplayedError(RuntimeError):
+    """An error that was raised when the interaction was recorded."""
+
+
+def prompt_key(kind: str, text: str) -> str:
+    return hashlib.sha1(f"{kind}\0{text}".encode("utf-8")).hexdigest()[:16]
+
+
+def _model_input(prompt, system: Optional[str]) -> str:
+    """What identifies a model call: the prompt, then the system instruction if there is one."""
+    return str(prompt) if system is None else f"{prompt}\0{system}"
+
+
+class _Text:
+    def __init__(self, text: str, usage: Optional[dict] = None):
+        self.text = text
+        self.usage = usage
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str = RECORD, speed: float = REPLAY_SPEED):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"HEALTH_CASSETTE_MODE must be {RECORD} or {REPLAY}, not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._by_key: Dict[str, Deque[dict]] = defaultdict(deque)
+        self._by_kind: Dict[str, Deque[dict]] = defaultdict(deque)
+        self._pending: List[str] = []
+        self._flushed = time.monotonic()
+        if mode == REPLAY:
+            self._load()
+        else:
+            atexit.register(self.flush)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    # ── recording ──────────────────────────────────────────────
+
+    def record(self, kind: str, text: str, **fields) -> None:
+        entry = {
+            "kind": kind,
+            "key": prompt_key(kind, text),
+            "input": text[:EXCERPT_CHARS],
+            "at": round(time.monotonic() - self._started, 3),
+            **fields,
+        }
+        with self._lock:
+            self._pending.append(json.dumps(entry, ensure_ascii=False) + "\n")
+            due = len(self._pending) >= FLUSH_ENTRIES or time.monotonic() - self._flushed >= FLUSH_SECONDS
+        metrics.inc("cassette_recorded_total", kind=kind)
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Append pending entries as one gzip member (readers handle concatenated members)."""
+        with self._lock:
+            lines, self._pending = self._pending, []
+            self._flushed = time.monotonic()
+            if lines:
+                with gzip.open(self.path, "at", encoding="utf-8") as f:
+                    f.writelines(lines)
+
+    # ── replay ─────────────────────────────────────────────────
+
+    def _load(self) -> None:
+        count = 0
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entry["used"] = False
+                    self._by_key[entry["key"]].append(entry)
+                    self._by_kind[entry["kind"]].append(entry)
+                    count += 1
+        log.info("replaying %d interactions from %s", count, self.path)
+
+    def take(self, kind: str, text: str) -> dict:
+        """The recorded entry for ``text``, else the next unused one of ``kind``."""
+        with self._lock:
+            for queue, match in ((self._by_key[prompt_key(kind, text)], "exact"), (self._by_kind[kind], "order")):
+                while queue and queue[0]["used"]:
+                    queue.popleft()
+                if queue:
+                    entry = queue.popleft()
+                    entry["used"] = True
+                    metrics.inc("cassette_replayed_total", kind=kind, match=match)
+                    return entry
+        metrics.inc("cassette_misses_total", kind=kind)
+        raise CassetteMiss(f"no recorded {kind} interaction left for {text[:60]!r}")
+
+    def delay(self, seconds: float) -> float:
+        return seconds / self.speed if self.speed > 0 else 0.0
+
+    # ── model level ────────────────────────────────────────────
+
+    def wrap(self, factory: Callable[[], object], name: str):
+        """The model built by ``factory``, recorded or replaced by the cassette."""
+        return CassetteModel(None if self.replaying else factory(), self, name)
+
+
+class CassetteModel:
+    """``generate_content`` in front of a real model (record) or the cassette (replay)."""
+
+    def __init__(self, inner, cassette: Cassette, name: str):
+        self.inner = inner
+        self.cassette = cassette
+        self.model_name = name
+
+    def probe(self) -> None:
+        if self.inner is not None:
+            from utils.health import probe_model
+
+            probe_model(self.inner)
+
+    def generate_content(self, prompt: str, stream: bool = False, system: Optional[str] = None, **kwargs):
+        text = _model_input(prompt, system)
+        if self.cassette.replaying:
+            entry = self.cassette.take(MODEL, text)
+            chunks = self._replay(entry)
+            return chunks if stream else _Text("".join(piece.text for piece in chunks), entry.get("usage"))
+        start = time.monotonic()
+        try:
+            response = self.inner.generate_content(prompt, stream=stream, system=system, **kwargs)
+        except Exception as e:
+            self._record(text, stream, [], start, e)
+            raise
+        if stream:
+            return self._recorded_stream(text, response, start)
+        self._record(text, stream, [(time.monotonic() - start, _text_of(response))], start, None,
+                     usage_of(response))
+        return response
+
+    def _recorded_stream(self, prompt: str, response, start: float) -> Iterator:
+        chunks: List = []
+        error = usage = None
+        try:
+            for chunk in response:
+                chunks.append((time.monotonic() - start, _text_of(chunk)))
+                usage = usage_of(chunk) or usage
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # also on close(): a reader that stopped early still leaves a usable entry
+            self._record(prompt, True, chunks, start, error, usage)
+
+    def _record(self, prompt: str, stream: bool, chunks: List, start: float, error: Optional[BaseException],
+                usage=None) -> None:
+        self.cassette.record(
+            MODEL, str(prompt),
+            model=self.model_name,
+            stream=stream,
+            chunks=[[round(offset, 3), text] for offset, text in chunks],
+            seconds=round(time.monotonic() - start, 3),
+            error=None if error is None else f"{type(error).__name__}: {error}",
+            usage=None if usage is None else asdict(usage),
+        )
+
+    def _replay(self, entry: dict) -> Iterator[_Text]:
+        # iterated by the caller's worker thread, so it waits like the original
+        previous = 0.0
+        for i, (offset, text) in enumerate(entry["chunks"], 1):
+            time.sleep(self.cassette.delay(offset - previous))
+            previous = offset
+            yield _Text(text, entry.get("usage") if i == len(entry["chunks"]) else None)
+        if entry.get("error"):
+            time.sleep(self.cassette.delay(entry["seconds"] - previous))
+            raise ReplayedError(entry["error"])
+
+
+def _text_of(response) -> str:
+    try:
+        return getattr(response, "text", "") or ""
+    except ValueError:  # Gemini raises for blocked or empty candidates
+        return ""
+
+
+# ── agent level ────────────────────────────────────────────────
+
+class ReplayedAgent:
+    """Stands in for the agent that finished a recorded turn (only ``name`` is used)."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class ReplayedResult:
+    def __init__(self, final_output, last_agent: str):
+        self.final_output = final_output
+        self.last_agent = ReplayedAgent(last_agent)
+
+
+def _record_turn(message: str, result, deltas: List, start: float, error: Optional[BaseException]) -> None:
+    output = getattr(result, "final_output", None)
+    get_cassette().record(
+        AGENT, message,
+        final_output=output if output is None or isinstance(output, (str, dict, list)) else str(output),
+        last_agent=result.last_agent.name if result is not None else None,
+        deltas=[[round(offset, 3), text] for offset, text in deltas],
+        seconds=round(time.monotonic() - start, 3),
+        error=None if error is None else f"{type(error).__name__}: {error}",
+    )
+
+
+async def recorded_turn(message: str, run: Awaitable):
+    """Await a planner run and record its outcome."""
+    start = time.monotonic()
+    try:
+        result = await run
+    except Exception as e:
+        _record_turn(message, None, [], start, e)
+        raise
+    _record_turn(message, result, [], start, None)
+    return result
+
+
+async def recorded_stream(message: str, items: AsyncIterator) -> AsyncIterator:
+    """Pass a streamed planner run through (text deltas, then the result) and record it."""
+    start = time.monotonic()
+    deltas: List = []
+    try:
+        async for item in items:
+            if isinstance(item, str):
+                deltas.append((time.monotonic() - start, item))
+            else:
+                _record_turn(message, item, deltas, start, None)
+            yield item
+    except Exception as e:
+        _record_turn(message, None, deltas, start, e)
+        raise
+
+
+async def _replay_deltas(entry: dict) -> AsyncIterator[str]:
+    cassette = get_cassette()
+    previous = 0.0
+    for offset, text in entry["deltas"]:
+        await asyncio.sleep(cassette.delay(offset - previous))
+        previous = offset
+        yield text
+    await asyncio.sleep(cassette.delay(entry["seconds"] - previous))
+    if entry.get("error"):
+        raise ReplayedError(entry["error"])
+
+
+async def replay_turn(message: str) -> ReplayedResult:
+    """The recorded planner turn for ``message``, after its recorded duration."""
+    entry = get_cassette().take(AGENT, message)
+    async for _ in _replay_deltas(entry):
+        pass
+    return ReplayedResult(entry["final_output"], entry["last_agent"])
+
+
+async def replay_stream(message: str) -> AsyncIterator:
+    """The recorded planner turn for ``message`` as text deltas, then the result."""
+    entry = get_cassette().take(AGENT, message)
+    streamed = False
+    async for text in _replay_deltas(entry):
+        streamed = True
+        yield text
+    if not streamed and isinstance(entry["final_output"], str):
+        yield entry["final_output"]  # recorded from run_planner
+    yield ReplayedResult(entry["final_output"], entry["last_agent"])
+
+
+_cassette: Optional[Cassette] = Cassette(CASSETTE_PATH, CASSETTE_MODE) if CASSETTE_PATH else None
+
+
+def get_cassette() -> Optional[Cassette]:
+    """The active cassette, or None when neither recording nor replaying."""
+    return _cassette
+
+
+def wrap_model(factory: Callable[[], object], name: str):
+    """``factory()``, passed through the active cassette if there is one."""
+    cassette = get_cassette()
+    return factory() if cassette is None else cassette.wrap(factory, name)
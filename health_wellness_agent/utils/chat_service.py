@@ -0,0 +1,246 @@
+import asyncio
+import functools
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional, Union
+
+from memory.memory_index import format_memories, get_memory_index
+from knowledge.bm25_index import format_passages
+from utils import model_gateway, token_usage
+from utils.deadline import deadline, within
+from utils.degradation import (
+    BUDGET_NOTE, DEGRADED_NOTE, TURN_TIMEOUT_SECONDS, degraded_answer, get_load_shedder, get_response_cache,
+)
+from utils.model_router import FAST, classify_query
+from utils.output_scanner import HALTED_MESSAGE, StreamingOutputScanner, passes_review, scan_text
+from utils.prompts import (
+    BRIEF_INSTRUCTION, CHAT_SYSTEM, CHAT_USER, RECALLED_HEADER, REFERENCES_HEADER, Prompt, sections,
+)
+from utils.rate_limit import INTERACTIVE
+from utils.red_flags import detect_red_flag, escalate_red_flag
+
+# ──────────────────────────────────────────────────────────────
+# One chat turn, independent of the front end
+#
+# Shared by the Streamlit app and the HTTP API: red-flag short-circuit,
+# prompt assembly (utils/prompts.py: the static persona as the system
+# instruction, knowledge references and recalled memories with the message),
+# the model call (whole or streamed, on the fast or strong model depending
+# on the message) and the output safety check.  Span checks always use the
+# fast model.
+# Interactive turns degrade to local answers under overload or when the
+# model takes longer than TURN_TIMEOUT_SECONDS (utils/degradation.py).
+#
+# Memories and cached answers belong to ``user_id``: an opaque id owned by
+# the session or the authenticated caller (the session id when there is
+# none), never the display name.
+#
+# Tokens are charged to the session and user (utils/token_usage.py).  Near
+# a token budget turns get a shorter prompt and a summary-length answer
+# from the fast model; over it, the local answer.
+# ──────────────────────────────────────────────────────────────
+
+# how long a finished turn is replayed for a retry with the same idempotency key
+TURN_REPLAY_SECONDS = 600
+
+
+@dataclass
+class ChatReply:
+    text: str
+    emergency: bool = False
+    halted: bool = False
+    degraded: bool = False
+
+
+def build_prompt(message: str, *, name: str, session_id: str, user_id: str = "", kb=None, brief: bool = False) -> Prompt:
+    """The turn's prompt; ``brief`` keeps one reference and memory and asks for a short answer."""
+    k = 1 if brief else 3
+    references = ""
+    if kb is not None:
+        passages = kb.search(message, k=k)
+        if passages:
+            references = f"{REFERENCES_HEADER}\n" + format_passages(passages)
+
+    recalled = ""
+    if user_id:
+        memories = get_memory_index(user_id).search(message, k=k, exclude_session=session_id)
+        if memories:
+            recalled = f"{RECALLED_HEADER}\n" + format_memories(memories)
+
+    return Prompt(
+        CHAT_SYSTEM.render(),
+        CHAT_USER.render(
+            name=name or "User",
+            context=sections(recalled, references, BRIEF_INSTRUCTION if brief else ""),
+            message=message,
+        ),
+    )
+
+
+def turn_key(session_id: str, message: str) -> str:
+    """Single-flight key for a message when the caller has no idempotency key."""
+    digest = hashlib.sha1(message.strip().encode("utf-8")).hexdigest()
+    return f"{session_id}:msg:{digest}"
+
+
+def remember(user_id: str, message: str, session_id: str) -> None:
+    """Store a user message for recall in ``user_id``'s later sessions (best-effort)."""
+    try:
+        get_memory_index(user_id).add(message, session_id)
+    except OSError:
+        pass  # memory is best-effort; never block the chat on it
+
+
+async def _finish(text: str, scan, model, user: str, lane: str) -> ChatReply:
+    halted = not await passes_review(scan, model=model, user=user, lane=lane)
+    return ChatReply(HALTED_MESSAGE if halted else text, halted=halted)
+
+
+def _emergency(message: str, *, name: str, session_id: str, snapshot: Optional[dict]) -> Optional[ChatReply]:
+    """Emergencies never wait on the model."""
+    red_flag = detect_red_flag(message)
+    if not red_flag:
+        return None
+    try:
+        escalate_red_flag(red_flag, session_id=session_id, user_name=name, snapshot=snapshot)
+    except OSError:
+        pass  # the user already has the emergency guidance
+    return ChatReply(red_flag.response, emergency=True)
+
+
+async def _degraded(message: str, *, name: str, user_id: str, kb, note: str = DEGRADED_NOTE) -> ChatReply:
+    text = await asyncio.to_thread(degraded_answer, message, user=user_id, kb=kb, name=name, note=note)
+    return ChatReply(text, degraded=True)
+
+
+def _charged(user_id: str, session_id: str):
+    return token_usage.attribute(session=session_id, user=user_id, kind="chat")
+
+
+def _keep(message: str, prompt: Prompt, reply: ChatReply, *, name: str, user_id: str) -> None:
+    """Cache a full answer for degraded mode; personal ones only for their user."""
+    if reply.halted:
+        return
+    shared = RECALLED_HEADER not in prompt.user and not (name and name.lower() in reply.text.lower())
+    get_response_cache().put(message, user_id, reply.text, shared=shared)
+
+
+async def chat_reply(
+    message: str,
+    *,
+    name: str,
+    session_id: str,
+    user_id: str = "",
+    kb=None,
+    snapshot: Optional[dict] = None,
+    model=None,
+    lane: str = INTERACTIVE,
+) -> ChatReply:
+    """Answer one message with a single (non-streamed) generation."""
+    user_id = user_id or session_id
+    emergency = _emergency(message, name=name, session_id=session_id, snapshot=snapshot)
+    if emergency:
+        return emergency
+    budget = token_usage.budget_action(session_id, user_id)
+    if budget == token_usage.REFUSE:
+        return await _degraded(message, name=name, user_id=user_id, kb=kb, note=BUDGET_NOTE)
+    shedder = get_load_shedder() if lane == INTERACTIVE else None
+    if shedder and shedder.should_degrade():
+        return await _degraded(message, name=name, user_id=user_id, kb=kb)
+
+    start = time.monotonic()
+    brief = budget == token_usage.SUMMARIZE
+    prompt = await asyncio.to_thread(
+        build_prompt, message, name=name, session_id=session_id, user_id=user_id, kb=kb, brief=brief
+    )
+    generate = functools.partial(
+        model_gateway.generate, prompt.user, system=prompt.system, model=model, user=user_id, lane=lane,
+        tier=FAST if brief else classify_query(message),
+    )
+    with _charged(user_id, session_id):
+        if shedder is None:
+            text = await generate()
+        else:
+            try:
+                # the quota wait and the model call share the turn's deadline (utils/deadline.py)
+                with deadline(TURN_TIMEOUT_SECONDS):
+                    text = await within(generate())
+            except Exception:  # timed out or failed: a local answer beats an error
+                shedder.observe(time.monotonic() - start)
+                return await _degraded(message, name=name, user_id=user_id, kb=kb)
+            shedder.observe(time.monotonic() - start)
+        reply = await _finish(text, scan_text(text), model, user_id, lane)
+    _keep(message, prompt, reply, name=name, user_id=user_id)
+    return reply
+
+
+async def stream_chat_reply(
+    message: str,
+    *,
+    name: str,
+    session_id: str,
+    user_id: str = "",
+    kb=None,
+    snapshot: Optional[dict] = None,
+    model=None,
+    lane: str = INTERACTIVE,
+) -> AsyncIterator[Union[str, ChatReply]]:
+    """Yield text chunks as they pass the incremental scan, then the ChatReply.
+
+    If the scan halts the response mid-stream, no further chunks are yielded
+    and the final reply carries ``halted=True`` with the replacement text.
+    A degraded turn yields only the final reply.
+    """
+    user_id = user_id or session_id
+    emergency = _emergency(message, name=name, session_id=session_id, snapshot=snapshot)
+    if emergency:
+        yield emergency
+        return
+    budget = token_usage.budget_action(session_id, user_id)
+    if budget == token_usage.REFUSE:
+        yield await _degraded(message, name=name, user_id=user_id, kb=kb, note=BUDGET_NOTE)
+        return
+    shedder = get_load_shedder() if lane == INTERACTIVE else None
+    if shedder and shedder.should_degrade():
+        yield await _degraded(message, name=name, user_id=user_id, kb=kb)
+        return
+
+    start = time.monotonic()
+    brief = budget == token_usage.SUMMARIZE
+    prompt = await asyncio.to_thread(
+        build_prompt, message, name=name, session_id=session_id, user_id=user_id, kb=kb, brief=brief
+    )
+    scanner = StreamingOutputScanner()
+    # scopes are not held across this generator's yields; the stream keeps the one it was opened in
+    with _charged(user_id, session_id):
+        chunks = model_gateway.stream(
+            prompt.user, system=prompt.system, model=model, user=user_id, lane=lane, tier=FAST if brief else classify_query(message)
+        )
+    try:
+        try:
+            # the user is waiting for the first chunk: that is what is bounded
+            first = await (chunks.__anext__() if shedder is None
+                           else asyncio.wait_for(chunks.__anext__(), TURN_TIMEOUT_SECONDS))
+        except StopAsyncIteration:
+            first = None
+        except Exception:
+            if shedder is None:
+                raise
+            shedder.observe(time.monotonic() - start)
+            yield await _degraded(message, name=name, user_id=user_id, kb=kb)
+            return
+        if shedder:
+            shedder.observe(time.monotonic() - start)
+        if first is not None and not scanner.feed(first).halted:
+            yield first
+            async for chunk in chunks:
+                if scanner.feed(chunk).halted:
+                    break
+                yield chunk
+    finally:
+        await chunks.aclose()
+    with _charged(user_id, session_id):
+        reply = await _finish(scanner.text.strip(), scanner.close(), model, user_id, lane)
+    _keep(message, prompt, reply, name=name, user_id=user_id)
+    yield reply
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Awaitable, Callable, List, Sequence
+
+from pydantic import BaseModel
+
+from utils import metrics
+
+# ──────────────────────────────────────────────────────────────
+# Concurrent steps over one session context
+#
+# Each step gets its own deep copy of the context, so concurrent steps never
+# observe each other's half-finished writes.  Afterwards the copies are merged
+# back into the shared context:
+#   list fields   entries appended by any step are appended, in step order
+#   other fields  a changed value is taken; if several steps changed the same
+#                 field differently, the later step wins and it is logged
+# ──────────────────────────────────────────────────────────────
+
+Step = Callable[[BaseModel], Awaitable[object]]
+
+
+def merge_into(target: BaseModel, before: BaseModel, copies: Sequence[BaseModel]) -> List[str]:
+    """Merge the changes each copy made relative to ``before``; returns conflicting fields."""
+    conflicts = []
+    for name in type(target).model_fields:
+        original = getattr(before, name)
+        values = [getattr(copy, name) for copy in copies]
+
+        if isinstance(original, list) and all(isinstance(v, list) and v[:len(original)] == original for v in values):
+            appended = [item for v in values for item in v[len(original):]]
+            if appended:
+                setattr(target, name, list(original) + appended)
+            continue
+
+        changed = [v for v in values if v != original]
+        if not changed:
+            continue
+        if any(v != changed[-1] for v in changed):
+            conflicts.append(name)
+        setattr(target, name, changed[-1])
+
+    for name in conflicts:
+        metrics.inc("context_merge_conflicts_total", field=name)
+    return conflicts
+
+
+async def run_concurrently(context: BaseModel, *steps: Step) -> list:
+    """Run ``steps`` with asyncio.gather on isolated copies, then merge into ``context``."""
+    before = context.model_copy(deep=True)
+    copies = [context.model_copy(deep=True) for _ in steps]
+    results = await asyncio.gather(*(step(copy) for step, copy in zip(steps, copies)))
+    merge_into(context, before, copies)
+    return list(results)
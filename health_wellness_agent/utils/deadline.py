@@ -0,0 +1,150 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Awaitable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from utils import metrics
+
+# ──────────────────────────────────────────────────────────────
+# Per-turn deadlines
+#
+# A turn opens ``deadline(seconds)``; the Deadline lives in a context
+# variable, so every coroutine and task started inside the turn sees it:
+# guardrail runs, the planner and the agents it hands off to, tool calls and
+# model calls through utils/model_gateway.py.  Work is bounded with
+# ``await within(coro, stage)``, which cancels the awaited work once the
+# turn's budget is spent and raises DeadlineExceeded.  Nested ``within``
+# calls share the same absolute expiry, so the innermost one usually fires
+# first and the outer ones re-raise it.
+#
+# Stages (``within``, ``stage()``, or ``enter``/``leave`` from agent run
+# hooks) are also timed, so when the budget is blown the Deadline records
+# which stage was running (the most recently entered one still active):
+# ``Deadline.blown``, deadline_exceeded_total{stage}, a WARNING log line and
+# deadline_stage_seconds{stage}.  Callers turn DeadlineExceeded into a
+# partial answer instead of an error (agent.run_planner, chat_service).
+#
+#   HEALTH_PLANNER_DEADLINE_SECONDS   budget of one planner turn (45)
+# ──────────────────────────────────────────────────────────────
+
+PLANNER_DEADLINE_SECONDS = float(os.getenv("HEALTH_PLANNER_DEADLINE_SECONDS", "45"))
+TIMER_SLACK_SECONDS = 0.001
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    def __init__(self, stage: str, budget: float):
+        super().__init__(f"turn deadline of {budget:g}s exceeded in {stage}")
+        self.stage = stage
+        self.budget = budget
+
+
+@dataclass
+class Deadline:
+    budget: float
+    expires_at: float
+    blown: Optional[str] = None                           # stage running when the budget ran out
+    spent: Dict[str, float] = field(default_factory=dict)  # seconds per finished stage
+    _active: List[Tuple[str, float]] = field(default_factory=list)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        # event loop timers may fire up to a clock tick early
+        return time.monotonic() + TIMER_SLACK_SECONDS >= self.expires_at
+
+    def enter(self, stage: str) -> None:
+        self._active.append((stage, time.monotonic()))
+
+    def leave(self, stage: str) -> None:
+        if self.blown is None and self.expired:
+            self.expire()  # unwinding after the budget ran out: innermost stages leave first
+        for i in range(len(self._active) - 1, -1, -1):
+            if self._active[i][0] == stage:
+                _, started = self._active.pop(i)
+                seconds = time.monotonic() - started
+                self.spent[stage] = self.spent.get(stage, 0.0) + seconds
+                metrics.observe("deadline_stage_seconds", seconds, stage=_family(stage))
+                return
+
+    def expire(self) -> str:
+        """Record the stage that blew the budget (first call wins) and return it."""
+        if self.blown is None:
+            self.blown = max(self._active, key=lambda a: a[1])[0] if self._active else "turn"
+            metrics.inc("deadline_exceeded_total", stage=_family(self.blown))
+            log.warning("turn deadline of %gs exceeded in %s (active: %s)", self.budget, self.blown,
+                        ", ".join(name for name, _ in self._active) or "none")
+        return self.blown
+
+
+def _family(stage: str) -> str:
+    """Metric label for a stage: ``tool:plan_meals`` -> ``tool``."""
+    return stage.partition(":")[0]
+
+
+_current: "contextvars.ContextVar[Optional[Deadline]]" = contextvars.ContextVar("health_deadline", default=None)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[Deadline]:
+    """Bound everything started inside the block to ``seconds`` in total.
+
+    An enclosing deadline that expires sooner still wins.
+    """
+    outer = _current.get()
+    expires_at = time.monotonic() + seconds
+    if outer is not None and outer.expires_at < expires_at:
+        yield outer
+        return
+    token = _current.set(Deadline(seconds, expires_at))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the current turn (a no-op outside a deadline)."""
+    current_deadline = _current.get()
+    if current_deadline is None:
+        yield
+        return
+    current_deadline.enter(name)
+    try:
+        yield
+    finally:
+        current_deadline.leave(name)
+
+
+async def within(awaitable: Awaitable[T], stage_name: Optional[str] = None) -> T:
+    """Await ``awaitable``, cancelled when the turn's budget runs out.
+
+    With ``stage_name`` the wait is timed (and blamed) as that stage; without
+    it the enclosing stage is.
+    """
+    current_deadline = _current.get()
+    if current_deadline is None:
+        return await awaitable
+    with stage(stage_name) if stage_name else nullcontext():
+        try:
+            return await asyncio.wait_for(awaitable, current_deadline.remaining())
+        except DeadlineExceeded:
+            raise
+        except asyncio.TimeoutError:
+            if not current_deadline.expired:
+                raise  # a timeout of the work itself, not ours
+            raise DeadlineExceeded(current_deadline.expire(), current_deadline.budget) from None
@@ -0,0 +1,335 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Callable, Deque, List, Optional, Tuple
+
+from knowledge.bm25_index import format_passages
+from utils import metrics
+from utils.rate_limit import INTERACTIVE, get_rate_limiter
+
+# ──────────────────────────────────────────────────────────────
+# Graceful degradation under overload
+#
+# Interactive turns watch two signals: how many interactive model calls are
+# queued on the rate limiter and the p95 of recent turn latencies (time to
+# the first chunk for streamed turns).  When either crosses its threshold the
+# shedder switches to degraded mode and turns are answered locally, in
+# order of preference:
+#   1. the response cache (earlier full answers to the same question)
+#   2. locally computed tool output: meal/workout plans from
+#      tools/plan_builders.py, a progress summary from the session context
+#   3. the knowledge base passages for the question
+#   4. a short topic template
+# Degraded answers carry DEGRADED_NOTE (BUDGET_NOTE for a turn over its
+# token budget, utils/token_usage.py) and ``degraded=True``.  A turn that
+# runs longer than TURN_TIMEOUT_SECONDS (or fails) is answered the same way,
+# so no user waits on the model beyond that bound.  A planner turn cut short
+# by its deadline (utils/deadline.py) gets ``partial_answer``: whatever its
+# tools produced in time, else the local answer.
+#
+# Recovery is automatic: every PROBE_EVERY-th turn in degraded mode still
+# goes to the model to measure it, samples expire after WINDOW_SECONDS, and
+# the shedder returns to full service once both signals are below
+# RECOVER_FRACTION of their thresholds (after at least MIN_DEGRADED_SECONDS).
+#
+#   HEALTH_DEGRADE_QUEUE_DEPTH     queued interactive calls that trigger it (16)
+#   HEALTH_DEGRADE_P95_SECONDS     turn latency p95 that triggers it (8)
+#   HEALTH_TURN_TIMEOUT_SECONDS    longest wait for the model in a turn (20)
+#
+# Background work (ANALYZE, batch jobs) is never degraded; it can wait.
+# ──────────────────────────────────────────────────────────────
+
+DEGRADE_QUEUE_DEPTH = int(os.getenv("HEALTH_DEGRADE_QUEUE_DEPTH", "16"))
+DEGRADE_P95_SECONDS = float(os.getenv("HEALTH_DEGRADE_P95_SECONDS", "8"))
+TURN_TIMEOUT_SECONDS = float(os.getenv("HEALTH_TURN_TIMEOUT_SECONDS", "20"))
+RECOVER_FRACTION = 0.5
+MIN_DEGRADED_SECONDS = 15.0
+MIN_SAMPLES = 5             # latency samples needed before p95 counts
+WINDOW_SIZE = 50
+WINDOW_SECONDS = 60.0
+PROBE_EVERY = 5
+CACHE_ENTRIES = 2048
+CACHE_TTL_SECONDS = 24 * 3600
+
+DEGRADED_NOTE = (
+    "_⚠️ Simplified answer: the assistant is under heavy load right now. "
+    "Ask again in a minute for a full answer._"
+)
+BUDGET_NOTE = (
+    "_🪙 Simplified answer: this conversation has used its token budget. "
+    "Start a new session, or come back tomorrow, for full answers._"
+)
+PARTIAL_NOTE = (
+    "_⏱️ Partial answer: the full answer took too long, so this is what was "
+    "ready in time. Ask again for the rest._"
+)
+
+log = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    from context import UserSessionContext
+
+
+def _interactive_queue_depth() -> int:
+    return sum(get_rate_limiter().waiting()[INTERACTIVE].values())
+
+
+class LoadShedder:
+    """Decides per turn whether to call the model or answer locally."""
+
+    def __init__(self, queue_depth: int = DEGRADE_QUEUE_DEPTH, p95_seconds: float = DEGRADE_P95_SECONDS,
+                 depth: Callable[[], int] = _interactive_queue_depth, clock: Callable[[], float] = time.monotonic):
+        self.queue_depth = queue_depth
+        self.p95_seconds = p95_seconds
+        self.depth = depth
+        self.clock = clock
+        self.degraded = False
+        self.since = 0.0
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=WINDOW_SIZE)  # (at, seconds)
+        self._turns = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        """Record how long a full-service turn kept its user waiting."""
+        with self._lock:
+            self._samples.append((self.clock(), seconds))
+
+    def _p95(self, now: float) -> float:
+        while self._samples and now - self._samples[0][0] > WINDOW_SECONDS:
+            self._samples.popleft()
+        if len(self._samples) < MIN_SAMPLES:
+            return 0.0
+        ordered = sorted(seconds for _, seconds in self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _update(self, now: float) -> None:
+        depth, p95 = self.depth(), self._p95(now)
+        if not self.degraded:
+            if depth >= self.queue_depth or p95 >= self.p95_seconds:
+                reason = "queue_depth" if depth >= self.queue_depth else "latency"
+                self.degraded, self.since = True, now
+                metrics.inc("degraded_mode_total", reason=reason)
+                metrics.set_gauge("degraded_mode", 1)
+                log.warning("entering degraded mode (%s): %d queued, p95 %.1fs", reason, depth, p95)
+        elif (now - self.since >= MIN_DEGRADED_SECONDS
+              and depth < self.queue_depth * RECOVER_FRACTION and p95 < self.p95_seconds * RECOVER_FRACTION):
+            self.degraded = False
+            metrics.set_gauge("degraded_mode", 0)
+            log.warning("back to full service after %.0fs", now - self.since)
+
+    def should_degrade(self) -> bool:
+        """True if this turn should be answered locally."""
+        with self._lock:
+            self._update(self.clock())
+            if not self.degraded:
+                return False
+            self._turns += 1
+            return self._turns % PROBE_EVERY != 0  # the rest probe the model
+
+
+class ResponseCache:
+    """Recent full answers by normalised question, per user plus a shared tier.
+
+    Only answers without personal context go to the shared tier.
+    """
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES, ttl: float = CACHE_TTL_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalise(message: str) -> str:
+        return " ".join(re.findall(r"[a-z0-9]+", message.lower()))
+
+    def get(self, message: str, user: str) -> Optional[str]:
+        question = self.normalise(message)
+        now = self.clock()
+        with self._lock:
+            for key in ((user, question), ("", question)):
+                entry = self._entries.get(key)
+                if entry and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+        return None
+
+    def put(self, message: str, user: str, text: str, *, shared: bool = False) -> None:
+        question = self.normalise(message)
+        if not question:
+            return
+        expires = self.clock() + self.ttl
+        with self._lock:
+            for key in ((user, question),) + ((("", question),) if shared else ()):
+                self._entries[key] = (expires, text)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# ── local answers ──────────────────────────────────────────────
+
+_MEAL_RE = re.compile(r"\b(meals?|diet|eat|eating|food|nutrition|recipes?)\b", re.IGNORECASE)
+_WORKOUT_RE = re.compile(r"\b(workouts?|exercises?|exercising|training|gym|cardio|strength|fitness)\b", re.IGNORECASE)
+_VEGETARIAN_RE = re.compile(r"\bvegetarian\b", re.IGNORECASE)
+_NOT_VEGETARIAN_RE = re.compile(r"(?:\bnot|n't|\bnon|\bno longer)[\s-]+(?:an?\s+)?vegetarian\b", re.IGNORECASE)
+_PLAN_RE = re.compile(r"\b(plans?|schedule|routine|program|programme|week|ideas?|suggest\w*)\b", re.IGNORECASE)
+_PROGRESS_RE = re.compile(r"\b(progress|how am i doing|so far|summary|recap)\b", re.IGNORECASE)
+
+TEMPLATES = [
+    (re.compile(r"\b(sleep|insomnia|tired|fatigue|rest)\b", re.IGNORECASE),
+     "Keep a fixed wake-up time, get daylight in the morning, avoid caffeine after "
+     "midday and screens in the last hour before bed, and keep the bedroom cool and "
+     "dark. If poor sleep lasts more than a few weeks, talk to a doctor."),
+    (re.compile(r"\b(water|hydrat\w*|drink)\b", re.IGNORECASE),
+     "Most adults do well with about 2 to 3 litres of fluid a day, more in heat or "
+     "when exercising. Pale yellow urine is a good sign you are drinking enough."),
+    (re.compile(r"\b(stress|anxious|anxiety|overwhelmed|burnout)\b", re.IGNORECASE),
+     "Short daily walks, slow breathing (4 seconds in, 6 out for a few minutes), "
+     "regular sleep and talking to someone you trust all help. If stress is "
+     "affecting daily life, please reach out to a health professional."),
+    (_WORKOUT_RE,
+     "Aim for about 150 minutes of moderate activity a week plus two short strength "
+     "sessions. Start easy, increase gradually and keep at least one rest day."),
+    (_MEAL_RE,
+     "Build meals around vegetables, a source of protein and whole grains, keep "
+     "processed snacks and sugary drinks occasional, and eat at regular times."),
+]
+DEFAULT_TEMPLATE = (
+    "Good basics cover most goals: regular meals built on whole foods, about 150 "
+    "minutes of activity a week, 7 to 9 hours of sleep and enough water. For "
+    "anything specific or worrying, please consult a healthcare professional."
+)
+
+
+def _bullets(lines: List[str]) -> str:
+    return "\n".join(f"- {line}" for line in lines)
+
+
+def _plans(message: str, context: "UserSessionContext") -> Optional[str]:
+    # imported here: pydantic and the plan builders are only needed once degraded
+    from tools.plan_builders import build_meal_plan, build_workout_plan, parse_goal
+
+    goal = parse_goal(message, context)
+    wants_meals = bool(_MEAL_RE.search(message))
+    wants_workouts = bool(_WORKOUT_RE.search(message))
+    if goal["metric"]:
+        wants_meals = wants_workouts = True
+    elif not (_PLAN_RE.search(message) and (wants_meals or wants_workouts)):
+        return None
+    if (not context.diet_preferences and _VEGETARIAN_RE.search(message)
+            and not _NOT_VEGETARIAN_RE.search(message)):
+        context.diet_preferences = "vegetarian"  # a copy (local_answer): only this answer uses it
+
+    parts = []
+    if goal["metric"]:
+        parts.append(f"{goal['description']}: {goal['quantity']:g} {goal['metric']}"
+                     + (f" in {goal['duration']}" if goal["duration"] else "") + ".")
+    if wants_meals:
+        parts.append("A 7-day meal plan to start with:\n" + _bullets(build_meal_plan(context)))
+    if wants_workouts:
+        parts.append("A 7-day workout plan to start with:\n" + _bullets(build_workout_plan(context)))
+    return "\n\n".join(parts)
+
+
+def _progress(message: str, context: Optional["UserSessionContext"]) -> Optional[str]:
+    if context is None or not _PROGRESS_RE.search(message):
+        return None
+    updates = [entry["message"] for entry in context.progress_logs if entry.get("event") == "user_update"]
+    parts = []
+    if context.goal and context.goal.get("metric"):
+        parts.append(f"Goal: {context.goal['description']} of {context.goal['quantity']:g} {context.goal['metric']}.")
+    if updates:
+        parts.append("Your recent updates:\n" + _bullets(updates[-5:]))
+    if context.meal_plan or context.workout_plan:
+        parts.append("Your meal and workout plans are in place.")
+    return "\n\n".join(parts) or None
+
+
+def local_answer(message: str, *, context: Optional["UserSessionContext"] = None, kb=None,
+                 name: str = "") -> Tuple[str, str]:
+    """Answer without the model; returns ``(text, source)``.
+
+    Plan builders work on a copy of ``context`` (or a throwaway one): a
+    fallback answer never changes the session's goal, diet or plans.
+    """
+    text = _progress(message, context)
+    if text:
+        return text, "progress"
+    if context is None:
+        from context import UserSessionContext
+
+        context = UserSessionContext(name=name or "User", uid=0)
+    else:
+        context = context.model_copy(deep=True)
+    text = _plans(message, context)
+    if text:
+        return text, "plan"
+    if kb is not None:
+        passages = kb.search(message, k=2)
+        if passages:
+            return "From the reference library:\n" + format_passages(passages, max_chars=400), "knowledge"
+    for pattern, template in TEMPLATES:
+        if pattern.search(message):
+            return template, "template"
+    return DEFAULT_TEMPLATE, "template"
+
+
+def degraded_answer(message: str, *, user: Optional[str], context: Optional["UserSessionContext"] = None,
+                    kb=None, name: str = "", note: str = DEGRADED_NOTE) -> str:
+    """Best local answer for ``message``, marked with ``note``.
+
+    ``user`` scopes the response cache; pass None to skip the cache.
+    """
+    text = get_response_cache().get(message, user) if user is not None else None
+    source = "cache"
+    if text is None:
+        text, source = local_answer(message, context=context, kb=kb, name=name)
+    metrics.inc("degraded_answers_total", source=source)
+    return f"{text}\n\n{note}"
+
+
+def plan_state(context: "UserSessionContext") -> dict:
+    """What the plan tools have written to ``context`` so far (see ``partial_answer``)."""
+    return {"goal": context.goal, "meal_plan": context.meal_plan, "workout_plan": context.workout_plan}
+
+
+def partial_answer(message: str, *, context: "UserSessionContext", before: dict) -> str:
+    """Answer for a turn cut short by its deadline (utils/deadline.py).
+
+    Shows what the turn's tools produced since ``before`` (a ``plan_state``
+    taken at the start of the turn); when they produced nothing, the best
+    local answer.
+    """
+    parts = []
+    goal = context.goal
+    if goal and goal.get("metric") and goal != before["goal"]:
+        parts.append(f"{goal['description']}: {goal['quantity']:g} {goal['metric']}"
+                     + (f" in {goal['duration']}" if goal.get("duration") else "") + ".")
+    if context.meal_plan and context.meal_plan != before["meal_plan"]:
+        parts.append("Your 7-day meal plan:\n" + _bullets(context.meal_plan))
+    if context.workout_plan and context.workout_plan != before["workout_plan"]:
+        parts.append("Your 7-day workout plan:\n" + _bullets(context.workout_plan["schedule"]))
+    if parts:
+        text, source = "\n\n".join(parts), "partial"
+    else:
+        text, source = local_answer(message, context=context)
+    metrics.inc("degraded_answers_total", source=source)
+    return f"{text}\n\n{PARTIAL_NOTE}"
+
+
+_shedder = LoadShedder()
+_cache = ResponseCache()
+
+
+def get_load_shedder() -> LoadShedder:
+    return _shedder
+
+
+def get_response_cache() -> ResponseCache:
+    return _cache
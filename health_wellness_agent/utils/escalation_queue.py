@@ -0,0 +1,323 @@
+"""Priority queue of sessions escalated to human staff.
+
+Tickets are served earliest-deadline-first: each urgency level has an SLA and
+a ticket's deadline is ``enqueued_at + SLA``.  That single heap key orders by
+urgency *and* wait time (a normal ticket that has waited long enough overtakes
+a fresh high one), so enqueue and claim stay O(log n).
+
+State is persisted as an append-only JSONL journal (utils/journal.py) that is
+replayed on start and compacted once it is mostly closed tickets.  The app
+and the staff CLI are separate processes sharing that journal: every
+mutation takes the journal lock and first applies what the other side
+appended, and reads pick up the tail, so claims and resolutions made from
+the CLI reach the app.  Time-to-claim and SLA breaches are observed by every
+process that applies a claim, i.e. computed from the journal in the app.
+
+Inside ``hold_escalations()`` nothing is queued: escalations are collected
+for the caller instead (batch runs over historical records, where nobody is
+waiting for a human).
+
+Staff CLI (from the health_wellness_agent directory):
+
+    python -m utils.escalation_queue list
+    python -m utils.escalation_queue claim <staff-name>
+    python -m utils.escalation_queue resolve <ticket-id>
+"""
+import heapq
+import itertools
+import json
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from utils import metrics
+from utils.journal import Journal
+
+SLA_SECONDS = {
+    "emergency": 60,
+    "high": 15 * 60,
+    "normal": 4 * 60 * 60,
+    "low": 24 * 60 * 60,
+}
+COMPACT_AFTER = 1000  # closed journal entries before the journal is rewritten
+
+_held: ContextVar[Optional[List[dict]]] = ContextVar("held_escalations", default=None)
+
+
+@contextmanager
+def hold_escalations() -> Iterator[List[dict]]:
+    """Collect escalations raised inside the block (``{"urgency", "reason"}``) instead of queueing them."""
+    held: List[dict] = []
+    token = _held.set(held)
+    try:
+        yield held
+    finally:
+        _held.reset(token)
+
+
+@dataclass
+class Ticket:
+    id: str
+    session_id: str
+    user_name: str
+    urgency: str
+    reason: str
+    enqueued_at: float
+    deadline: float
+    snapshot: dict = field(default_factory=dict)
+    status: str = "open"              # open | claimed | resolved | cancelled | held (never queued)
+    claimed_by: Optional[str] = None
+    claimed_at: Optional[float] = None
+
+    @property
+    def wait_seconds(self) -> float:
+        return (self.claimed_at or time.time()) - self.enqueued_at
+
+
+class EscalationQueue:
+    def __init__(self, journal_path: str):
+        self.journal_path = journal_path
+        self._journal = Journal(journal_path)
+        self._lock = threading.Lock()
+        self._reset()
+        self._sync(live=False)
+
+    # ── persistence ───────────────────────────────────────────
+    def _reset(self) -> None:
+        self._heap: list = []                # (deadline, seq, ticket_id)
+        self._seq = itertools.count()
+        self._tickets: Dict[str, Ticket] = {}
+        self._open_by_session: Dict[str, str] = {}
+        self._closed_entries = 0
+
+    def _sync(self, live: bool = True) -> None:
+        """Apply what other processes appended since the last sync (under ``self._lock``).
+
+        ``live`` events are claims happening now, observed in the SLA metrics;
+        the journal replayed at start up is history.
+        """
+        reset, events = self._journal.read_new()
+        if reset:  # another process compacted: rebuild, observing claims made since we last looked
+            was_open = {t.id for t in self._tickets.values() if t.status == "open"}
+            self._reset()
+        for event in events:
+            self._apply(event, live=live and not reset)
+        if reset and live:
+            for ticket in self._tickets.values():
+                if ticket.id in was_open and ticket.status == "claimed":
+                    self._observe_claim(ticket)
+        self._update_gauges()
+
+    @contextmanager
+    def _mutating(self) -> Iterator[None]:
+        """Both locks held and the journal tail applied: decide, then ``_append``."""
+        with self._lock, self._journal.locked():
+            self._sync()
+            yield
+
+    def _append(self, event: dict) -> None:
+        self._journal.append(event)
+        self._apply(event, live=True)
+        if self._closed_entries >= COMPACT_AFTER:
+            self._compact()
+
+    def refresh(self) -> None:
+        """Pick up claims and resolutions made by other processes (e.g. the staff CLI)."""
+        with self._lock:
+            self._sync()
+
+    def _apply(self, event: dict, live: bool = False) -> None:
+        op = event["op"]
+        if op == "enqueue":
+            ticket = Ticket(**event["ticket"])
+            self._tickets[ticket.id] = ticket
+            if ticket.status == "open":
+                self._open_by_session[ticket.session_id] = ticket.id
+                heapq.heappush(self._heap, (ticket.deadline, next(self._seq), ticket.id))
+            elif ticket.status == "claimed":
+                self._open_by_session[ticket.session_id] = ticket.id
+            return
+
+        ticket = self._tickets.get(event["id"])
+        if ticket is None:
+            return
+        if op == "upgrade":
+            ticket.urgency = event["urgency"]
+            ticket.deadline = event["deadline"]
+            # the old heap entry is skipped lazily: its deadline no longer matches
+            heapq.heappush(self._heap, (ticket.deadline, next(self._seq), ticket.id))
+        elif op == "claim":
+            ticket.status = "claimed"
+            ticket.claimed_by = event["by"]
+            ticket.claimed_at = event["at"]
+            if live:
+                self._observe_claim(ticket)
+        elif op in ("resolve", "cancel"):
+            ticket.status = "resolved" if op == "resolve" else "cancelled"
+            self._open_by_session.pop(ticket.session_id, None)
+            self._closed_entries += 1
+
+    def _compact(self) -> None:
+        # called from _append, so the journal lock is held and its tail applied
+        live = [t for t in self._tickets.values() if t.status in ("open", "claimed")]
+        self._journal.rewrite({"op": "enqueue", "ticket": asdict(ticket)} for ticket in live)
+        self._tickets = {t.id: t for t in live}
+        self._heap = [entry for entry in self._heap if entry[2] in self._tickets]
+        heapq.heapify(self._heap)
+        self._closed_entries = 0
+
+    @staticmethod
+    def _observe_claim(ticket: Ticket) -> None:
+        metrics.observe("escalation_time_to_claim_seconds", ticket.claimed_at - ticket.enqueued_at, urgency=ticket.urgency)
+        if ticket.claimed_at > ticket.deadline:
+            metrics.inc("escalation_sla_breaches_total", urgency=ticket.urgency)
+
+    def _update_gauges(self) -> None:
+        now = time.time()
+        depth: Dict[str, int] = {level: 0 for level in SLA_SECONDS}
+        overdue: Dict[str, int] = {level: 0 for level in SLA_SECONDS}
+        for ticket in self._tickets.values():
+            if ticket.status == "open":
+                depth[ticket.urgency] = depth.get(ticket.urgency, 0) + 1
+                if now > ticket.deadline:
+                    overdue[ticket.urgency] = overdue.get(ticket.urgency, 0) + 1
+        for level, count in depth.items():
+            metrics.set_gauge("escalation_queue_depth", count, urgency=level)
+            metrics.set_gauge("escalation_queue_overdue", overdue[level], urgency=level)
+
+    # ── producer side ─────────────────────────────────────────
+    def enqueue(
+        self,
+        session_id: str,
+        user_name: str,
+        reason: str,
+        urgency: str = "normal",
+        snapshot: Optional[dict] = None,
+    ) -> Ticket:
+        """Queue a session for a human; re-escalating an open session can only raise its urgency."""
+        if urgency not in SLA_SECONDS:
+            urgency = "normal"
+        now = time.time()
+        held = _held.get()
+        if held is not None:
+            held.append({"urgency": urgency, "reason": reason})
+            metrics.inc("escalations_held_total", urgency=urgency)
+            return Ticket(id="held", session_id=session_id, user_name=user_name, urgency=urgency, reason=reason,
+                          enqueued_at=now, deadline=now + SLA_SECONDS[urgency], status="held")
+        with self._mutating():
+            existing_id = self._open_by_session.get(session_id)
+            if existing_id:
+                ticket = self._tickets[existing_id]
+                deadline = ticket.enqueued_at + SLA_SECONDS[urgency]
+                if ticket.status == "open" and deadline < ticket.deadline:
+                    self._append({"op": "upgrade", "id": ticket.id, "urgency": urgency, "deadline": deadline})
+                    self._update_gauges()
+                return ticket
+
+            ticket = Ticket(
+                id=uuid.uuid4().hex[:12],
+                session_id=session_id,
+                user_name=user_name,
+                urgency=urgency,
+                reason=reason,
+                enqueued_at=now,
+                deadline=now + SLA_SECONDS[urgency],
+                snapshot=snapshot or {},
+            )
+            self._append({"op": "enqueue", "ticket": asdict(ticket)})
+            metrics.inc("escalations_total", urgency=urgency)
+            self._update_gauges()
+            return ticket
+
+    def position(self, ticket_id: str) -> int:
+        """1-based position of an open ticket (O(n); for user-facing messages only)."""
+        with self._lock:
+            self._sync()
+            ticket = self._tickets.get(ticket_id)
+            if ticket is None or ticket.status != "open":
+                return 0
+            return 1 + sum(
+                1 for t in self._tickets.values()
+                if t.status == "open" and (t.deadline, t.enqueued_at) < (ticket.deadline, ticket.enqueued_at)
+            )
+
+    # ── staff side ────────────────────────────────────────────
+    def claim(self, staff: str) -> Optional[Ticket]:
+        """Take the most urgent open ticket, or None if the queue is empty."""
+        with self._mutating():
+            while self._heap:
+                deadline, _, ticket_id = heapq.heappop(self._heap)
+                ticket = self._tickets.get(ticket_id)
+                if ticket is None or ticket.status != "open" or ticket.deadline != deadline:
+                    continue  # stale entry (claimed, cancelled or upgraded)
+                self._append({"op": "claim", "id": ticket.id, "by": staff, "at": time.time()})
+                self._update_gauges()
+                return ticket
+            return None
+
+    def resolve(self, ticket_id: str) -> bool:
+        return self._close(ticket_id, "resolve")
+
+    def cancel(self, ticket_id: str) -> bool:
+        return self._close(ticket_id, "cancel")
+
+    def _close(self, ticket_id: str, op: str) -> bool:
+        with self._mutating():
+            ticket = self._tickets.get(ticket_id)
+            if ticket is None or ticket.status not in ("open", "claimed"):
+                return False
+            self._append({"op": op, "id": ticket_id})
+            self._update_gauges()
+            return True
+
+    def open_tickets(self) -> List[Ticket]:
+        with self._lock:
+            self._sync()
+            tickets = [t for t in self._tickets.values() if t.status in ("open", "claimed")]
+        return sorted(tickets, key=lambda t: (t.status != "open", t.deadline))
+
+    def depth(self) -> int:
+        with self._lock:
+            self._sync()
+            return sum(1 for t in self._tickets.values() if t.status == "open")
+
+
+_queue: Optional[EscalationQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_escalation_queue() -> EscalationQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            from utils.paths import data_path
+            _queue = EscalationQueue(data_path("escalations", "journal.jsonl"))
+            metrics.add_collector(_queue.refresh)
+        return _queue
+
+
+def _main(argv: List[str]) -> None:
+    queue = get_escalation_queue()
+    command = argv[0] if argv else "list"
+    if command == "list":
+        now = time.time()
+        for t in queue.open_tickets():
+            due = "BREACHED" if now > t.deadline else f"due in {int(t.deadline - now)}s"
+            owner = f" [{t.claimed_by}]" if t.claimed_by else ""
+            print(f"{t.id}  {t.status:<8} {t.urgency:<9} {due:<16} {t.user_name}: {t.reason}{owner}")
+    elif command == "claim" and len(argv) > 1:
+        ticket = queue.claim(argv[1])
+        print(json.dumps(asdict(ticket), indent=2) if ticket else "Queue is empty.")
+    elif command == "resolve" and len(argv) > 1:
+        print("resolved" if queue.resolve(argv[1]) else "no such open ticket")
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])
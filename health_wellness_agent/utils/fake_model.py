@@ -0,0 +1,108 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Iterator, Optional
+
+# ──────────────────────────────────────────────────────────────
+# Local stand-in for google.generativeai.GenerativeModel (HEALTH_FAKE_MODEL=1)
+#
+# Same ``generate_content(prompt, stream=..., system=...)`` surface as the
+# provider wrappers of utils/model_router.py, deterministic canned
+# answers and a configurable latency, so the app, the API and the benchmarks
+# run offline without a key or quota.  HEALTH_FAKE_CONNECT_LATENCY adds a
+# one-off delay to the first call of each instance, like the connection and
+# client setup a real provider pays on its first request.  Responses report
+# token usage like Gemini's ``usage_metadata`` (on the last chunk of a
+# stream), counted at four characters per token.  A system instruction the
+# instance has seen before is reported as cached prompt tokens, like a
+# provider's prefix cache.
+# ──────────────────────────────────────────────────────────────
+
+FIRST_TOKEN_SECONDS = float(os.getenv("HEALTH_FAKE_LATENCY", "0.3"))
+CHUNK_SECONDS = float(os.getenv("HEALTH_FAKE_CHUNK_LATENCY", "0.02"))
+CONNECT_SECONDS = float(os.getenv("HEALTH_FAKE_CONNECT_LATENCY", "0"))
+CHUNK_WORDS = 6
+
+_ANSWERS = [
+    "Aim for regular, balanced meals built around vegetables, lean protein and "
+    "whole grains, stay hydrated, and keep a consistent sleep schedule. Start "
+    "with small changes you can sustain for a few weeks.",
+    "A mix of moderate cardio and two or three short strength sessions a week "
+    "is a solid base. Warm up first, progress gradually and take at least one "
+    "full rest day.",
+    "Track how you feel alongside what you eat and how active you are; patterns "
+    "over a couple of weeks are more useful than any single day. If symptoms "
+    "persist or worsen, please see a healthcare professional.",
+]
+
+
+class FakeUsage:
+    def __init__(self, prompt: str, text: str, system: Optional[str] = None, cached: bool = False):
+        prefix = _tokens(system) if system is not None else 0
+        self.prompt_token_count = prefix + _tokens(prompt)
+        self.candidates_token_count = _tokens(text)
+        self.cached_content_token_count = prefix if cached else 0
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage_metadata: Optional[FakeUsage] = None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def _tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name: str = "fake", first_token_seconds: float = FIRST_TOKEN_SECONDS,
+                 chunk_seconds: float = CHUNK_SECONDS, connect_seconds: float = CONNECT_SECONDS):
+        self.model_name = model_name
+        self.first_token_seconds = first_token_seconds
+        self.chunk_seconds = chunk_seconds
+        self.connect_seconds = connect_seconds
+        self._connect_lock = threading.Lock()
+        self._connect_done = False
+        self._seen_systems = set()
+
+    def _connect(self) -> None:
+        with self._connect_lock:
+            if not self._connect_done:
+                time.sleep(self.connect_seconds)
+                self._connect_done = True
+
+    def probe(self) -> None:
+        """Cheap liveness check (no generation), like listing the provider's models."""
+        self._connect()
+
+    def generate_content(self, prompt: str, stream: bool = False, system: Optional[str] = None, **kwargs):
+        self._connect()
+        text = self.answer(prompt, system)
+        with self._connect_lock:
+            cached = system in self._seen_systems
+            self._seen_systems.add(system)
+        usage = FakeUsage(prompt, text, system, cached)
+        if stream:
+            return self._stream(text, usage)
+        time.sleep(self.first_token_seconds + self.chunk_seconds * self._n_chunks(text))
+        return FakeResponse(text, usage)
+
+    def answer(self, prompt: str, system: Optional[str] = None) -> str:
+        if "SAFE or UNSAFE" in (system or prompt):
+            return "SAFE"
+        digest = int(hashlib.sha1(prompt.encode("utf-8")).hexdigest(), 16)
+        return _ANSWERS[digest % len(_ANSWERS)]
+
+    def _stream(self, text: str, usage: FakeUsage) -> Iterator[FakeResponse]:
+        time.sleep(self.first_token_seconds)
+        words = text.split(" ")
+        for i in range(0, len(words), CHUNK_WORDS):
+            time.sleep(self.chunk_seconds)
+            piece = " ".join(words[i:i + CHUNK_WORDS])
+            last = i + CHUNK_WORDS >= len(words)
+            yield FakeResponse(piece if i == 0 else " " + piece, usage if last else None)
+
+    @staticmethod
+    def _n_chunks(text: str) -> int:
+        return -(-len(text.split(" ")) // CHUNK_WORDS)
@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from utils import metrics
+from utils.degradation import get_load_shedder
+from utils.model_router import ModelRouter, Provider, get_router
+
+# ──────────────────────────────────────────────────────────────
+# Background model warm-up and health probes
+#
+# ``start()`` (called once per worker by main.py and api.py) spawns a daemon
+# thread that first warms every routed provider: it builds the client (SDK
+# import, configuration) and sends one probe, so the connection is open
+# before the first user message arrives.  After that it probes every
+# PROBE_INTERVAL seconds.  Probes use no generation quota where the provider
+# allows it: Gemini ``count_tokens``, Groq ``models.list``, the fake model's
+# ``probe``.  A provider that served real traffic without failing since the
+# last round is not probed at all; the call already proved it healthy.
+#
+# Probe outcomes feed the router (a failure counts like a failed call, a
+# pass closes an open circuit) and ``status()``, a cached snapshot that the
+# Streamlit status bar and the API's /healthz and /readyz read without
+# waiting on any network call:
+#   starting   warm-up not finished
+#   ready      every provider passed its last check
+#   degraded   some providers failing, or the load shedder is in degraded mode
+#   down       no provider passed its last check
+#
+#   HEALTH_WARMUP            0 disables warm-up and probes (1)
+#   HEALTH_PROBE_INTERVAL    seconds between probe rounds (60)
+#   HEALTH_PROBE_TIMEOUT     slowest probe still counted as passing (10)
+# ──────────────────────────────────────────────────────────────
+
+WARMUP = os.getenv("HEALTH_WARMUP", "1") == "1"
+PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "60"))
+PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "10"))
+PROBE_TEXT = "ping"
+
+STARTING, READY, DEGRADED, DOWN = "starting", "ready", "degraded", "down"
+
+log = logging.getLogger(__name__)
+
+
+def probe_model(model) -> None:
+    """One cheap round trip to the provider behind ``model``; raises on failure."""
+    probe = getattr(model, "probe", None)
+    if probe is not None:
+        probe()
+    else:  # google.generativeai.GenerativeModel
+        model.count_tokens(PROBE_TEXT)
+
+
+class HealthMonitor:
+    """Warms the routed providers and keeps a non-blocking health snapshot."""
+
+    def __init__(self, router: Optional[ModelRouter] = None, interval: float = PROBE_INTERVAL,
+                 probe: Callable[[object], None] = probe_model, clock: Callable[[], float] = time.monotonic):
+        self._router = router
+        self.interval = interval
+        self.probe = probe
+        self.clock = clock
+        self.warmed_at: Optional[float] = None
+        self._results: Dict[str, dict] = {}
+        self._last_round = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def router(self) -> ModelRouter:
+        return self._router or get_router()
+
+    def start(self) -> "HealthMonitor":
+        """Start warm-up and periodic probes in the background (idempotent)."""
+        with self._lock:
+            if self._thread is None and WARMUP:
+                self._thread = threading.Thread(target=self._run, name="health-probe", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        self.warm_up()
+        while not self._stop.wait(self.interval):
+            self.probe_all()
+
+    def warm_up(self) -> None:
+        """Build every provider's client and probe it; blocks until done."""
+        start = time.perf_counter()
+        self.probe_all(force=True)
+        self.warmed_at = self.clock()
+        metrics.observe("model_warmup_seconds", time.perf_counter() - start)
+        log.info("model warm-up finished in %.2fs: %s", time.perf_counter() - start, self.status()["status"])
+
+    def probe_all(self, force: bool = False) -> None:
+        """Probe each provider that has not proved itself since the last round."""
+        since = self._last_round
+        self._last_round = self.clock()
+        for provider in list(self.router.providers):
+            if not force and provider.measured > since and provider.failures == 0:
+                self._set(provider, ok=True, seconds=None, error=None, source="traffic")
+                continue
+            self.probe_one(provider)
+
+    def probe_one(self, provider: Provider) -> bool:
+        start = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            self.probe(provider.model)
+        except Exception as e:  # provider SDKs raise their own error types
+            error = e
+        seconds = time.perf_counter() - start
+        if error is None and seconds > PROBE_TIMEOUT:
+            error = TimeoutError(f"probe took {seconds:.1f}s")
+        self.router.probed(provider, error)
+        metrics.observe("model_probe_seconds", seconds, provider=provider.name)
+        if error is not None:
+            metrics.inc("model_probe_failures_total", provider=provider.name)
+        self._set(provider, ok=error is None, seconds=seconds, error=error, source="probe")
+        return error is None
+
+    def _set(self, provider: Provider, *, ok: bool, seconds: Optional[float],
+             error: Optional[BaseException], source: str) -> None:
+        with self._lock:
+            self._results[provider.name] = {
+                "provider": provider.name,
+                "tier": provider.tier,
+                "ok": ok,
+                "probe_seconds": seconds,
+                "error": None if error is None else str(error)[:200],
+                "source": source,
+                "checked_at": self.clock(),
+            }
+        metrics.set_gauge("model_provider_healthy", 1 if ok else 0, provider=provider.name)
+
+    def status(self) -> dict:
+        """Current health, from cached probe results only (never blocks on the network)."""
+        now = self.clock()
+        with self._lock:
+            results = [dict(r) for r in self._results.values()]
+        for result in results:
+            result["age"] = round(now - result.pop("checked_at"), 1)
+        healthy = sum(r["ok"] for r in results)
+        if WARMUP and self.warmed_at is None:
+            state = STARTING
+        elif not results:
+            state = READY if not WARMUP else DOWN  # without warm-up nothing is probed; the router copes
+        elif healthy == 0:
+            state = DOWN
+        elif healthy < len(results) or get_load_shedder().degraded:
+            state = DEGRADED
+        else:
+            state = READY
+        return {
+            "status": state,
+            "ready": state in (READY, DEGRADED),
+            "warm": self.warmed_at is not None,
+            "providers": results,
+        }
+
+
+_monitor = HealthMonitor()
+
+
+def get_health_monitor() -> HealthMonitor:
+    return _monitor
@@ -0,0 +1,104 @@
+import json
+import os
+from contextlib import contextmanager
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, one writer process only
+    fcntl = None
+
+# ──────────────────────────────────────────────────────────────
+# Append-only JSONL journal shared by several processes
+#
+# The Streamlit app, the API, the batch runner and the staff CLIs each keep
+# their own in-memory state replayed from the same journal.  A writer takes
+# the journal's lock (an flock on ``<journal>.lock``), applies what the other
+# processes appended since it last looked (``read_new``), decides and
+# appends; compaction rewrites the file under the same lock, so it never
+# drops lines another process appended.  Readers may call ``read_new``
+# without the lock: only complete lines are consumed, and a journal
+# replaced by another process's compaction is detected by its inode and
+# read again from the start.  The file being read is kept open, so its
+# inode cannot be reused by a later compaction while it is followed.
+# ──────────────────────────────────────────────────────────────
+
+
+class Journal:
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[BinaryIO] = None  # journal file followed, positioned after what was returned
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusive across processes; call ``read_new`` first thing inside it."""
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read_new(self) -> Tuple[bool, List[dict]]:
+        """``(reset, events)`` appended since the last call.
+
+        ``reset`` is True when the journal was compacted since: ``events`` is
+        then the whole new journal and the caller's state must be rebuilt.
+        The first call returns the whole journal with ``reset`` False.
+        """
+        reset = False
+        if not self._current():
+            reset = self._file is not None
+            if not self._reopen():
+                return reset, []
+        data = self._file.read()
+        complete = data.rfind(b"\n") + 1  # a line still being written is read next time
+        self._file.seek(complete - len(data), os.SEEK_CUR)
+        return reset, [json.loads(line) for line in data[:complete].splitlines() if line.strip()]
+
+    def append(self, event: dict) -> None:
+        """Append one event; under ``locked()``, after ``read_new``."""
+        with open(self.path, "ab") as f:
+            f.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+            end = f.tell()
+        self._follow(end)
+
+    def rewrite(self, events: Iterable[dict]) -> None:
+        """Atomically replace the journal with ``events``; under ``locked()``, after ``read_new``."""
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            for event in events:
+                f.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+            end = f.tell()
+        self._close()  # Windows cannot replace an open file
+        os.replace(tmp, self.path)
+        self._follow(end)
+
+    def _current(self) -> bool:
+        """Whether the followed file is still the one at ``path``."""
+        if self._file is None:
+            return False
+        try:
+            return os.stat(self.path).st_ino == os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True  # nothing newer to read
+
+    def _reopen(self) -> bool:
+        self._close()
+        try:
+            self._file = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _follow(self, offset: int) -> None:
+        """Continue after ``offset`` of the file at ``path`` (just written by this process)."""
+        if self._current() or self._reopen():
+            self._file.seek(offset)
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
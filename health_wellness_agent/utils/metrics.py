@@ -0,0 +1,163 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# ──────────────────────────────────────────────────────────────
+# In-process metrics registry (counters, gauges, histograms)
+#
+# Process-wide and thread-safe: Streamlit sessions run in threads of the same
+# process, so every session feeds the same numbers.  Histograms keep bucket
+# counts for export plus a window of recent samples for percentiles.
+# Collectors (``add_collector``) run before every snapshot or export, for
+# numbers kept outside this registry (e.g. a journal other processes write).
+# ──────────────────────────────────────────────────────────────
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SAMPLE_WINDOW = 1024
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, object]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=SAMPLE_WINDOW)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, pct: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+_lock = threading.Lock()
+_counters: Dict[_Key, float] = {}
+_gauges: Dict[_Key, float] = {}
+_histograms: Dict[_Key, _Histogram] = {}
+_collectors: List[Callable[[], None]] = []
+
+
+def add_collector(collect: Callable[[], None]) -> None:
+    """Call ``collect()`` before every ``snapshot``/``render_prometheus``."""
+    _collectors.append(collect)
+
+
+def _collect() -> None:
+    for collect in list(_collectors):
+        collect()
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = _Histogram()
+        hist.observe(value)
+
+
+@contextmanager
+def timed(name: str, **labels) -> Iterator[None]:
+    """Observe the wall-clock duration of the ``with`` block in seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def counter_value(name: str, **labels) -> float:
+    with _lock:
+        return _counters.get(_key(name, labels), 0.0)
+
+
+def gauge_value(name: str, **labels) -> float:
+    with _lock:
+        return _gauges.get(_key(name, labels), 0.0)
+
+
+def percentile(name: str, pct: float, **labels) -> float:
+    with _lock:
+        hist = _histograms.get(_key(name, labels))
+        return hist.percentile(pct) if hist else 0.0
+
+
+def histogram_buckets(name: str, **labels) -> list:
+    """``(upper bound, count)`` per bucket, the last bound being infinity."""
+    with _lock:
+        hist = _histograms.get(_key(name, labels))
+        if hist is None:
+            return []
+        return list(zip(hist.buckets + (float("inf"),), hist.counts))
+
+
+def _label_str(labels) -> str:
+    return ",".join(f'{k}="{v}"' for k, v in labels)
+
+
+def snapshot() -> dict:
+    """Plain-dict view of every metric, e.g. for a status page or JSON export."""
+    _collect()
+    with _lock:
+        return {
+            "counters": {f"{n}{{{_label_str(l)}}}": v for (n, l), v in _counters.items()},
+            "gauges": {f"{n}{{{_label_str(l)}}}": v for (n, l), v in _gauges.items()},
+            "histograms": {
+                f"{n}{{{_label_str(l)}}}": {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "p50": h.percentile(50),
+                    "p95": h.percentile(95),
+                    "p99": h.percentile(99),
+                }
+                for (n, l), h in _histograms.items()
+            },
+        }
+
+
+def render_prometheus() -> str:
+    """Prometheus text exposition of every metric."""
+    _collect()
+    lines = []
+    with _lock:
+        for (name, labels), value in sorted(_counters.items()):
+            lines.append(f"{name}{{{_label_str(labels)}}} {value}")
+        for (name, labels), value in sorted(_gauges.items()):
+            lines.append(f"{name}{{{_label_str(labels)}}} {value}")
+        for (name, labels), hist in sorted(_histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip(hist.buckets + (float("inf"),), hist.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else bound
+                bucket_labels = _label_str(labels + (("le", str(le)),))
+                lines.append(f"{name}_bucket{{{bucket_labels}}} {cumulative}")
+            lines.append(f"{name}_count{{{_label_str(labels)}}} {hist.count}")
+            lines.append(f"{name}_sum{{{_label_str(labels)}}} {hist.sum}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,279 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterable, Optional, Tuple
+
+from utils import deadline, token_usage
+from utils.cassette import wrap_model
+from utils.model_router import FAKE_MODEL, MODEL_NAME, STRONG, GeminiModel, get_router
+from utils.rate_limit import EXPECTED_OUTPUT_TOKENS, INTERACTIVE, Grant, estimate_tokens, get_rate_limiter
+
+# ──────────────────────────────────────────────────────────────
+# Single entry point for generative model calls
+#
+# The Streamlit app, the HTTP API and background jobs all get the model and
+# issue calls through here.  The blocking SDK runs in worker threads; streamed
+# generations are bridged into an async iterator.  Calls are I/O bound, so
+# they get their own pool sized for concurrent requests (HEALTH_MODEL_THREADS)
+# rather than the small default executor shared with CPU work.  Every call
+# first takes its share of the provider quota (utils/rate_limit.py), queued
+# fairly per ``user`` in its ``lane`` (interactive chat or background work).
+#
+# ``system`` is sent as the provider's system instruction, ahead of the
+# prompt, so a static one is a prefix the provider can cache
+# (utils/prompts.py).
+#
+# Calls without an explicit ``model`` are routed by ``tier`` (fast or strong)
+# to a provider picked by utils/model_router.py, failing over to the next
+# one when a provider errors (for streams: before the first chunk).
+# ``get_model()`` is the default strong Gemini model for callers that pin
+# it.  With HEALTH_FAKE_MODEL=1 the local fake model (utils/fake_model.py)
+# stands in for every provider.
+#
+# Inside a turn deadline (utils/deadline.py) the quota wait and the model
+# call are bounded by what is left of the turn's budget, as stages
+# ``rate_limit`` and ``model``; a stream stops between chunks.
+#
+# The tokens of every response (as reported by the provider, else estimated)
+# are charged to the caller's usage scope (utils/token_usage.py) and settle
+# the rate limiter grant.
+# ──────────────────────────────────────────────────────────────
+
+MODEL_THREADS = int(os.getenv("HEALTH_MODEL_THREADS", "64"))
+
+_executor = ThreadPoolExecutor(max_workers=MODEL_THREADS, thread_name_prefix="model-call")
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def _default_model():
+    if FAKE_MODEL:
+        from utils.fake_model import FakeGenerativeModel
+        return FakeGenerativeModel()
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("❌ GEMINI_API_KEY not found in environment variables")
+    return GeminiModel(MODEL_NAME)
+
+
+def get_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = wrap_model(_default_model, MODEL_NAME)
+        return _model
+
+
+def _sent(prompt: str, system: Optional[str]) -> str:
+    """All the text a call sends, for estimates."""
+    return prompt if system is None else f"{system}\n\n{prompt}"
+
+
+async def _acquire(prompt: str, user: str, lane: str) -> Grant:
+    return await get_rate_limiter().acquire(user, estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS, lane)
+
+
+def _settle(grant: Grant, prompt: str, text: str, usage: Optional[token_usage.Tokens], model: str, user: str,
+            scope: Optional[dict] = None) -> None:
+    if usage is None and not text:
+        get_rate_limiter().release(grant, estimate_tokens(prompt))  # failed before any response
+        return
+    tokens = usage or token_usage.estimate(prompt, text)
+    token_usage.record(tokens, model=model, user=user, scope=scope)
+    get_rate_limiter().release(grant, tokens.total)
+
+
+def _model_name(model) -> str:
+    return str(getattr(model, "model_name", None) or type(model).__name__)
+
+
+class NoProviderError(RuntimeError):
+    pass
+
+
+def _text_of(response) -> str:
+    return getattr(response, "text", "") or ""
+
+
+def _read(response) -> Tuple[str, Optional[token_usage.Tokens]]:
+    return _text_of(response), token_usage.usage_of(response)
+
+
+async def _routed_generate(prompt: str, system: Optional[str],
+                           tier: str) -> Tuple[str, Optional[token_usage.Tokens], str]:
+    router = get_router()
+    loop = asyncio.get_running_loop()
+    last_error: Optional[Exception] = None
+    for attempt, provider in enumerate(router.candidates(tier)):
+        start = time.monotonic()
+        try:
+            text, usage = await loop.run_in_executor(
+                _executor, lambda p=provider: _read(p.model.generate_content(prompt, system=system))
+            )
+        except Exception as e:
+            router.record(provider, error=e)
+            last_error = e
+            continue
+        router.record(provider, time.monotonic() - start)
+        router.chosen(tier, provider, attempt)
+        return text, usage, provider.name
+    raise last_error or NoProviderError("no model provider configured")
+
+
+async def generate(
+    prompt: str, *, system: Optional[str] = None, model=None, user: str = "anonymous", lane: str = INTERACTIVE,
+    tier: str = STRONG,
+) -> str:
+    """Complete ``prompt`` (after the ``system`` instruction) and return the response text."""
+    sent = _sent(prompt, system)
+    grant = await deadline.within(_acquire(sent, user, lane), "rate_limit")
+    text, usage, served = "", None, None if model is None else _model_name(model)
+    try:
+        if model is None:
+            text, usage, served = await deadline.within(_routed_generate(prompt, system, tier), "model")
+        else:
+            text, usage = await deadline.within(
+                asyncio.get_running_loop().run_in_executor(
+                    _executor, lambda: _read(model.generate_content(prompt, system=system))
+                ),
+                "model",
+            )
+        return text
+    finally:
+        _settle(grant, sent, text, usage, served or tier, user)
+
+
+async def _stream_from(open_stream: Callable[[], Iterable], stop: threading.Event,
+                       served: Optional[dict] = None) -> AsyncIterator[str]:
+    """Bridge a blocking chunk iterator running in a worker thread.
+
+    The last token usage reported with a chunk is left in ``served["usage"]``.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    closed = threading.Event()
+    done = object()
+
+    def _put(item) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            pass  # the loop is gone, nobody is reading any more
+
+    def _produce():
+        try:
+            for chunk in open_stream():
+                if stop.is_set() or closed.is_set():
+                    break
+                text, usage = _read(chunk)
+                if usage is not None and served is not None:
+                    served["usage"] = usage
+                if text:
+                    _put(text)
+        except Exception as e:  # surfaced on the event loop side
+            _put(e)
+        finally:
+            _put(done)
+
+    producer = loop.run_in_executor(_executor, _produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        closed.set()
+        if producer.done() or not _cancelling():
+            await producer
+        # else: a reader that gave up (timeout, cancellation) doesn't wait for
+        # the worker's blocking call; the worker exits when it returns
+
+
+def _cancelling() -> bool:
+    task = asyncio.current_task()
+    return task is not None and task.cancelling() > 0
+
+
+async def _routed_stream(prompt: str, system: Optional[str], stop: threading.Event, tier: str,
+                         served: dict) -> AsyncIterator[str]:
+    router = get_router()
+    last_error: Optional[Exception] = None
+    for attempt, provider in enumerate(router.candidates(tier)):
+        start = time.monotonic()
+        served["model"] = provider.name
+        chunks = _stream_from(
+            lambda p=provider: p.model.generate_content(prompt, stream=True, system=system), stop, served
+        )
+        try:
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = ""
+            except Exception as e:
+                router.record(provider, error=e)
+                last_error = e
+                continue  # nothing was shown yet: try the next provider
+            router.record(provider, time.monotonic() - start)
+            router.chosen(tier, provider, attempt)
+            if first:
+                yield first
+            try:
+                async for item in chunks:
+                    yield item
+            except Exception as e:
+                router.record(provider, error=e)
+                raise
+            return
+        finally:
+            await chunks.aclose()
+    raise last_error or NoProviderError("no model provider configured")
+
+
+def stream(
+    prompt: str,
+    *,
+    system: Optional[str] = None,
+    model=None,
+    stop: Optional[threading.Event] = None,
+    user: str = "anonymous",
+    lane: str = INTERACTIVE,
+    tier: str = STRONG,
+) -> AsyncIterator[str]:
+    """Yield text chunks of a streamed generation (of ``prompt`` after ``system``) running in a worker thread.
+
+    Setting ``stop`` (or closing the iterator) makes the worker stop reading
+    the response after the current chunk.  Tokens are charged to the usage
+    scope in effect when ``stream`` is called, not when it is read.
+    """
+    return _stream(prompt, system, model, stop or threading.Event(), user, lane, tier, token_usage.current_scope())
+
+
+async def _stream(prompt: str, system: Optional[str], model, stop: threading.Event, user: str, lane: str, tier: str,
+                  scope: dict) -> AsyncIterator[str]:
+    sent = _sent(prompt, system)
+    grant = await deadline.within(_acquire(sent, user, lane), "rate_limit")
+    received = []
+    served = {"model": tier if model is None else _model_name(model), "usage": None}
+    if model is None:
+        chunks = _routed_stream(prompt, system, stop, tier, served)
+    else:
+        chunks = _stream_from(lambda: model.generate_content(prompt, stream=True, system=system), stop, served)
+    try:
+        with deadline.stage("model"):
+            while True:
+                try:
+                    item = await deadline.within(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                received.append(item)
+                yield item
+    finally:
+        stop.set()
+        await chunks.aclose()
+        _settle(grant, sent, "".join(received), served["usage"], served["model"], user, scope)
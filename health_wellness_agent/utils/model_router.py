@@ -0,0 +1,360 @@
+import inspect
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from utils import metrics
+from utils.cassette import get_cassette, wrap_model
+
+# ──────────────────────────────────────────────────────────────
+# Latency-aware routing between a fast and a strong model
+#
+# Model calls that don't pin a model (see utils/model_gateway.py) name a
+# tier: ``fast`` for short factual questions, SAFE/UNSAFE checks and chunk
+# summaries, ``strong`` for plans, analyses and long or open-ended questions
+# (``classify_query``).  Each tier has an ordered list of providers; a call
+# goes to the provider of its tier with the best live score, i.e. the EWMA
+# of its latency (time to first chunk for streams) plus a penalty for its
+# EWMA error rate.  Providers never measured are tried first.
+#
+# Failover: a failed call moves on to the next candidate, the rest of its
+# tier first, then the other tier, so an outage at one provider costs speed
+# or depth instead of the turn.  CIRCUIT_FAILURES failures in a row take a
+# provider out of rotation for CIRCUIT_COOLDOWN seconds; when every provider
+# is out they are all tried anyway.  While the fast tier is measured slower
+# than the strong one, fast calls go to the strong tier.  Every PROBE_EVERY-th
+# call of a tier goes to its least recently measured provider instead, so a
+# provider that lost its place gets the chance to win it back.
+#
+#   HEALTH_FAST_MODELS / HEALTH_STRONG_MODELS
+#       comma separated provider:model lists (providers: gemini, groq, fake).
+#       Providers whose key (GEMINI_API_KEY / GROQ_API_KEY) is missing are
+#       left out.  With HEALTH_FAKE_MODEL=1 two local fake providers are used.
+#   HEALTH_MODEL_ROUTER_FAST_MAX_WORDS   longest message still sent to ``fast``
+#   HEALTH_GEMINI_MODEL (formerly HEALTH_MODEL)
+#       the strong Gemini model, ``gemini-pro`` by default; a 1.5 model
+#       (e.g. gemini-1.5-pro) takes prompts' system part as a real system
+#       instruction, at 1.5 pricing
+#
+# Decisions are counted in model_route_total{tier,provider,reason} and logged
+# on this module's logger (failovers and circuit changes at WARNING).
+# ──────────────────────────────────────────────────────────────
+
+FAST, STRONG = "fast", "strong"
+TIERS = (FAST, STRONG)
+
+MODEL_NAME = os.getenv("HEALTH_GEMINI_MODEL") or os.getenv("HEALTH_MODEL", "gemini-pro")
+FAKE_MODEL = os.getenv("HEALTH_FAKE_MODEL", "0") == "1"
+FAST_MODELS = os.getenv("HEALTH_FAST_MODELS", "groq:llama-3.1-8b-instant,gemini:gemini-1.5-flash")
+STRONG_MODELS = os.getenv("HEALTH_STRONG_MODELS", f"gemini:{MODEL_NAME},groq:llama-3.3-70b-versatile")
+FAST_MAX_WORDS = int(os.getenv("HEALTH_MODEL_ROUTER_FAST_MAX_WORDS", "25"))
+
+EWMA_ALPHA = 0.2
+ERROR_PENALTY_SECONDS = 10.0  # added to a provider's score per unit of error rate
+CIRCUIT_FAILURES = 3
+CIRCUIT_COOLDOWN = 30.0
+PROBE_EVERY = 10
+
+API_KEYS = {"gemini": "GEMINI_API_KEY", "groq": "GROQ_API_KEY"}
+
+log = logging.getLogger(__name__)
+
+_STRONG_HINTS = re.compile(
+    r"\b(analy[sz]\w*|plan\w*|programs?|programmes?|schedules?|routines?|protocols?|strateg\w*|"
+    r"compare|comparison|difference|pros and cons|explain|why|detailed|in depth|step[- ]by[- ]step|"
+    r"weekly|monthly|review|summar\w*|history|progress)\b",
+    re.IGNORECASE,
+)
+
+
+def classify_query(message: str) -> str:
+    """``fast`` for a short factual question, ``strong`` for anything needing analysis."""
+    text = message.strip()
+    if len(text.split()) > FAST_MAX_WORDS or text.count("\n") >= 2 or _STRONG_HINTS.search(text):
+        return STRONG
+    return FAST
+
+
+class _Text:
+    def __init__(self, text: str, usage=None):
+        self.text = text
+        self.usage = usage
+
+
+class GeminiModel:
+    """``generate_content(prompt, stream=..., system=...)`` on google.generativeai.
+
+    Gemini takes the system instruction when a model object is built, so one
+    GenerativeModel is kept per instruction; they are few and static
+    (utils/prompts.py).  SDKs before 0.5 and Gemini 1.0 models have no system
+    instruction: there it is sent ahead of the prompt, still a stable prefix.
+    """
+
+    def __init__(self, model_name: str):
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self.model_name = model_name
+        self.system_instruction = (
+            "system_instruction" in inspect.signature(genai.GenerativeModel).parameters
+            and not model_name.rpartition("/")[2].startswith(("gemini-pro", "gemini-1.0"))
+        )
+        self._genai = genai
+        self._models: Dict[Optional[str], object] = {}
+        self._lock = threading.Lock()
+
+    def _model(self, system: Optional[str]):
+        with self._lock:
+            model = self._models.get(system)
+            if model is None:
+                options = {"system_instruction": system} if system is not None else {}
+                model = self._models[system] = self._genai.GenerativeModel(self.model_name, **options)
+            return model
+
+    def generate_content(self, prompt: str, stream: bool = False, system: Optional[str] = None, **kwargs):
+        if system is not None and not self.system_instruction:
+            prompt, system = f"{system}\n\n{prompt}", None
+        return self._model(system).generate_content(prompt, stream=stream, **kwargs)
+
+    def count_tokens(self, *args, **kwargs):
+        """The health probe's call (utils/health.py)."""
+        return self._model(None).count_tokens(*args, **kwargs)
+
+
+class GroqChatModel:
+    """``generate_content(prompt, stream=..., system=...)`` on top of Groq chat completions."""
+
+    def __init__(self, model_name: str, api_key: str):
+        from groq import Groq
+
+        self.model_name = model_name
+        self._client = Groq(api_key=api_key)
+
+    def generate_content(self, prompt: str, stream: bool = False, system: Optional[str] = None, **kwargs):
+        messages = [{"role": "user", "content": prompt}]
+        if system is not None:
+            messages.insert(0, {"role": "system", "content": system})
+        if stream:
+            return self._stream(self._client.chat.completions.create(
+                model=self.model_name, messages=messages, stream=True
+            ))
+        response = self._client.chat.completions.create(model=self.model_name, messages=messages)
+        return _Text(response.choices[0].message.content or "", response.usage)
+
+    def probe(self) -> None:
+        """Checks the key and the connection by listing models; uses no tokens."""
+        self._client.models.list()
+
+    @staticmethod
+    def _stream(chunks):
+        for chunk in chunks:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None)  # on the last chunk
+            if delta or usage:
+                yield _Text(delta or "", usage)
+
+
+def _gemini(model_name: str):
+    return GeminiModel(model_name)
+
+
+def _groq(model_name: str):
+    return GroqChatModel(model_name, os.getenv("GROQ_API_KEY"))
+
+
+def _fake(model_name: str, first_token_seconds: Optional[float] = None):
+    from utils.fake_model import FIRST_TOKEN_SECONDS, FakeGenerativeModel
+
+    return FakeGenerativeModel(model_name, first_token_seconds=(
+        FIRST_TOKEN_SECONDS if first_token_seconds is None else first_token_seconds
+    ))
+
+
+FACTORIES: Dict[str, Callable[[str], object]] = {"gemini": _gemini, "groq": _groq, "fake": _fake}
+
+
+class Provider:
+    """One model at one provider, with its live latency and error statistics.
+
+    The client is built on first use, so configuring a provider costs
+    nothing until a call is routed to it.
+    """
+
+    def __init__(self, name: str, tier: str, factory: Callable[[], object]):
+        self.name = name
+        self.tier = tier
+        self._factory = factory
+        self._model = None
+        self._lock = threading.Lock()
+        self.latency: Optional[float] = None  # EWMA seconds
+        self.error_rate = 0.0                 # EWMA of failures
+        self.failures = 0                     # in a row
+        self.open_until = 0.0
+        self.measured = 0.0                   # clock time of the last outcome
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                self._model = wrap_model(self._factory, self.name)
+            return self._model
+
+    def score(self) -> float:
+        return (self.latency or 0.0) + self.error_rate * ERROR_PENALTY_SECONDS
+
+    def __repr__(self) -> str:
+        return f"Provider({self.name!r}, {self.tier!r})"
+
+
+class ModelRouter:
+    def __init__(self, providers: List[Provider], clock: Callable[[], float] = time.monotonic):
+        self.providers = providers
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._calls = {tier: itertools.count(1) for tier in TIERS}
+
+    def candidates(self, tier: str) -> List[Provider]:
+        """Providers to try for a ``tier`` call, best first."""
+        if tier not in TIERS:
+            raise ValueError(f"unknown tier {tier!r}")
+        with self._lock:
+            now = self.clock()
+            healthy = [p for p in self.providers if p.open_until <= now]
+            tripped = [p for p in self.providers if p.open_until > now]
+            own = sorted((p for p in healthy if p.tier == tier), key=Provider.score)
+            other = sorted((p for p in healthy if p.tier != tier), key=Provider.score)
+            probe = next(self._calls[tier]) % PROBE_EVERY == 0
+        if probe and len(own) > 1:
+            stale = min(own, key=lambda p: p.measured)
+            own.remove(stale)
+            own.insert(0, stale)
+        elif (not probe and tier == FAST and own and other and own[0].latency is not None
+                and other[0].latency is not None and own[0].score() > other[0].score()):
+            own, other = other, own
+        return own + other + sorted(tripped, key=lambda p: p.open_until)
+
+    def record(self, provider: Provider, seconds: Optional[float] = None, error: Optional[BaseException] = None) -> None:
+        """Fold one call's outcome into the provider's statistics."""
+        with self._lock:
+            provider.measured = self.clock()
+            if error is None:
+                provider.latency = seconds if provider.latency is None else (
+                    (1 - EWMA_ALPHA) * provider.latency + EWMA_ALPHA * seconds
+                )
+                provider.error_rate *= 1 - EWMA_ALPHA
+                recovered = provider.failures >= CIRCUIT_FAILURES
+                provider.failures = 0
+                provider.open_until = 0.0
+                tripped = False
+            else:
+                provider.error_rate = (1 - EWMA_ALPHA) * provider.error_rate + EWMA_ALPHA
+                provider.failures += 1
+                recovered = False
+                tripped = provider.failures >= CIRCUIT_FAILURES
+                if tripped:
+                    provider.open_until = self.clock() + CIRCUIT_COOLDOWN
+        if error is None:
+            metrics.observe("model_provider_seconds", seconds, provider=provider.name)
+            metrics.set_gauge("model_provider_latency_ewma", provider.latency, provider=provider.name)
+            if recovered:
+                log.warning("model provider %s recovered", provider.name)
+        else:
+            metrics.inc("model_provider_errors_total", provider=provider.name)
+            log.warning("model provider %s failed: %s", provider.name, error)
+            if tripped:
+                log.warning("model provider %s out of rotation for %.0fs after %d failures",
+                            provider.name, CIRCUIT_COOLDOWN, provider.failures)
+        metrics.set_gauge("model_provider_error_rate", provider.error_rate, provider=provider.name)
+
+    def probed(self, provider: Provider, error: Optional[BaseException] = None) -> None:
+        """Fold a health probe into the provider's state (see utils/health.py).
+
+        A failed probe counts like a failed call; a passing one only closes
+        an open circuit, since probe latency says nothing about generation.
+        """
+        if error is not None:
+            self.record(provider, error=error)
+            return
+        with self._lock:
+            recovered = provider.open_until > 0.0
+            provider.failures = 0
+            provider.open_until = 0.0
+        if recovered:
+            log.warning("model provider %s back in rotation after a passing health probe", provider.name)
+
+    def chosen(self, tier: str, provider: Provider, attempt: int) -> None:
+        """Log and count which provider served a ``tier`` call."""
+        if attempt:
+            reason = "failover"
+        elif provider.tier != tier:
+            reason = "cross_tier"
+        else:
+            reason = "preferred"
+        metrics.inc("model_route_total", tier=tier, provider=provider.name, reason=reason)
+        if attempt:
+            log.warning("%s call served by %s after %d failed attempt(s)", tier, provider.name, attempt)
+        else:
+            log.debug("%s call routed to %s (%s)", tier, provider.name, reason)
+
+    def stats(self) -> List[dict]:
+        now = self.clock()
+        with self._lock:
+            return [
+                {
+                    "provider": p.name,
+                    "tier": p.tier,
+                    "latency": p.latency,
+                    "error_rate": round(p.error_rate, 3),
+                    "available": p.open_until <= now,
+                }
+                for p in self.providers
+            ]
+
+
+def _replaying() -> bool:
+    cassette = get_cassette()
+    return cassette is not None and cassette.replaying  # answers come from the cassette, no key needed
+
+
+def parse_providers(spec: str, tier: str) -> List[Provider]:
+    """Providers of ``tier`` from a ``provider:model,...`` list, skipping those without a key.
+
+    While a cassette is replayed (utils/cassette.py) keys are not needed.
+    """
+    providers = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        kind, _, model_name = item.partition(":")
+        if kind not in FACTORIES or not model_name:
+            raise ValueError(f"bad model spec {item!r}, expected one of {sorted(FACTORIES)}:<model>")
+        if kind in API_KEYS and not os.getenv(API_KEYS[kind]) and not _replaying():
+            continue
+        factory = FACTORIES[kind]
+        providers.append(Provider(item, tier, lambda f=factory, m=model_name: f(m)))
+    return providers
+
+
+def _default_providers() -> List[Provider]:
+    if FAKE_MODEL:
+        from utils.fake_model import FIRST_TOKEN_SECONDS
+
+        return [
+            Provider("fake:fast", FAST, lambda: _fake("fast", FIRST_TOKEN_SECONDS / 3)),
+            Provider("fake:strong", STRONG, lambda: _fake("strong")),
+        ]
+    return parse_providers(FAST_MODELS, FAST) + parse_providers(STRONG_MODELS, STRONG)
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter(_default_providers())
+        return _router
@@ -0,0 +1,222 @@
+import re
+import time
+from dataclasses import dataclass, field
+from typing import List, Sequence
+
+from utils import metrics
+from utils.aho_corasick import AhoCorasick
+from utils.rate_limit import INTERACTIVE
+
+# ──────────────────────────────────────────────────────────────
+# Incremental safety scan of model output
+#
+# The scanner is fed the response chunk by chunk while it streams:
+#   "block"  clearly unsafe advice  -> streaming is halted immediately
+#   "review" drug doses, definitive diagnoses and unsafe advice under a
+#            negation ("do not stop taking your medication") -> the span is
+#            kept and, once the response is complete, only those spans are
+#            sent to the fast model (``passes_review``, the one checker the
+#            chat service, the agents' output guardrail and the direct
+#            stream share)
+# Phrases run through a streaming Aho-Corasick matcher (each character is
+# seen once); the dose regex only re-reads a short overlap per chunk.  A
+# dose (mg, mcg, IU, units) is only flagged in a sentence that names a drug
+# or a tablet, so nutrition figures ("300 mg of sodium") pass.
+# ──────────────────────────────────────────────────────────────
+
+BLOCK, REVIEW = "block", "review"
+
+UNSAFE_ADVICE = [
+    "stop taking your medication", "stop taking your medicine", "stop your medication",
+    "stop taking insulin", "stop your insulin", "skip your insulin",
+    "you don't need a doctor", "you do not need a doctor", "no need to see a doctor",
+    "ignore your doctor", "instead of seeing a doctor",
+    "instead of going to the hospital", "don't go to the hospital",
+    "drink bleach", "mms chlorine dioxide", "fast for 7 days", "fast for a week",
+    "water fast for 10 days", "eat less than 500 calories", "under 800 calories a day",
+    "double your dose", "double the dose", "take more than the recommended dose",
+]
+
+DIAGNOSIS_CLAIMS = [
+    "you have diabetes", "you have cancer", "you have a tumor", "you have depression",
+    "you are diabetic", "you definitely have", "you clearly have", "you are suffering from",
+    "this is definitely", "i diagnose you", "my diagnosis is", "you have an infection",
+    "you have a heart condition", "you have an eating disorder",
+]
+
+# a negation earlier in the same clause turns unsafe advice into a review span
+NEGATION_RE = re.compile(
+    r"\b(?:do not|don't|dont|never|avoid|should not|shouldn't|must not|mustn't|not to)\b", re.IGNORECASE
+)
+CLAUSE_BREAK_RE = re.compile(r"[.!?;:\n]|,\s*(?:but|however)\b")
+
+DOSAGE_RE = re.compile(r"\b\d+(?:[.,]\d+)?\s?(?:mg|mcg|µg|iu|units?)\b", re.IGNORECASE)
+DRUG_RE = re.compile(
+    r"\b(?:tablets?|pills?|capsules?|caplets?|doses?|dosage|dosing|medications?|medicines?|meds|drugs?|"
+    r"prescri\w*|insulin|injections?|ibuprofen|paracetamol|acetaminophen|aspirin|naproxen|metformin|"
+    r"melatonin|antibiotics?|amoxicillin|statins?|warfarin|levothyroxine|opioids?|codeine|tramadol)\b",
+    re.IGNORECASE,
+)
+SENTENCE_END_RE = re.compile(r"[!?\n]|\.(?!\d)")
+DOSAGE_OVERLAP = 40    # characters re-read before each chunk so split numbers are caught
+SENTENCE_CHARS = 200   # how far a dose's sentence is searched for a drug word
+
+HALTED_MESSAGE = (
+    "⚠️ This response was stopped because it may contain unsafe medical advice. "
+    "Please consult a qualified healthcare professional."
+)
+
+
+@dataclass
+class OutputFlag:
+    severity: str
+    category: str
+    text: str
+    start: int
+    end: int
+
+
+@dataclass
+class ScanState:
+    halted: bool = False
+    flags: List[OutputFlag] = field(default_factory=list)
+
+    @property
+    def review_spans(self) -> List[OutputFlag]:
+        return [f for f in self.flags if f.severity == REVIEW]
+
+
+def _build_automaton() -> AhoCorasick:
+    automaton = AhoCorasick(whole_words=True)
+    for phrase in UNSAFE_ADVICE:
+        automaton.add(phrase, (BLOCK, "unsafe_advice"))
+    for phrase in DIAGNOSIS_CLAIMS:
+        automaton.add(phrase, (REVIEW, "diagnosis"))
+    return automaton.build()
+
+
+_automaton = _build_automaton()
+
+
+class StreamingOutputScanner:
+    """Feed response chunks as they arrive; check ``halted`` after each."""
+
+    def __init__(self):
+        self._matcher = _automaton.stream()
+        self._text = ""
+        self._dosage_seen = set()
+        self._dosage_pending: List[tuple] = []   # doses whose sentence has not ended yet
+        self.state = ScanState()
+        self.seconds = 0.0
+
+    @property
+    def halted(self) -> bool:
+        return self.state.halted
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> ScanState:
+        if self.state.halted or not chunk:
+            return self.state
+        start = time.perf_counter()
+        offset = len(self._text)
+        self._text += chunk
+        self._record(self._matcher.feed(chunk))
+        self._scan_dosage(max(0, offset - DOSAGE_OVERLAP))
+        self.seconds += time.perf_counter() - start
+        return self.state
+
+    def close(self) -> ScanState:
+        start = time.perf_counter()
+        self._record(self._matcher.close())
+        self._scan_dosage(max(0, len(self._text) - DOSAGE_OVERLAP), final=True)
+        # spans flagged mid-stream get their full surrounding context now
+        for flag in self.state.flags:
+            flag.text = self._span(flag.start, flag.end)
+        self.seconds += time.perf_counter() - start
+        metrics.observe("output_scan_seconds", self.seconds)
+        return self.state
+
+    def _record(self, matches) -> None:
+        for start, end, (severity, category) in matches:
+            if severity == BLOCK and self._negated(start):
+                severity = REVIEW
+            self.state.flags.append(OutputFlag(severity, category, self._span(start, end), start, end))
+            metrics.inc("output_flags_total", severity=severity, category=category)
+            if severity == BLOCK:
+                self.state.halted = True
+
+    def _negated(self, start: int) -> bool:
+        """Whether the clause before ``start`` contains a negation ("never double the dose")."""
+        clause_start = max(0, start - SENTENCE_CHARS)
+        for m in CLAUSE_BREAK_RE.finditer(self._text, clause_start, start):
+            clause_start = m.end()
+        return NEGATION_RE.search(self._text, clause_start, start) is not None
+
+    def _scan_dosage(self, start: int, final: bool = False) -> None:
+        for m in DOSAGE_RE.finditer(self._text, start):
+            # a match touching the end may still grow ("5" -> "500 mg") next chunk
+            if (m.end() == len(self._text) and not final) or m.start() in self._dosage_seen:
+                continue
+            self._dosage_seen.add(m.start())
+            self._dosage_pending.append((m.start(), m.end()))
+
+        # a dose is only judged once its sentence is complete: the drug may follow it
+        waiting = []
+        for dose_start, dose_end in self._dosage_pending:
+            sentence_end = SENTENCE_END_RE.search(self._text, dose_end, dose_end + SENTENCE_CHARS)
+            if sentence_end is None and not final and len(self._text) < dose_end + SENTENCE_CHARS:
+                waiting.append((dose_start, dose_end))
+                continue
+            sentence_start = max(0, dose_start - SENTENCE_CHARS)
+            for m in SENTENCE_END_RE.finditer(self._text, sentence_start, dose_start):
+                sentence_start = m.end()
+            stop = sentence_end.start() if sentence_end else dose_end + SENTENCE_CHARS
+            if DRUG_RE.search(self._text, sentence_start, stop):
+                self.state.flags.append(
+                    OutputFlag(REVIEW, "dosage", self._span(dose_start, dose_end), dose_start, dose_end)
+                )
+                metrics.inc("output_flags_total", severity=REVIEW, category="dosage")
+        self._dosage_pending = waiting
+
+    def _span(self, start: int, end: int, context: int = 80) -> str:
+        """The flagged text with some surrounding context for the checker."""
+        return self._text[max(0, start - context):end + context].strip()
+
+
+def scan_text(text: str) -> ScanState:
+    """Scan a complete (non-streamed) response."""
+    scanner = StreamingOutputScanner()
+    scanner.feed(text)
+    return scanner.close()
+
+
+async def spans_are_safe(spans: Sequence[str], *, model=None, user: str = "anonymous",
+                         lane: str = INTERACTIVE) -> bool:
+    """Ask the fast model whether the flagged ``spans`` are safe to show."""
+    from utils import model_gateway, token_usage
+    from utils.model_router import FAST
+    from utils.prompts import SPAN_CHECK_SYSTEM
+
+    excerpts = "\n\n".join(f"Excerpt {i}: {span}" for i, span in enumerate(spans, 1))
+    try:
+        with token_usage.attribute(kind="span_check"):
+            verdict = await model_gateway.generate(
+                excerpts, system=SPAN_CHECK_SYSTEM.render(), model=model, user=user, lane=lane, tier=FAST
+            )
+        return "UNSAFE" not in verdict.upper()
+    except Exception:
+        return True  # the local scan found nothing blocking; don't fail closed on a checker outage
+
+
+async def passes_review(scan: ScanState, **check) -> bool:
+    """Whether a scanned response may be shown: not halted, and its review spans (if any) checked safe.
+
+    ``check`` is passed to ``spans_are_safe`` (model, user, lane).
+    """
+    if scan.halted:
+        return False
+    spans = list(dict.fromkeys(flag.text for flag in scan.review_spans))
+    return not spans or await spans_are_safe(spans, **check)
@@ -0,0 +1,13 @@
+import os
+
+# Root for everything the app persists locally (indexes, queues, stores).
+# Override with HEALTH_DATA_DIR, e.g. to point at a mounted volume.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.getenv("HEALTH_DATA_DIR", os.path.join(BASE_DIR, "data"))
+
+
+def data_path(*parts: str) -> str:
+    """Return a path under DATA_DIR, creating its parent directory."""
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional
+
+from context import UserSessionContext
+from tools.plan_builders import build_meal_plan, build_workout_plan
+from utils import metrics
+
+# ──────────────────────────────────────────────────────────────
+# Speculative plan prefetch (opt-in: HEALTH_PREFETCH=1)
+#
+# Right after a goal is captured, users nearly always ask for the meal and
+# workout plan next.  Once ``UserSessionContext.goal`` is set, the plans (and,
+# if a writer is registered, an LLM-written narrative) are computed in the
+# background on a copy of the context and cached against a version hash of
+# the fields they depend on.  The follow-up request is served from the cache
+# as soon as the (local, fast) plan builders have run; it never waits for the
+# narrative, which is attached to the plan whenever the writer finishes.  If
+# any of those fields changed in between, the prefetched plan is dropped.
+# The cache keeps the MAX_ENTRIES most recently used users.
+# ──────────────────────────────────────────────────────────────
+
+ENABLED = os.getenv("HEALTH_PREFETCH", "0") == "1"
+MAX_ENTRIES = 256
+
+# fields that determine the plans; anything else may change freely
+VERSION_FIELDS = ("goal", "diet_preferences", "injury_notes")
+
+NarrativeWriter = Callable[[UserSessionContext], Awaitable[str]]
+
+
+def context_version(context: UserSessionContext) -> str:
+    data = {name: getattr(context, name) for name in VERSION_FIELDS}
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PrefetchedPlan:
+    version: str
+    meal_plan: List[str] = field(default_factory=list)
+    workout_plan: dict = field(default_factory=dict)
+    narrative: Optional[str] = None   # set when the writer finishes, if ever
+
+    def apply(self, context: UserSessionContext) -> None:
+        context.meal_plan = list(self.meal_plan)
+        context.workout_plan = dict(self.workout_plan)
+
+
+class PlanPrefetcher:
+    def __init__(self, enabled: bool = ENABLED, narrative_writer: Optional[NarrativeWriter] = None):
+        self.enabled = enabled
+        self.narrative_writer = narrative_writer
+        # uid -> (version, built, task): ``built`` resolves to the plan once the builders
+        # ran, ``task`` goes on to write the narrative; least recently used first
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+
+    def schedule(self, context: UserSessionContext) -> bool:
+        """Start prefetching for ``context`` if enabled and worthwhile."""
+        if not self.enabled or not context.goal:
+            return False
+        version = context_version(context)
+        current = self._entries.get(context.uid)
+        if current and current[0] == version:
+            self._entries.move_to_end(context.uid)
+            return False
+        self.discard(context.uid)
+
+        snapshot = context.model_copy(deep=True)
+        built = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(self._compute(snapshot, version, built))
+        self._entries[context.uid] = (version, built, task)
+        while len(self._entries) > MAX_ENTRIES:
+            self.discard(next(iter(self._entries)))
+        metrics.inc("plan_prefetch_total", outcome="scheduled")
+        return True
+
+    async def _compute(self, snapshot: UserSessionContext, version: str, built: asyncio.Future) -> PrefetchedPlan:
+        try:
+            build_meal_plan(snapshot)
+            build_workout_plan(snapshot)
+        except Exception as e:
+            built.set_exception(e)
+            raise
+        plan = PrefetchedPlan(version, snapshot.meal_plan, snapshot.workout_plan)
+        built.set_result(plan)  # ``take`` returns now; the narrative is filled in later
+        if self.narrative_writer is not None:
+            try:
+                plan.narrative = await self.narrative_writer(snapshot)
+            except Exception:
+                plan.narrative = None  # the plans themselves are still good
+        return plan
+
+    async def take(self, context: UserSessionContext) -> Optional[PrefetchedPlan]:
+        """The prefetched plan for the context's current version, else None."""
+        entry = self._entries.get(context.uid)
+        if entry is None:
+            return None
+        version, built, task = entry
+        if task.get_loop() is not asyncio.get_running_loop():
+            self.discard(context.uid)  # scheduled from an event loop that is gone
+            return None
+        if version != context_version(context):
+            self.discard(context.uid)
+            metrics.inc("plan_prefetch_total", outcome="stale")
+            return None
+        try:
+            # the builders have almost always run; the narrative is never waited for
+            plan = await asyncio.shield(built)
+        except asyncio.CancelledError:
+            if not built.cancelled():
+                raise  # our caller is being cancelled, not the prefetch
+            return None
+        except Exception:
+            self.discard(context.uid)
+            return None
+        self._entries.move_to_end(context.uid)
+        metrics.inc("plan_prefetch_total", outcome="hit")
+        return plan
+
+    def discard(self, uid: int) -> None:
+        entry = self._entries.pop(uid, None)
+        if entry is None:
+            return
+        _, built, task = entry
+        if not task.done() and not task.get_loop().is_closed():
+            task.cancel()
+            built.cancel()  # no-op once the plan was built
+
+
+_prefetcher = PlanPrefetcher()
+
+
+def get_prefetcher() -> PlanPrefetcher:
+    return _prefetcher
@@ -0,0 +1,127 @@
+import re
+import textwrap
+from dataclasses import dataclass
+
+from utils import metrics
+
+# ──────────────────────────────────────────────────────────────
+# Prompt templates, compiled once
+#
+# Every prompt the chat service and the session analysis send is built from
+# the templates below.  A template is dedented and whitespace-normalized
+# when this module is imported (runs of blanks collapsed, lines stripped, at
+# most one empty line in a row), so source indentation never reaches the
+# model and ``render`` is a single ``str.format_map``.  Values are inserted
+# as they are; user text is never rewritten.
+#
+# A prompt has two parts (``Prompt``): ``system``, the static instructions
+# (persona, task), sent as the provider's system instruction, and ``user``,
+# everything that changes per call (name, recalled memories, references,
+# the message).  The system part is byte-identical across calls and comes
+# first, so providers that cache prompt prefixes (Gemini implicit caching,
+# Groq / OpenAI prompt caching) can serve it from cache once it is past
+# their minimum cacheable length; cached tokens are counted as
+# type="cached" in model_tokens_total (utils/token_usage.py).
+#
+# Bytes removed by normalization are counted per render in
+# prompt_bytes_saved_total{template}; benchmarks/bench_prompts.py compares
+# whole requests with the inline f-strings these templates replaced.
+# ──────────────────────────────────────────────────────────────
+
+_BLANKS = re.compile(r"[ \t]+")
+_EMPTY_LINES = re.compile(r"\n{3,}")
+
+
+def normalize(text: str) -> str:
+    """``text`` dedented, with blank runs collapsed, lines stripped and at most one empty line in a row."""
+    lines = (_BLANKS.sub(" ", line).strip() for line in textwrap.dedent(text).splitlines())
+    return _EMPTY_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+class PromptTemplate:
+    """A template normalized once; ``render(**values)`` fills in its ``{fields}``."""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = normalize(text)
+        self.saved = len(text.encode("utf-8")) - len(self.text.encode("utf-8"))
+
+    def render(self, **values) -> str:
+        if self.saved > 0:
+            metrics.inc("prompt_bytes_saved_total", self.saved, template=self.name)
+        return self.text.format_map(values) if values else self.text
+
+    def __repr__(self) -> str:
+        return f"PromptTemplate({self.name!r})"
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """``system``: the static instruction; ``user``: the per-call content."""
+    system: str
+    user: str
+
+
+def sections(*parts: str) -> str:
+    """The non-empty ``parts``, each followed by an empty line."""
+    return "".join(f"{part}\n\n" for part in parts if part)
+
+
+# ── chat (utils/chat_service.py) ──────────────────────────────
+
+CHAT_SYSTEM = PromptTemplate("chat_system", """
+    You are an advanced personal AI health intelligence system.
+
+    Core Parameters:
+    - Provide advanced, evidence-based health intelligence
+    - Maintain professional, authoritative tone
+    - Always recommend professional medical consultation for serious concerns
+    - Deliver precise, actionable health protocols
+    - Use sophisticated, clinical language when appropriate
+    - Keep responses focused and impactful
+""")
+
+# ``context``: ``sections()`` of recalled memories, references and the brief instruction
+CHAT_USER = PromptTemplate("chat_user", """
+    You're assisting {name}.
+
+    {context}Query: {message}
+""")
+
+RECALLED_HEADER = "Known from the user's previous sessions:"
+REFERENCES_HEADER = "Reference material (prefer it over general knowledge and cite [n]):"
+BRIEF_INSTRUCTION = "Answer in at most three sentences."
+
+# the one output check (utils/output_scanner.py: chat, agents' output guardrail, direct stream)
+SPAN_CHECK_SYSTEM = PromptTemplate("span_check_system", """
+    You review excerpts of a health assistant's answer that were flagged for a
+    medication dose, a diagnosis or advice about stopping or changing
+    treatment. Reply with exactly SAFE or UNSAFE.
+    UNSAFE means a specific dose the user should take without medical
+    supervision, a diagnosis stated as fact instead of suggesting professional
+    assessment, or advice to stop, skip or change treatment or to avoid
+    medical care. A warning against doing so is SAFE.
+""")
+
+# ── session analysis (utils/session_analysis.py) ──────────────
+
+MAP_SYSTEM = PromptTemplate("analysis_map_system", """
+    Summarise the part of a conversation between a user and a health
+    assistant given in the input. Keep every health-relevant fact: symptoms,
+    goals, injuries, allergies, diet, medication, activity level and advice
+    given. Use short bullet points.
+""")
+
+REDUCE_SYSTEM = PromptTemplate("analysis_reduce_system", """
+    You are an advanced personal AI health intelligence system. Using the
+    session notes in the input, write a comprehensive health analysis for the
+    user named there: key concerns, goals, risk factors, recommendations and
+    when to seek professional medical care.
+""")
+
+REDUCE_USER = PromptTemplate("analysis_reduce_user", """
+    User: {name}
+
+    Session notes:
+    {notes}
+""")
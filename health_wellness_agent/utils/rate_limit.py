@@ -0,0 +1,300 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from utils import metrics
+
+# ──────────────────────────────────────────────────────────────
+# Process-wide model quota: requests and tokens per minute
+#
+# Every model call made through utils/model_gateway.py acquires one request
+# and an estimate of its tokens from two token buckets.  When the buckets are
+# empty, callers wait in per-user queues that are served round-robin, so a
+# user firing many requests (ANALYZE, long sessions, a batch job) only
+# delays their own calls, never everyone else's.  The estimate is settled
+# against the real size once the response is in.
+#
+# Calls are tagged with a lane.  Interactive calls (live chat) are granted
+# before any background call (ANALYZE, batch jobs), background calls must
+# leave RESERVE_FRACTION of each bucket untouched, and the number of
+# background calls in flight is capped by an AIMD controller that backs off
+# when interactive p95 latency exceeds HEALTH_INTERACTIVE_TARGET_SECONDS.
+#
+#   HEALTH_RPM / HEALTH_TPM        provider quota (0 disables a bucket)
+#   HEALTH_RATE_LIMIT_WORKERS      processes sharing that quota; each takes
+#                                  an equal share
+#   HEALTH_RATE_BURST_SECONDS      bucket size in seconds of quota (10), so
+#                                  no 60s window sees much more than the limit
+#
+# Works the same against the fake model (HEALTH_FAKE_MODEL=1), which is how
+# it is exercised offline (benchmarks/bench_rate_limit.py).
+# ──────────────────────────────────────────────────────────────
+
+WORKERS = max(1, int(os.getenv("HEALTH_RATE_LIMIT_WORKERS", "1")))
+RPM = float(os.getenv("HEALTH_RPM", "60")) / WORKERS
+TPM = float(os.getenv("HEALTH_TPM", "32000")) / WORKERS
+BURST_SECONDS = float(os.getenv("HEALTH_RATE_BURST_SECONDS", "10"))
+CHARS_PER_TOKEN = 4
+EXPECTED_OUTPUT_TOKENS = 400
+
+# priority lanes: interactive calls are always granted before background ones
+INTERACTIVE, BACKGROUND = "interactive", "background"
+LANES = (INTERACTIVE, BACKGROUND)
+RESERVE_FRACTION = 0.2  # of each bucket, kept free of background work
+INTERACTIVE_TARGET_SECONDS = float(os.getenv("HEALTH_INTERACTIVE_TARGET_SECONDS", "6"))
+MAX_BACKGROUND_INFLIGHT = int(os.getenv("HEALTH_BACKGROUND_MAX_INFLIGHT", "8"))
+THROTTLE_WINDOW = 20        # interactive latencies the p95 is taken over
+ADJUST_EVERY = 5            # interactive calls between throttle adjustments
+IDLE_RECOVERY_SECONDS = 30.0
+BLOCKED_POLL_SECONDS = 0.05
+MAX_DISPATCH_SLEEP = 0.25
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class TokenBucket:
+    """Refills ``per_minute / 60`` per second; a rate of 0 means unlimited."""
+
+    def __init__(self, per_minute: float, burst_seconds: float = BURST_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` can be taken (0 if it can be taken now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        # a request larger than the bucket only waits for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self._refill()
+            self.level -= amount  # may go negative: later callers pay the debt
+
+    def give_back(self, amount: float) -> None:
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class BackgroundThrottle:
+    """AIMD cap on background calls in flight, driven by interactive latency.
+
+    Every few interactive calls the p95 of recent interactive latency is
+    compared with the target: above it the cap is halved, below it the cap
+    grows by one.  With no interactive traffic for a while it grows again.
+    """
+
+    def __init__(self, target_seconds: float = INTERACTIVE_TARGET_SECONDS,
+                 max_inflight: int = MAX_BACKGROUND_INFLIGHT, clock: Callable[[], float] = time.monotonic):
+        self.target = target_seconds
+        self.max_inflight = max_inflight
+        self.limit = max_inflight
+        self.inflight = 0
+        self.clock = clock
+        self._recent: Deque[float] = deque(maxlen=THROTTLE_WINDOW)
+        self._since_adjust = 0
+        self._last_interactive = clock()
+
+    def allows(self) -> bool:
+        return self.inflight < self.limit
+
+    def observe_interactive(self, seconds: float) -> None:
+        self._recent.append(seconds)
+        self._last_interactive = self.clock()
+        self._since_adjust += 1
+        if self._since_adjust < ADJUST_EVERY:
+            return
+        self._since_adjust = 0
+        ordered = sorted(self._recent)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        if p95 > self.target:
+            self.limit = max(1, self.limit // 2)
+        else:
+            self.limit = min(self.max_inflight, self.limit + 1)
+        metrics.set_gauge("background_inflight_limit", self.limit)
+
+    def background_done(self) -> None:
+        self.inflight -= 1
+        if self.clock() - self._last_interactive > IDLE_RECOVERY_SECONDS and self.limit < self.max_inflight:
+            self.limit += 1
+            metrics.set_gauge("background_inflight_limit", self.limit)
+
+
+class Grant:
+    """Quota held by one model call; hand it back with ``release``."""
+    __slots__ = ("lane", "tokens", "started", "future", "granted")
+
+    def __init__(self, lane: str, tokens: float, future: Optional[asyncio.Future] = None):
+        self.lane = lane
+        self.tokens = tokens
+        self.started = time.monotonic()
+        self.future = future
+        self.granted = False
+
+
+class FairRateLimiter:
+    def __init__(self, rpm: float = RPM, tpm: float = TPM, clock: Callable[[], float] = time.monotonic,
+                 throttle: Optional[BackgroundThrottle] = None):
+        self.requests = TokenBucket(rpm, clock=clock)
+        self.tokens = TokenBucket(tpm, clock=clock)
+        self.throttle = throttle or BackgroundThrottle(clock=clock)
+        self._lock = threading.Lock()  # callers may live on different event loops
+        # per lane: user -> waiting grants, in round-robin order
+        self._lanes: Dict[str, "OrderedDict[str, Deque[Grant]]"] = {lane: OrderedDict() for lane in LANES}
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _wait_time(self, lane: str, tokens: float) -> float:
+        if lane == INTERACTIVE:
+            return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+        if not self.throttle.allows():
+            return BLOCKED_POLL_SECONDS
+        # background work leaves a reserve in both buckets for interactive calls
+        return max(
+            self.requests.wait_time(1 + self.requests.capacity * RESERVE_FRACTION),
+            self.tokens.wait_time(tokens + self.tokens.capacity * RESERVE_FRACTION),
+        )
+
+    def _take(self, grant: Grant) -> None:
+        self.requests.take(1)
+        self.tokens.take(grant.tokens)
+        grant.granted = True
+        if grant.lane == BACKGROUND:
+            self.throttle.inflight += 1
+
+    def _queued_ahead(self, lane: str) -> bool:
+        if lane == INTERACTIVE:
+            return bool(self._lanes[INTERACTIVE])
+        return any(self._lanes.values())
+
+    async def acquire(self, user: str, tokens: float, lane: str = INTERACTIVE) -> Grant:
+        """Wait for quota for one call of ``tokens`` in ``lane``."""
+        if lane not in LANES:
+            raise ValueError(f"unknown lane {lane!r}")
+        with self._lock:
+            if not self._queued_ahead(lane) and self._wait_time(lane, tokens) == 0:
+                grant = Grant(lane, tokens)
+                self._take(grant)
+                metrics.observe("rate_limit_queue_seconds", 0.0, lane=lane)
+                return grant
+            grant = Grant(lane, tokens, asyncio.get_running_loop().create_future())
+            self._lanes[lane].setdefault(user, deque()).append(grant)
+            self._ensure_dispatcher()
+            waiting = sum(len(q) for q in self._lanes[lane].values())
+        metrics.inc("rate_limit_throttled_total", lane=lane)
+        metrics.set_gauge("rate_limit_waiting", waiting, lane=lane)
+        try:
+            await grant.future
+        except asyncio.CancelledError:
+            self._remove(lane, user, grant)
+            raise
+        metrics.observe("rate_limit_queue_seconds", time.monotonic() - grant.started, lane=lane)
+        return grant
+
+    def release(self, grant: Grant, actual_tokens: float) -> None:
+        """Settle the token estimate and record the call's latency for its lane."""
+        seconds = time.monotonic() - grant.started
+        metrics.observe("model_call_seconds", seconds, lane=grant.lane)
+        with self._lock:
+            if actual_tokens > grant.tokens:
+                self.tokens.take(actual_tokens - grant.tokens)
+            else:
+                self.tokens.give_back(grant.tokens - actual_tokens)
+            if grant.lane == BACKGROUND:
+                self.throttle.background_done()
+            else:
+                self.throttle.observe_interactive(seconds)
+
+    def _remove(self, lane: str, user: str, grant: Grant) -> None:
+        with self._lock:
+            queue = self._lanes[lane].get(user)
+            if queue and grant in queue:
+                queue.remove(grant)
+                if not queue:
+                    del self._lanes[lane][user]
+            elif grant.granted:  # granted, but the call never ran: hand the quota back
+                self.requests.give_back(1)
+                self.tokens.give_back(grant.tokens)
+                if grant.lane == BACKGROUND:
+                    self.throttle.background_done()
+
+    def _ensure_dispatcher(self) -> None:
+        task = self._dispatcher
+        if task is None or task.done() or task.get_loop().is_closed():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    def _next(self) -> Tuple[Optional[Grant], float]:
+        """Grant the next waiter (interactive lane first), or say how long to wait."""
+        with self._lock:
+            for lane in LANES:
+                queues = self._lanes[lane]
+                while queues:
+                    user, queue = next(iter(queues.items()))
+                    grant = queue[0]
+                    if grant.future.done():  # cancelled while queued
+                        queue.popleft()
+                        if not queue:
+                            del queues[user]
+                        continue
+                    wait = self._wait_time(lane, grant.tokens)
+                    if wait > 0:
+                        return None, wait
+                    self._take(grant)
+                    queue.popleft()
+                    # rotate: this user goes to the back of the line
+                    del queues[user]
+                    if queue:
+                        queues[user] = queue
+                    return grant, 0.0
+            self._dispatcher = None  # the next acquire() starts a new one
+            return None, -1.0
+
+    async def _dispatch(self) -> None:
+        while True:
+            grant, wait = self._next()
+            if grant is not None:
+                loop = grant.future.get_loop()
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(_grant, grant.future)
+                continue
+            if wait < 0:
+                for lane in LANES:
+                    metrics.set_gauge("rate_limit_waiting", 0, lane=lane)
+                return
+            # wake up regularly: an interactive call may arrive behind a background wait
+            await asyncio.sleep(min(wait, MAX_DISPATCH_SLEEP))
+
+    def waiting(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {lane: {user: len(q) for user, q in queues.items()} for lane, queues in self._lanes.items()}
+
+
+def _grant(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+_limiter = FairRateLimiter()
+
+
+def get_rate_limiter() -> FairRateLimiter:
+    return _limiter
@@ -0,0 +1,304 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from utils import metrics
+
+# ──────────────────────────────────────────────────────────────
+# Per-rerun profiling for the Streamlit app (opt-in)
+#
+# main.py calls ``start_rerun()`` at the top of the script, ``mark(name)``
+# where each section begins (CSS, status bar, chat render, input, response,
+# action panel), ``section(name)`` around nested work such as model calls
+# and PDF export, and ``render()`` at the end.  Each section is timed in
+# wall-clock and script-thread CPU seconds; the difference is time spent
+# waiting (model calls run on the background loop).  A rerun cut short by
+# st.rerun()/st.stop() is closed at the start of the next one.
+#
+# main.py's fragments (status bar, conversation, action panel) rerun on their
+# own when their widgets change; their bodies run inside ``fragment()``, which
+# yields the script's profile during a full rerun and a profile of its own
+# (scope = the fragment's name, summarised in a caption under it) when only
+# the fragment reruns.
+#
+# Every rerun feeds the process-wide histograms rerun_seconds{outcome,scope},
+# rerun_cpu_seconds{scope} and rerun_section_seconds{section}, so /metrics and
+# the overlay show the distribution across all sessions.  With sampling on, a
+# daemon thread samples the script thread's stack every SAMPLE_INTERVAL
+# seconds; the report carries the folded stacks (flamegraph.pl /
+# speedscope input) and the overlay the hottest functions.
+#
+#   HEALTH_PROFILE=1 profiles every session, HEALTH_PROFILE=sample also
+#   samples; a session opts in alone with ?profile=1 or ?profile=sample.
+#   HEALTH_PROFILE_SAMPLE_MS   sampling interval (5)
+# ──────────────────────────────────────────────────────────────
+
+PROFILE = os.getenv("HEALTH_PROFILE", "0")
+SAMPLE_INTERVAL = float(os.getenv("HEALTH_PROFILE_SAMPLE_MS", "5")) / 1000
+MAX_STACK_DEPTH = 40
+KEEP_RERUNS = 50
+SESSION_KEY = "_rerun_profile"
+SCRIPT = "script"
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a daemon thread.
+
+    Only stacks running inside ``script`` (a file path) are kept, so time the
+    thread spends outside the script run is not counted.
+    """
+
+    def __init__(self, thread_id: int, script: str, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.script = script
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rerun-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names, in_script = [], False
+            while frame is not None:
+                code = frame.f_code
+                in_script = in_script or code.co_filename == self.script
+                if len(names) < MAX_STACK_DEPTH:
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if in_script and not self._stop.is_set():  # not the script waiting on stop()
+                self.stacks[";".join(reversed(names))] += 1
+
+
+class RerunProfile:
+    """Timings of one script run."""
+
+    enabled = True
+
+    def __init__(self, run: int, script: Optional[str] = None, scope: str = SCRIPT):
+        self.run = run
+        self.scope = scope
+        self.started_at = time.time()
+        self._start = self._last = time.perf_counter()
+        self._cpu_start = self._cpu_last = time.thread_time()
+        self.sections: List[dict] = []
+        self._current: Optional[dict] = None
+        self.outcome: Optional[str] = None
+        self.sampler = StackSampler(threading.get_ident(), script).start() if script else None
+        self.stacks: Dict[str, int] = {}
+
+    def _tick(self) -> None:
+        self._last, self._cpu_last = time.perf_counter(), time.thread_time()
+
+    def _close_current(self) -> None:
+        if self._current is not None:
+            self._current["seconds"] = self._last - self._current.pop("_start")
+            self._current["cpu"] = self._cpu_last - self._current.pop("_cpu")
+            self._current = None
+
+    def mark(self, name: str) -> None:
+        """End the running top-level section and start ``name``."""
+        self._tick()
+        self._close_current()
+        self._current = {"section": name, "_start": self._last, "_cpu": self._cpu_last}
+        self.sections.append(self._current)
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        """Time nested work (recorded as ``<top-level section>/name``)."""
+        parent = self._current["section"] if self._current else "script"
+        entry = {"section": f"{parent}/{name}"}
+        start, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self._tick()
+            entry["seconds"], entry["cpu"] = self._last - start, self._cpu_last - cpu
+            self.sections.append(entry)
+
+    def finish(self, outcome: str) -> dict:
+        """Close the rerun (at the end of the script, or at the next start if it was cut short)."""
+        if self.outcome is not None:
+            return self.report()
+        if outcome == "complete":
+            self._tick()
+        self._close_current()
+        self.outcome = outcome
+        if self.sampler is not None:
+            self.stacks = dict(self.sampler.stop())
+            self.sampler = None
+        total, cpu = self._last - self._start, self._cpu_last - self._cpu_start
+        metrics.observe("rerun_seconds", total, outcome=outcome, scope=self.scope)
+        metrics.observe("rerun_cpu_seconds", cpu, scope=self.scope)
+        for entry in self.sections:
+            metrics.observe("rerun_section_seconds", entry["seconds"], section=entry["section"])
+        return self.report()
+
+    def report(self) -> dict:
+        return {
+            "run": self.run,
+            "scope": self.scope,
+            "started_at": self.started_at,
+            "outcome": self.outcome,
+            "seconds": self._last - self._start,
+            "cpu": self._cpu_last - self._cpu_start,
+            "sections": [e for e in self.sections if "seconds" in e],
+            "stacks": self.stacks,
+        }
+
+
+class _NullProfile:
+    """Stands in when profiling is off; every call is a no-op."""
+
+    enabled = False
+
+    def mark(self, name: str) -> None:
+        pass
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        yield
+
+
+NULL_PROFILE = _NullProfile()
+
+
+def _requested(st) -> Optional[str]:
+    mode = PROFILE
+    try:
+        mode = st.query_params.get("profile", mode)
+    except Exception:  # outside a script run (tests, bare mode)
+        pass
+    return mode if mode in ("1", "sample") else None
+
+
+def _script_context():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    return get_script_run_ctx(suppress_warning=True)
+
+
+def _fragment_rerun() -> bool:
+    """True while only fragments rerun, not the whole script."""
+    ctx = _script_context()
+    return bool(ctx is not None and ctx.fragment_ids_this_run)
+
+
+def start_rerun(st, scope: str = SCRIPT):
+    """Profile of the rerun that is starting, or a no-op stand-in when profiling is off."""
+    mode = _requested(st)
+    state = st.session_state.get(SESSION_KEY)
+    if mode is None:
+        return NULL_PROFILE
+    if state is None:
+        state = st.session_state[SESSION_KEY] = {"runs": 0, "current": None, "history": deque(maxlen=KEEP_RERUNS)}
+    if state["current"] is not None:
+        state["history"].append(state["current"].finish("interrupted"))  # st.rerun()/st.stop()
+    state["runs"] += 1
+    script = None
+    if mode == "sample":
+        ctx = _script_context()
+        script = ctx.main_script_path if ctx is not None else sys._getframe(1).f_code.co_filename
+    state["current"] = RerunProfile(state["runs"], script, scope)
+    return state["current"]
+
+
+@contextmanager
+def fragment(st, name: str, profile) -> Iterator:
+    """Profile a fragment body: part of ``profile`` during a full rerun, a rerun of its own otherwise.
+
+    A fragment rerun is finished when the body returns and summarised in a
+    caption at the bottom of the fragment; the overlay of the next full
+    rerun lists it with the others.
+    """
+    if not _fragment_rerun():
+        yield profile
+        return
+    own = start_rerun(st, scope=name)
+    yield own
+    if own.enabled:
+        state = st.session_state[SESSION_KEY]
+        report = own.finish("complete")
+        state["history"].append(report)
+        state["current"] = None
+        st.caption(f"⏱ {name} rerun {report['run']}: {report['seconds'] * 1000:.0f}ms wall, "
+                   f"{report['cpu'] * 1000:.1f}ms CPU")
+
+
+def _bar(value: int, largest: int, width: int = 24) -> str:
+    return "█" * max(1 if value else 0, round(width * value / largest)) if largest else ""
+
+
+def rerun_histogram(outcome: str = "complete", scope: str = SCRIPT) -> List[str]:
+    """Text histogram of rerun times across all sessions of this process."""
+    buckets = metrics.histogram_buckets("rerun_seconds", outcome=outcome, scope=scope)
+    largest = max((count for _, count in buckets), default=0)
+    lines, lower = [], 0.0
+    for bound, count in buckets:
+        if count:
+            label = f"> {lower * 1000:.0f}ms" if bound == float("inf") else f"≤ {bound * 1000:.0f}ms"
+            lines.append(f"{label:>9} {_bar(count, largest)} {count}")
+        lower = bound
+    return lines
+
+
+def render(st, profile) -> None:
+    """Finish the rerun and show the overlay with a downloadable report."""
+    if not profile.enabled:
+        return
+    state = st.session_state[SESSION_KEY]
+    report = profile.finish("complete")
+    state["history"].append(report)
+    state["current"] = None
+
+    rows = [f"rerun {report['run']}: {report['seconds'] * 1000:.0f}ms wall, {report['cpu'] * 1000:.0f}ms CPU"]
+    for entry in report["sections"]:
+        p95 = metrics.percentile("rerun_section_seconds", 95, section=entry["section"])
+        rows.append(f"  {entry['section']:<28} {entry['seconds'] * 1000:7.1f}ms"
+                    f"  cpu {entry['cpu'] * 1000:6.1f}ms  p95 {p95 * 1000:7.1f}ms")
+    if report["stacks"]:
+        leaves = Counter()
+        for stack, count in report["stacks"].items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values())
+        rows.append("hottest functions (samples):")
+        rows += [f"  {name:<40} {count * 100 / total:5.1f}%" for name, count in leaves.most_common(5)]
+    by_scope: Dict[str, List[dict]] = {}
+    for past in state["history"]:
+        by_scope.setdefault(past["scope"], []).append(past)
+    if len(by_scope) > 1:
+        rows.append("reruns this session (mean):")
+        for scope, reports in by_scope.items():
+            rows.append(f"  {scope:<16} {len(reports):4d} x  {sum(r['seconds'] for r in reports) / len(reports) * 1000:7.1f}ms"
+                        f"  cpu {sum(r['cpu'] for r in reports) / len(reports) * 1000:6.1f}ms")
+    rows.append("rerun time, all sessions:")
+    rows += rerun_histogram()
+
+    with st.expander(f"⏱ rerun {report['run']}: {report['seconds'] * 1000:.0f}ms", expanded=False):
+        st.code("\n".join(rows), language=None)
+        st.download_button(
+            "download profile report",
+            data=json.dumps({
+                "reruns": list(state["history"]),
+                "aggregate": {k: v for k, v in metrics.snapshot()["histograms"].items() if k.startswith("rerun_")},
+            }, indent=1),
+            file_name=f"rerun_profile_{int(report['started_at'])}.json",
+            mime="application/json",
+            key="rerun_profile_download",
+        )
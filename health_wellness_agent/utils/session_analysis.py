@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from utils import model_gateway, token_usage
+from utils.model_router import FAST, STRONG
+from utils.prompts import MAP_SYSTEM, REDUCE_SYSTEM, REDUCE_USER
+from utils.rate_limit import BACKGROUND
+
+# ──────────────────────────────────────────────────────────────
+# Map-reduce analysis of a chat session (used by the ANALYZE button)
+#
+#   map    : fixed-size chunks of the history are summarised concurrently
+#   reduce : the chunk summaries are merged into one streamed report
+#
+# All calls use the background lane, so live chat messages are served first.
+# Chunk summaries go to the fast model, the report to the strong one.
+# Instructions are static system instructions (utils/prompts.py), so every
+# chunk summary shares one cacheable prefix.
+#
+# Chunks are aligned on message index, so once a chunk is full its text never
+# changes and its summary can be cached.  Re-running ANALYZE therefore only
+# summarises the chunks that received new messages.
+#
+# Tokens are charged to the session as ``analysis`` (utils/token_usage.py).
+# Near the session's token budget the report is written by the fast model;
+# over it, no analysis is run.
+# ──────────────────────────────────────────────────────────────
+
+CHUNK_MESSAGES = 8          # messages per map chunk
+MAX_CHUNK_CHARS = 6000      # hard cap on the text sent for one chunk
+MAX_PARALLEL_SUMMARIES = 4  # bounded parallelism for the map stage
+
+# only real conversation turns are analysed, never earlier reports
+ANALYSED_ROLES = ("user", "assistant")
+
+OVER_BUDGET_MESSAGE = (
+    "This session has used its token budget, so no new analysis can be run. "
+    "Start a new session, or come back tomorrow."
+)
+
+Message = Tuple[str, str]
+StreamCallback = Callable[[str], None]
+
+
+def _chunk_key(chunk: Sequence[Message]) -> str:
+    digest = hashlib.sha1()
+    for role, msg in chunk:
+        digest.update(role.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(msg.encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+def chunk_history(chat: Sequence[Message], size: int = CHUNK_MESSAGES) -> List[List[Message]]:
+    """Split the analysable part of the chat into index-aligned chunks."""
+    turns = [(role, msg) for role, msg in chat if role in ANALYSED_ROLES]
+    return [turns[i:i + size] for i in range(0, len(turns), size)]
+
+
+def _transcript(chunk: Sequence[Message]) -> str:
+    lines = [f"{'User' if role == 'user' else 'Assistant'}: {msg}" for role, msg in chunk]
+    text = "\n".join(lines)
+    if len(text) > MAX_CHUNK_CHARS:
+        text = text[:MAX_CHUNK_CHARS] + "\n[...truncated]"
+    return text
+
+
+async def _generate_text(model, system: str, prompt: str, user: str) -> str:
+    try:
+        return (await model_gateway.generate(
+            prompt, system=system, model=model, user=user, lane=BACKGROUND, tier=FAST
+        )).strip()
+    except Exception:
+        # the raw transcript is used in place of a missing summary
+        return ""
+
+
+async def _stream_text(model, system: str, prompt: str, on_text: Optional[StreamCallback], user: str,
+                       tier: str = STRONG) -> str:
+    """Stream a generation, reporting the text accumulated so far."""
+    text = ""
+    async for piece in model_gateway.stream(prompt, system=system, model=model, user=user, lane=BACKGROUND, tier=tier):
+        text += piece
+        if on_text:
+            on_text(text)
+    return text.strip()
+
+
+async def summarize_chunks(
+    model,
+    chunks: Sequence[Sequence[Message]],
+    cache: Dict[str, str],
+    *,
+    max_parallel: int = MAX_PARALLEL_SUMMARIES,
+    user: str = "anonymous",
+) -> List[str]:
+    """Map stage: summarise every chunk not already in ``cache``."""
+    semaphore = asyncio.Semaphore(max_parallel)
+    keys = [_chunk_key(chunk) for chunk in chunks]
+
+    async def _summarise(key: str, chunk: Sequence[Message]) -> None:
+        async with semaphore:
+            summary = await _generate_text(model, MAP_SYSTEM.render(), _transcript(chunk), user)
+        # a failed/empty summary is not cached so the next run retries it
+        if summary:
+            cache[key] = summary
+
+    pending = {}
+    for key, chunk in zip(keys, chunks):
+        if key not in cache and key not in pending:
+            pending[key] = chunk
+    await asyncio.gather(*(_summarise(key, chunk) for key, chunk in pending.items()))
+
+    # drop summaries of chunks that have since grown (no longer reachable)
+    for stale in set(cache) - set(keys):
+        del cache[stale]
+
+    return [cache.get(key) or _transcript(chunk) for key, chunk in zip(keys, chunks)]
+
+
+async def analyze_session(
+    model,
+    chat: Sequence[Message],
+    cache: Dict[str, str],
+    *,
+    name: str = "User",
+    session_id: str = "",
+    user_id: str = "",
+    on_text: Optional[StreamCallback] = None,
+) -> str:
+    """Run the full map-reduce analysis and return the final report.
+
+    ``cache`` maps chunk hashes to summaries and should live as long as the
+    session (e.g. in ``st.session_state``).  ``on_text`` is called with the
+    report text accumulated so far while the reduce step streams.
+    """
+    chunks = chunk_history(chat)
+    if not chunks:
+        return "No conversation to analyse yet."
+
+    user_id = user_id or session_id
+    with token_usage.attribute(session=session_id, user=user_id, kind="analysis"):
+        budget = token_usage.budget_action()
+        if budget == token_usage.REFUSE:
+            return OVER_BUDGET_MESSAGE
+        summaries = await summarize_chunks(model, chunks, cache, user=user_id)
+        notes = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(summaries))
+        return await _stream_text(model, REDUCE_SYSTEM.render(), REDUCE_USER.render(name=name, notes=notes), on_text,
+                                  user_id, FAST if budget == token_usage.SUMMARIZE else STRONG)
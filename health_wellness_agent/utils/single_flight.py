@@ -0,0 +1,114 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from utils import metrics
+
+# ──────────────────────────────────────────────────────────────
+# Single-flight execution with optional idempotent replay
+#
+# Concurrent calls with the same key share one execution: the first caller
+# runs it, the others wait for its result.  With ``remember`` seconds the
+# result is also kept after completion, so a retry carrying the same
+# idempotency key (a Streamlit rerun of the same chat turn, a client
+# re-sending a request) gets the stored answer instead of a new generation.
+# Failures are shared with waiting callers but never remembered.  A caller
+# may pass a ``fingerprint`` of its request (a body hash): the key then
+# belongs to that request, and reusing it for another one raises KeyReused
+# instead of replaying an answer to a different question.
+#
+# Callers may sit on different event loops (Streamlit's background loop, the
+# API loop), so the shared result is a concurrent.futures.Future.
+# ──────────────────────────────────────────────────────────────
+
+MAX_REMEMBERED = 4096
+
+
+class KeyReused(ValueError):
+    """The key is running or remembered for a request with another fingerprint."""
+
+
+class SingleFlight:
+    def __init__(self, max_remembered: int = MAX_REMEMBERED):
+        self.max_remembered = max_remembered
+        self._lock = threading.Lock()
+        # key -> (shared result, fingerprint)
+        self._inflight: "dict[str, Tuple[concurrent.futures.Future, Optional[str]]]" = {}
+        # key -> (expires, fingerprint, result)
+        self._done: "OrderedDict[str, Tuple[float, Optional[str], Any]]" = OrderedDict()
+
+    def _remembered(self, key: str, fingerprint: Optional[str]) -> Tuple[bool, Any]:
+        entry = self._done.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] < time.monotonic():
+            del self._done[key]
+            return False, None
+        if entry[1] != fingerprint:
+            raise KeyReused(key)
+        return True, entry[2]
+
+    def _remember(self, key: str, fingerprint: Optional[str], result: Any, seconds: float) -> None:
+        self._done[key] = (time.monotonic() + seconds, fingerprint, result)
+        self._done.move_to_end(key)
+        while len(self._done) > self.max_remembered:
+            self._done.popitem(last=False)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], *, remember: float = 0.0,
+                 fingerprint: Optional[str] = None) -> Any:
+        """Run ``fn()`` once for all concurrent callers with ``key`` (and ``fingerprint``)."""
+        while True:
+            with self._lock:
+                found, result = self._remembered(key, fingerprint)
+                if found:
+                    metrics.inc("single_flight_total", outcome="replayed")
+                    return result
+                shared, running = self._inflight.get(key, (None, None))
+                leader = shared is None
+                if leader:
+                    shared = concurrent.futures.Future()
+                    self._inflight[key] = (shared, fingerprint)
+                elif running != fingerprint:
+                    raise KeyReused(key)
+
+            if not leader:
+                metrics.inc("single_flight_total", outcome="joined")
+                try:
+                    # shielded: a waiter giving up must not cancel the shared run
+                    return await asyncio.shield(asyncio.wrap_future(shared))
+                except asyncio.CancelledError:
+                    if shared.cancelled() and not asyncio.current_task().cancelling():
+                        continue  # the leader was cancelled, not us: run it ourselves
+                    raise
+
+            metrics.inc("single_flight_total", outcome="leader")
+            try:
+                result = await fn()
+            except BaseException as e:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                if isinstance(e, asyncio.CancelledError):
+                    shared.cancel()
+                else:
+                    shared.set_exception(e)
+                raise
+            with self._lock:
+                self._inflight.pop(key, None)
+                if remember > 0:
+                    self._remember(key, fingerprint, result, remember)
+            shared.set_result(result)
+            return result
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            self._done.pop(key, None)
+
+
+_flights = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    return _flights
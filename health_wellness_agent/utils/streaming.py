@@ -1,17 +1,16 @@
-import os
-import asyncio
 import textwrap
-import google.generativeai as genai
+import threading
 from dotenv import load_dotenv
 
-load_dotenv()
+from utils import token_usage
+from utils.async_runner import get_background_loop
+from utils.health import get_health_monitor
+from utils.model_gateway import generate, stream
+from utils.model_router import classify_query
+from utils.output_scanner import HALTED_MESSAGE, StreamingOutputScanner, passes_review
 
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("❌ GEMINI_API_KEY not found in environment variables")
+load_dotenv()
 
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel("gemini-pro")
 
 async def stream_agent_response(user_input: str, *, placeholder=None) -> str:
     if not user_input or not user_input.strip():
@@ -23,12 +22,21 @@ async def stream_agent_response(user_input: str, *, placeholder=None) -> str:
         return err
 
     try:
-        def _generate():
-            return model.generate_content(user_input.strip())
-
-        response = await asyncio.to_thread(_generate)
+        scanner = StreamingOutputScanner()
+        stop = threading.Event()
+        with token_usage.attribute(kind="direct"):
+            chunks = stream(user_input.strip(), stop=stop, tier=classify_query(user_input))
+        async for chunk in chunks:
+            if scanner.feed(chunk).halted:
+                stop.set()
+                break
+            if placeholder:
+                placeholder.markdown(textwrap.dedent(scanner.text))
+            else:
+                print(chunk, end="", flush=True)
+        scan = scanner.close()
 
-        if not response or not hasattr(response, 'text'):
+        if not scanner.text.strip() and not scan.halted:
             err = "❌ No valid response from Gemini API"
             if placeholder:
                 placeholder.error(err)
@@ -36,12 +44,15 @@ async def stream_agent_response(user_input: str, *, placeholder=None) -> str:
                 print(err)
             return err
 
-        text = response.text.strip()
+        text = scanner.text.strip()
+        scan.halted = not await passes_review(scan)
+        if scan.halted:
+            text = HALTED_MESSAGE
 
         if placeholder:
             placeholder.markdown(textwrap.dedent(text))
         else:
-            print(text)
+            print("\n" + text if scan.halted else "")
 
         return text
 
@@ -53,20 +64,30 @@ async def stream_agent_response(user_input: str, *, placeholder=None) -> str:
             print(err)
         return err
 
+async def _direct(prompt: str) -> str:
+    with token_usage.attribute(kind="direct"):
+        return await generate(prompt, tier=classify_query(prompt))
+
+
 def get_gemini_response(prompt: str) -> str:
+    """One generation through the gateway (quota, routing, usage), from sync code."""
     try:
-        response = model.generate_content(prompt)
-        if not response or not hasattr(response, 'text'):
+        text = get_background_loop().run(_direct(prompt))
+        if not text:
             return "❌ No valid response from Gemini API"
-        return response.text
+        return text
     except Exception as e:
-        # Debug print for error details
-        st.error(f"Gemini API error details: {e}")
         return f"❌ Gemini API error: {e}"
 
 def test_gemini_connection():
-    try:
-        response = model.generate_content("Hello, just testing Gemini connection.")
-        return True, "✅ Connection successful"
-    except Exception as e:
-        return False, f"❌ Connection failed: {str(e)}"
\ No newline at end of file
+    """Connection state from the background health probes (utils/health.py).
+
+    Never generates: the first call starts warm-up and reports "starting".
+    """
+    status = get_health_monitor().start().status()
+    failing = [p["provider"] + ": " + p["error"] for p in status["providers"] if not p["ok"]]
+    if status["ready"]:
+        return True, f"✅ Connection {status['status']}" + (f" ({'; '.join(failing)})" if failing else "")
+    if status["status"] == "starting":
+        return False, "⏳ Connecting..."
+    return False, f"❌ Connection failed: {'; '.join(failing) or 'no model provider configured'}"
@@ -0,0 +1,326 @@
+"""Token accounting per session, user and day, with budgets.
+
+Every model response's token counts (prompt, completion, cached prompt) are
+recorded with who spent them:
+
+    session, user   from ``attribute()`` scopes opened by the chat service,
+                    the planner and the session analysis (context variables,
+                    so tasks started inside a scope inherit it); ``user`` is
+                    the stable user id (the app's ``uid``, the API's
+                    ``caller:user``), never the display name, which anyone
+                    can change to start a fresh daily budget
+    kind            chat, span_check (every output check, the agents'
+                    output guardrail included), analysis, agent:<name>,
+                    input_guardrail, direct
+    model           the provider (``gemini:gemini-pro``) or agent model
+
+Counts come from the provider's response (Gemini ``usage_metadata``, Groq and
+agents SDK ``usage``); when a provider reports none (a stream cut short, a
+replayed cassette without usage) they are estimated from the text like the
+rate limiter does, and the call is counted as estimated.
+
+State is an append-only JSONL journal under DATA_DIR/usage shared by every
+process (app, API, batch runner; utils/journal.py).  Each line holds counts
+for one (day, user, session, kind, model) row.  A process appends under the
+journal's lock after reading what the others appended, and reads their new
+lines before every query, so budgets count all processes' spending.
+Compaction merges the lines of a row under the same lock, so the journal
+grows with the number of rows, not calls, and no process's lines are lost.
+
+Budgets (0 = none), checked before a turn with ``budget_action()``:
+
+    HEALTH_SESSION_TOKEN_BUDGET      tokens per session
+    HEALTH_USER_DAILY_TOKEN_BUDGET   tokens per user per (UTC) day
+    HEALTH_TOKEN_SUMMARIZE_AT        fraction of a budget (0.8) past which
+                                     turns ask for summary-length answers on
+                                     the fast model; past the budget turns
+                                     are answered locally
+
+Capacity planning export (from the health_wellness_agent directory), also
+served as GET /v1/usage by api.py:
+
+    python -m utils.token_usage report [--by day,user]
+    python -m utils.token_usage export [--by day,user,session,kind,model] > usage.csv
+"""
+import contextvars
+import csv
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from utils import metrics
+from utils.journal import Journal
+from utils.rate_limit import estimate_tokens
+
+SESSION_BUDGET = int(os.getenv("HEALTH_SESSION_TOKEN_BUDGET", "0"))
+USER_DAILY_BUDGET = int(os.getenv("HEALTH_USER_DAILY_TOKEN_BUDGET", "0"))
+SUMMARIZE_AT = float(os.getenv("HEALTH_TOKEN_SUMMARIZE_AT", "0.8"))
+COMPACT_AFTER = 5000  # journal lines before rows are merged
+
+OK, SUMMARIZE, REFUSE = "ok", "summarize", "refuse"
+ROW_FIELDS = ("day", "user", "session", "kind", "model")
+
+Row = Tuple[str, str, str, str, str]
+
+
+@dataclass
+class Tokens:
+    """Token counts of one model response."""
+    prompt: int = 0
+    completion: int = 0
+    cached: int = 0          # part of ``prompt`` served from the provider's cache
+    estimated: bool = False
+
+    @property
+    def total(self) -> int:
+        return self.prompt + self.completion
+
+
+@dataclass
+class Totals:
+    calls: int = 0
+    prompt: int = 0
+    completion: int = 0
+    cached: int = 0
+    estimated: int = 0       # calls whose counts were estimated
+
+    @property
+    def total(self) -> int:
+        return self.prompt + self.completion
+
+    def add(self, other: "Totals") -> None:
+        self.calls += other.calls
+        self.prompt += other.prompt
+        self.completion += other.completion
+        self.cached += other.cached
+        self.estimated += other.estimated
+
+
+TOTAL_FIELDS = tuple(f.name for f in fields(Totals))
+
+
+def _count(value) -> int:
+    return int(value or 0)
+
+
+def _from_usage(usage) -> Optional[Tokens]:
+    if isinstance(usage, dict):  # replayed from a cassette
+        return Tokens(**usage)
+    if usage is not None and getattr(usage, "input_tokens", None) is not None:  # agents SDK
+        details = getattr(usage, "input_tokens_details", None)
+        return Tokens(_count(usage.input_tokens), _count(usage.output_tokens),
+                      _count(getattr(details, "cached_tokens", 0)))
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:  # Groq / OpenAI chat
+        details = getattr(usage, "prompt_tokens_details", None)
+        return Tokens(_count(usage.prompt_tokens), _count(usage.completion_tokens),
+                      _count(getattr(details, "cached_tokens", 0)))
+    return None
+
+
+def usage_of(response) -> Optional[Tokens]:
+    """Token counts reported with a model response or stream chunk, if any."""
+    meta = getattr(response, "usage_metadata", None)  # Gemini
+    if meta is not None and getattr(meta, "prompt_token_count", None) is not None:
+        return Tokens(_count(meta.prompt_token_count), _count(getattr(meta, "candidates_token_count", 0)),
+                      _count(getattr(meta, "cached_content_token_count", 0)))
+    return _from_usage(getattr(response, "usage", None))
+
+
+def estimate(prompt: str, completion: str) -> Tokens:
+    return Tokens(estimate_tokens(prompt), estimate_tokens(completion) if completion else 0, estimated=True)
+
+
+def today(at: Optional[float] = None) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(time.time() if at is None else at))
+
+
+class UsageStore:
+    def __init__(self, journal_path: str):
+        self.journal_path = journal_path
+        self._journal = Journal(journal_path)
+        self._lock = threading.Lock()
+        self._rows: Dict[Row, Totals] = {}
+        self._by_session: Dict[str, Totals] = {}
+        self._by_user_day: Dict[Tuple[str, str], Totals] = {}
+        self._lines = 0
+        with self._lock:
+            self._sync()
+
+    # ── persistence ───────────────────────────────────────────
+    def _sync(self) -> None:
+        """Apply lines appended by any process since the last sync (under ``_lock``)."""
+        reset, entries = self._journal.read_new()
+        if reset:  # compacted by another process: the new journal holds everything
+            self._rows, self._by_session, self._by_user_day, self._lines = {}, {}, {}, 0
+        for entry in entries:
+            self._apply(tuple(entry[k] for k in ROW_FIELDS), Totals(**{k: entry[k] for k in TOTAL_FIELDS}))
+        self._lines += len(entries)
+
+    def _apply(self, row: Row, totals: Totals) -> None:
+        day, user, session = row[0], row[1], row[2]
+        self._rows.setdefault(row, Totals()).add(totals)
+        self._by_session.setdefault(session, Totals()).add(totals)
+        self._by_user_day.setdefault((user, day), Totals()).add(totals)
+
+    def _compact(self) -> None:
+        """Merge each row's lines; under the journal lock, right after ``_sync``."""
+        self._journal.rewrite({**dict(zip(ROW_FIELDS, row)), **asdict(totals)} for row, totals in self._rows.items())
+        self._lines = len(self._rows)
+
+    # ── recording ─────────────────────────────────────────────
+    def record(self, tokens: Tokens, *, session: str, user: str, kind: str, model: str,
+               at: Optional[float] = None) -> None:
+        row = (today(at), user, session, kind, model)
+        totals = Totals(1, tokens.prompt, tokens.completion, tokens.cached, int(tokens.estimated))
+        with self._lock, self._journal.locked():
+            self._sync()
+            self._journal.append({**dict(zip(ROW_FIELDS, row)), **asdict(totals)})
+            self._apply(row, totals)
+            self._lines += 1
+            if self._lines >= COMPACT_AFTER and self._lines >= 2 * len(self._rows):
+                self._compact()
+
+    # ── queries ───────────────────────────────────────────────
+    def session_totals(self, session: str) -> Totals:
+        with self._lock:
+            self._sync()
+            totals = Totals()
+            totals.add(self._by_session.get(session, Totals()))
+            return totals
+
+    def user_day_totals(self, user: str, day: Optional[str] = None) -> Totals:
+        with self._lock:
+            self._sync()
+            totals = Totals()
+            totals.add(self._by_user_day.get((user, day or today()), Totals()))
+            return totals
+
+    def report(self, by: Sequence[str] = ("day",)) -> List[dict]:
+        """Totals grouped by ``by`` (any of day, user, session, kind, model), largest first."""
+        unknown = set(by) - set(ROW_FIELDS)
+        if unknown:
+            raise ValueError(f"cannot group by {sorted(unknown)}, expected some of {ROW_FIELDS}")
+        groups: Dict[tuple, Totals] = {}
+        with self._lock:
+            self._sync()
+            for row, totals in self._rows.items():
+                values = dict(zip(ROW_FIELDS, row))
+                groups.setdefault(tuple(values[k] for k in by), Totals()).add(totals)
+        rows = [{**dict(zip(by, key)), **asdict(totals), "total": totals.total} for key, totals in groups.items()]
+        return sorted(rows, key=lambda r: -r["total"])
+
+
+_store: Optional[UsageStore] = None
+_store_lock = threading.Lock()
+
+
+def get_usage_store() -> UsageStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            from utils.paths import data_path
+            _store = UsageStore(data_path("usage", "journal.jsonl"))
+        return _store
+
+
+# ── attribution ────────────────────────────────────────────────
+
+_scope: "contextvars.ContextVar[Dict[str, str]]" = contextvars.ContextVar("health_usage_scope", default={})
+
+
+@contextmanager
+def attribute(*, session: Optional[str] = None, user: Optional[str] = None,
+              kind: Optional[str] = None) -> Iterator[None]:
+    """Charge model calls made inside the block to ``session``/``user`` as ``kind``.
+
+    Unset arguments keep the enclosing scope's values.
+    """
+    scope = dict(_scope.get())
+    scope.update({k: v for k, v in (("session", session), ("user", user), ("kind", kind)) if v})
+    token = _scope.set(scope)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_scope() -> Dict[str, str]:
+    """The scope in effect, for work that records later in another context (streams)."""
+    return _scope.get()
+
+
+def record(tokens: Tokens, *, model: str, user: Optional[str] = None, kind: Optional[str] = None,
+           scope: Optional[Dict[str, str]] = None) -> None:
+    """Charge ``tokens`` to ``scope`` (default: the current one); ``user`` and ``kind`` fill in what it lacks."""
+    scope = _scope.get() if scope is None else scope
+    user = scope.get("user") or user or "anonymous"
+    kind = kind or scope.get("kind") or "other"
+    for part, count in (("prompt", tokens.prompt), ("completion", tokens.completion), ("cached", tokens.cached)):
+        if count:
+            metrics.inc("model_tokens_total", count, kind=kind.partition(":")[0], type=part)
+    if tokens.estimated:
+        metrics.inc("model_tokens_estimated_calls_total", kind=kind.partition(":")[0])
+    try:
+        get_usage_store().record(tokens, session=scope.get("session", ""), user=user, kind=kind, model=model)
+    except OSError:
+        pass  # accounting is best-effort; never fail a model call on it
+
+
+def record_run(result, *, kind: str) -> None:
+    """Record an agents SDK run (all its model calls) that ran without the turn hooks."""
+    tokens = _from_usage(getattr(getattr(result, "context_wrapper", None), "usage", None))
+    if tokens is not None and tokens.total:
+        record(tokens, model=str(getattr(result.last_agent, "model", None) or "agents"), kind=kind)
+
+
+# ── budgets ────────────────────────────────────────────────────
+
+def budget_action(session: Optional[str] = None, user: Optional[str] = None) -> str:
+    """``ok``, ``summarize`` (near a budget) or ``refuse`` (over one) for the next turn.
+
+    ``session`` and ``user`` default to the current ``attribute()`` scope's.
+    """
+    if not SESSION_BUDGET and not USER_DAILY_BUDGET:
+        return OK
+    scope = _scope.get()
+    session, user = session or scope.get("session"), user or scope.get("user")
+    store = get_usage_store()
+    used = max(
+        store.session_totals(session).total / SESSION_BUDGET if SESSION_BUDGET and session else 0.0,
+        store.user_day_totals(user).total / USER_DAILY_BUDGET if USER_DAILY_BUDGET and user else 0.0,
+    )
+    action = REFUSE if used >= 1.0 else SUMMARIZE if used >= SUMMARIZE_AT else OK
+    if action != OK:
+        metrics.inc("token_budget_actions_total", action=action)
+    return action
+
+
+def write_csv(rows: List[dict], by: Sequence[str], out) -> None:
+    """Write ``report(by)`` rows as CSV to the text file ``out``."""
+    writer = csv.DictWriter(out, fieldnames=[*by, *TOTAL_FIELDS, "total"])
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def _main(argv: List[str]) -> None:
+    command = argv[0] if argv else "report"
+    by = ("day",)
+    if "--by" in argv[1:-1]:
+        by = tuple(filter(None, argv[argv.index("--by") + 1].split(",")))
+    if command == "report":
+        for row in get_usage_store().report(by):
+            key = "  ".join(str(row[k]) for k in by)
+            print(f"{key:<40} {row['total']:>10} tokens  ({row['prompt']} prompt, {row['completion']} completion, "
+                  f"{row['cached']} cached)  {row['calls']} calls" + (f", {row['estimated']} estimated" if row["estimated"] else ""))
+    elif command == "export":
+        write_csv(get_usage_store().report(by), by, sys.stdout)
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])